@@ -1,81 +1,185 @@
-from maeri.compiler.assembler import opcodes
-from maeri.compiler.assembler.opcodes import Opcodes, ConfigureStates
+from maeri.compiler.assembler.opcodes import Opcodes, Reset, ConfigureStates
 from maeri.compiler.assembler.opcodes import ConfigureWeights, LoadFeatures
 from maeri.compiler.assembler.opcodes import StoreFeatures, Run, Debug
-from maeri.compiler.assembler.opcodes import ConfigureCollectors
-from maeri.compiler.assembler.signs import to_unsigned
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
 
-valid_ops = {ConfigureStates, ConfigureWeights, LoadFeatures, 
-            StoreFeatures, Run, Debug, ConfigureCollectors}
+import numpy as np
+
+valid_ops = [ConfigureStates, ConfigureWeights, ConfigureCollectors, ConfigureRelus,
+            LoadFeatures, StoreFeatures, Run, Debug]
+kind_v_type = {op_type : kind for kind, op_type in enumerate(valid_ops)}
+
+config_ops = [ConfigureStates, ConfigureWeights, ConfigureCollectors, ConfigureRelus]
 
 DEBUG = False
 
-def assemble(list_of_ops, as_bytes=False):
-    instr_mem = []
-    instr_mem_size = 128
-
-    config_mem = []
-    config_mem_size = 128
-
-    final_mem = []
-
-    program_counter = 0
-    config_counter = 0
-    config_offset = instr_mem_size
-
-    if opcodes.bytes_in_address != 3:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING 3 BYTE ADDRESSES")
-    if opcodes.num_nodes != 63:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING TREES OF DEPTH 6")
-    if opcodes.INPUT_WIDTH != 8:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING WIDTHS OF 8")
-    if opcodes.num_ports != 16:
-        raise RuntimeError("CURRENTLY ONLY SUPPORTING TREES WITH 16 PORTS")
-
-    for op in list_of_ops:
-        assert(type(op) in valid_ops)
-
-        if type(op) in {ConfigureStates}:
-            instr_mem += [opcodes.ConfigureStates.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
-
-            config_mem += [int(conf) for conf in op.states] + [0]
-            config_offset += 64//4
-
-        if type(op) in {ConfigureWeights}:
-            instr_mem += [opcodes.ConfigureWeights.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
-
-            weights = [0,0,0] + [int(conf) for conf in op.weights] + [0]
-            weights = [to_unsigned(weight, opcodes.INPUT_WIDTH) for weight in weights]
-            config_mem += weights
-            config_offset += 36//4
-
-        if type(op) in {ConfigureCollectors}:
-            instr_mem += [opcodes.ConfigureCollectors.op]
-            address = list(int(config_offset).to_bytes(3, 'little'))
-            instr_mem += address
-
-            config_mem += [int(conf) for conf in op.states] + [0]
-            config_offset += 16//4
-        
-        if type(op) in {Debug}:
-            instr_mem += [opcodes.Debug.op]
-    
-    instr_mem += [opcodes.Reset.op]
-    instr_mem += (4*instr_mem_size - len(instr_mem))*[0]
-
-    config_mem += (4*config_mem_size - len(config_mem))*[0]
-
-    combined_mem = instr_mem + config_mem
+def align(size, alignment):
+    return -(-size//alignment)*alignment
+
+def kinds(list_of_ops):
+    """
+    Index of the type of every op in ``valid_ops``.
+    """
+    kind = np.array([kind_v_type.get(type(op), -1) for op in list_of_ops], dtype=np.int64)
+    assert((kind >= 0).all())
+    return kind
+
+def check(values, low, high, name):
+    values = np.asarray(values, dtype=np.int64)
+    bad = (values < low) | (values > high)
+    if bad.any():
+        raise RuntimeError(f"{name} of {values[bad][0]} does not fit in " +\
+            f"[{low}, {high}].")
+    return values
+
+def place(image, starts, values):
+    """
+    Writes row ``n`` of ``values`` to ``image`` from byte
+    ``starts[n]`` on.
+    """
+    values = np.asarray(values).reshape(len(starts), -1)
+    columns = np.arange(values.shape[1])
+    image[np.asarray(starts)[:, np.newaxis] + columns] = values
+
+def little_endian(values, num_bytes):
+    shifts = 8*np.arange(num_bytes)
+    return (np.asarray(values, dtype=np.int64)[:, np.newaxis] >> shifts) & 0xFF
+
+def instruction_layout(kind, isa):
+    """
+    Byte address of every instruction and of the reset
+    ending them.
+    """
+    sizes = np.array([1 + op_type.num_params(isa) for op_type in valid_ops])[kind]
+    pcs = np.cumsum(sizes) - sizes
+    return pcs, int(sizes.sum())
+
+def encode_payloads(op_type, ops, isa, bytes_in_line):
+    """
+    Payload of every op of ``op_type``, one byte per node
+    of the tree or per port, padded to lines.
+    """
+    if op_type is ConfigureStates:
+        data = check([op.states for op in ops], 0, 255, "State")
+        lead, length = 0, isa.num_nodes
+    elif op_type is ConfigureWeights:
+        # weights are written from the line holding the
+        # first multiplier on, in two's complement
+        low = -2**(isa.INPUT_WIDTH - 1)
+        data = check([op.weights for op in ops], low, -low - 1, "Weight")
+        data = data & (2**isa.INPUT_WIDTH - 1)
+        lead = isa.num_adders % bytes_in_line
+        length = lead + isa.num_mults
+    elif op_type is ConfigureCollectors:
+        data = check([op.node_ids for op in ops], 0, 255, "Node id")
+        lead, length = 0, isa.num_ports
+    else:
+        data = check([op.enables for op in ops], 0, 1, "Relu enable")
+        lead, length = 0, isa.num_ports
+
+    payloads = np.zeros((len(ops), align(length, bytes_in_line)), dtype=np.uint8)
+    payloads[:, lead:length] = data
+    return payloads
+
+def payload_pool(list_of_ops, kind, isa, bytes_in_line):
+    """
+    Interns the payloads of the configuration instructions
+    by content. Returns the distinct payloads laid end to
+    end, in the order they are first configured, and the
+    offset of the payload of every instruction among them,
+    -1 for other instructions.
+    """
+    offsets = np.full(len(kind), -1, dtype=np.int64)
+    pool = []
+    size = 0
+    for op_type in config_ops:
+        selected = np.flatnonzero(kind == kind_v_type[op_type])
+        if len(selected) == 0:
+            continue
+
+        payloads = encode_payloads(op_type, [list_of_ops[index] for index in selected],
+            isa, bytes_in_line)
+        distinct, first, inverse = np.unique(payloads, axis=0,
+            return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        offsets[selected] = size + rank[inverse.reshape(-1)]*payloads.shape[1]
+        pool += [distinct[order].reshape(-1)]
+        size += distinct.size
+
+    pool = np.concatenate(pool) if pool else np.zeros(0, dtype=np.uint8)
+    return pool, offsets
+
+def program_size(list_of_ops, isa, bytes_in_line=4, bytes_in_packet=None):
+    """
+    Bytes ``assemble`` encodes ``list_of_ops`` in, known
+    before any address is, as every parameter is of fixed
+    size and payloads hold no addresses.
+    """
+    kind = kinds(list_of_ops)
+    _, reset = instruction_layout(kind, isa)
+    pool, _ = payload_pool(list_of_ops, kind, isa, bytes_in_line)
+    size = align(reset + 1, bytes_in_line) + len(pool)
+    return align(size, bytes_in_packet or bytes_in_line)
+
+def assemble(list_of_ops, isa, as_bytes=False, bytes_in_line=4, bytes_in_packet=None):
+    """
+    Encodes ``list_of_ops`` for the tree of ``isa`` as an
+    image of device memory beginning at line 0. The
+    instructions come first and end with a reset. The
+    payloads of the configuration instructions follow from
+    the next line on, each distinct payload on lines of its
+    own, shared by every instruction configuring it. The
+    image is padded to a packet, or with no
+    ``bytes_in_packet`` given, to a line.
+
+    Returns the bytes of the image as a ``uint8`` array
+    with ``as_bytes`` set, otherwise a view of the same
+    memory as the little endian word of every line.
+    """
+    kind = kinds(list_of_ops)
+    pcs, reset = instruction_layout(kind, isa)
+    pool, offsets = payload_pool(list_of_ops, kind, isa, bytes_in_line)
+    base = align(reset + 1, bytes_in_line)
+    image = np.zeros(align(base + len(pool), bytes_in_packet or bytes_in_line), dtype=np.uint8)
+
+    # every instruction begins with its opcode
+    image[pcs] = np.array([op_type.op for op_type in valid_ops])[kind]
+    image[reset] = Reset.op
+    image[base:base + len(pool)] = pool
+
+    max_address = 2**(8*isa.bytes_in_address) - 1
+    config = offsets >= 0
+    if config.any():
+        lines = check((base + offsets[config])//bytes_in_line, 0, max_address, "Address")
+        place(image, pcs[config] + 1, little_endian(lines, isa.bytes_in_address))
+
+    # address, offset within the line, port and count
+    selected = (kind == kind_v_type[LoadFeatures]) | (kind == kind_v_type[StoreFeatures])
+    if selected.any():
+        transfers = [list_of_ops[index] for index in np.flatnonzero(selected)]
+        addresses = check([op.address for op in transfers], 0, max_address, "Address")
+        params = np.concatenate([
+            little_endian(addresses, isa.bytes_in_address),
+            check([[op.offset, op.port_buffer_address, op.num_lines] for op in transfers],
+                0, 255, "Transfer parameter"),
+            ], axis=1)
+        place(image, pcs[selected] + 1, params)
+
+    selected = kind == kind_v_type[Run]
+    if selected.any():
+        runs = [[list_of_ops[index].len_runtime, list_of_ops[index].pace]
+            for index in np.flatnonzero(selected)]
+        place(image, pcs[selected] + 1, check(runs, 0, 255, "Run parameter"))
+
     if as_bytes:
-        return combined_mem
+        return image
 
-    for mem_line in range(instr_mem_size + config_mem_size):
-        array = combined_mem[mem_line*4 : (mem_line + 1)*4]
-        final_mem += [int.from_bytes(bytearray(array), 'little')]
+    if bytes_in_line not in {1, 2, 4, 8}:
+        raise RuntimeError(f"Lines of {bytes_in_line} bytes are not words.")
+    final_mem = np.frombuffer(image, dtype=f"<u{bytes_in_line}")
 
     if DEBUG:
         for line in range(len(final_mem)//4):
@@ -86,4 +190,4 @@ def assemble(list_of_ops, as_bytes=False):
                 data += f" {offset + addr} : {hex(final_mem[offset + addr])}\t"
             print(data)
 
-    return final_mem
\ No newline at end of file
+    return final_mem
@@ -3,34 +3,29 @@ from maeri.compiler.assembler.states import InjectEn
 
 from enum import IntEnum, unique
 
-bytes_in_address = None
-num_nodes = None
-num_adders = None
-num_mults = None
-num_ports = None
-INPUT_WIDTH = None
-
-class InitISA():
-    def __init__(self, _bytes_in_address, _num_nodes, 
-            _num_adders, _num_mults, _input_width, _num_ports):
-        global bytes_in_address
-        bytes_in_address = _bytes_in_address
-
-        global num_nodes
-        num_nodes = _num_nodes
-
-        global num_adders
-        num_adders = _num_adders
-
-        global num_mults
-        num_mults = _num_mults
-
-        global num_ports
-        num_ports = _num_ports
-
-        global INPUT_WIDTH
-        INPUT_WIDTH = _input_width
-
+class ISA():
+    def __init__(self, bytes_in_address, num_nodes, num_adders,
+            num_mults, input_width, num_ports):
+        """
+        Parameters of the instruction set of one tree. Every
+        instruction, the assembler and the drivers take the
+        ISA of the tree they target, so trees of different
+        sizes can be served from one process.
+        """
+        self.bytes_in_address = bytes_in_address
+        self.num_nodes = num_nodes
+        self.num_adders = num_adders
+        self.num_mults = num_mults
+        self.num_ports = num_ports
+        self.INPUT_WIDTH = input_width
+
+    @classmethod
+    def for_tree(cls, num_mults, num_ports, bytes_in_address=3, input_width=8):
+        """
+        ISA of the balanced tree of ``num_mults`` leaves.
+        """
+        return cls(bytes_in_address, 2*num_mults - 1, num_mults - 1,
+            num_mults, input_width, num_ports)
 
 @unique
 class Opcodes(IntEnum):
@@ -51,27 +46,27 @@ class Reset():
 class ConfigureStates():
     op = Opcodes.configure_states
 
-    def __init__(self, states):
-        assert(len(states) == num_nodes)
+    def __init__(self, isa, states):
+        assert(len(states) == isa.num_nodes)
         self.states = states
 
-        for state in states[:num_adders]:
+        for state in states[:isa.num_adders]:
             assert(any([state in ConfigForward, state in ConfigUp]))
 
-        for state in states[num_adders:]:
+        for state in states[isa.num_adders:]:
             assert(state in InjectEn)
 
     @staticmethod
-    def num_params():
-        return bytes_in_address
+    def num_params(isa):
+        return isa.bytes_in_address
 
 class ConfigureWeights():
     op = Opcodes.configure_weights
 
-    def __init__(self, weights):
-        assert(len(weights) == num_mults)
-        min = (-1)*(2**(INPUT_WIDTH - 1))
-        max = 2**(INPUT_WIDTH - 1) -1
+    def __init__(self, isa, weights):
+        assert(len(weights) == isa.num_mults)
+        min = (-1)*(2**(isa.INPUT_WIDTH - 1))
+        max = 2**(isa.INPUT_WIDTH - 1) -1
 
         for weight in weights:
             assert(min <= weight <= max)
@@ -79,16 +74,17 @@ class ConfigureWeights():
         self.weights = weights
 
     @staticmethod
-    def num_params():
-        return bytes_in_address
+    def num_params(isa):
+        return isa.bytes_in_address
 
 class ConfigureCollectors():
     op = Opcodes.configure_collectors
 
-    def __init__(self, node_ids):
-        assert(len(node_ids) == num_nodes)
+    def __init__(self, isa, node_ids):
+        # one collected adder per port
+        assert(len(node_ids) == isa.num_ports)
         min = 0
-        max = 255
+        max = isa.num_adders - 1
 
         for node_id in node_ids:
             assert(min <= node_id <= max)
@@ -96,32 +92,56 @@ class ConfigureCollectors():
         self.node_ids = node_ids
 
     @staticmethod
-    def num_params():
-        return bytes_in_address
+    def num_params(isa):
+        return isa.bytes_in_address
+
+class ConfigureRelus():
+    op = Opcodes.configure_relus
+
+    def __init__(self, isa, enables):
+        # one enable per port
+        assert(len(enables) == isa.num_ports)
+
+        for enable in enables:
+            assert(enable in [0, 1])
+
+        self.enables = enables
+
+    @staticmethod
+    def num_params(isa):
+        return isa.bytes_in_address
 
 class LoadFeatures():
     op = Opcodes.load_features
 
-    def __init__(self, port_buffer_address, num_lines, address):
+    def __init__(self, port_buffer_address, num_lines, address, offset=0):
+        # appends ``num_lines`` elements, starting ``offset``
+        # bytes into line ``address``, to the buffer of port
+        # ``port_buffer_address``
         self.port_buffer_address = port_buffer_address
         self.num_lines = num_lines
         self.address = address
+        self.offset = offset
 
     @staticmethod
-    def num_params():
-        return bytes_in_address + 3
+    def num_params(isa):
+        return isa.bytes_in_address + 3
 
 class StoreFeatures():
     op = Opcodes.store_features
 
-    def __init__(self, port_buffer_address, num_lines, address):
+    def __init__(self, port_buffer_address, num_lines, address, offset=0):
+        # writes the first ``num_lines`` elements collected
+        # from port ``port_buffer_address`` to memory, starting
+        # ``offset`` bytes into line ``address``
         self.port_buffer_address = port_buffer_address
         self.num_lines = num_lines
         self.address = address
+        self.offset = offset
 
     @staticmethod
-    def num_params():
-        return bytes_in_address + 3
+    def num_params(isa):
+        return isa.bytes_in_address + 3
 
 class Run():
     op = Opcodes.run
@@ -131,7 +151,7 @@ class Run():
         self.pace = pace
 
     @staticmethod
-    def num_params():
+    def num_params(isa):
         return 2
 
 class Debug():
@@ -141,5 +161,5 @@ class Debug():
         pass
 
     @staticmethod
-    def num_params():
+    def num_params(isa):
         return 0
\ No newline at end of file
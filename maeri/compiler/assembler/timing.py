@@ -0,0 +1,249 @@
+from maeri.common.domains import compute_period
+from maeri.common.skeleton import Skeleton
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run, Debug
+
+import numpy as np
+
+op_v_type = {op_type.op : op_type for op_type in [ConfigureStates, ConfigureWeights,
+    ConfigureCollectors, ConfigureRelus, LoadFeatures, StoreFeatures, Run, Debug]}
+
+# line, offset and length of the range the debug state
+# of the compute unit stores
+DEBUG_STORE = (253, 1, 9)
+
+class Timing():
+    def __init__(self, cycles, stalls, macs, period=compute_period):
+        """
+        Predicted execution of a program on the compute unit.
+
+        Attributes:
+        ===========
+        self.cycles:
+            cycles spent in every state of the compute unit FSM
+        self.stalls:
+            cycles waiting on memory by cause, ``memory`` for
+            the handshake of every access and ``arbitration``
+            for accesses granted to the host first
+        self.macs:
+            multiply accumulates of the runs
+        self.period:
+            clock period of the compute domain in seconds
+        """
+        self.cycles = cycles
+        self.stalls = stalls
+        self.macs = macs
+        self.period = period
+
+    @property
+    def total(self):
+        return sum(self.cycles.values())
+
+    @property
+    def seconds(self):
+        return self.total*self.period
+
+    @property
+    def utilization(self):
+        return self.cycles.get('RUN', 0)/max(self.total, 1)
+
+    @property
+    def macs_per_second(self):
+        return self.macs/self.seconds if self.total else 0.0
+
+    def report(self):
+        lines = [f"{self.total} cycles, {1e6*self.seconds:.1f} us at {1e-6/self.period:.0f} MHz"]
+        for state, cycles in self.cycles.items():
+            lines += [f"    {state:<20} {cycles:>10} cycles ({100*cycles/max(self.total, 1):.1f}%)"]
+        for cause, cycles in self.stalls.items():
+            lines += [f"    stalled on {cause:<9} {cycles:>10} cycles"]
+        lines += [f"    tree busy {100*self.utilization:.1f}%, " +\
+            f"{self.macs_per_second/1e6:.1f} million MACs per second"]
+        return "\n".join(lines)
+
+class TimingModel():
+    def __init__(self, isa, bytes_in_line=4, wordsize=1, host_period=None,
+            period=compute_period):
+        """
+        Charges the cycles the compute unit of ``isa`` spends in
+        every FSM state of ``compute_unit/top.py`` running an
+        assembled program.
+
+        Bytes are read through ``MemAdaptor``, which takes a
+        memory access, a cycle to request and a cycle for the
+        data, to begin a line and a cycle for every further
+        byte of it. Configuration states read a line per
+        access. ``Mem`` serves one access at a time by fixed
+        priority, the compute unit's reads first, then the
+        reads of the host, then the compute unit's writes.
+        With ``host_period`` set, the host requests a read
+        every ``host_period`` cycles while the program runs.
+
+        States the FSM leaves as stubs are charged as the
+        datapath they are built on would take them. Loads
+        write the 8 bit injection port of ``ReductionNetwork``
+        a byte per cycle. Stores read back the ends of their
+        range and write whole lines as the debug state does.
+        A run lasts its length plus the latency of the
+        deepest collected node.
+        """
+        self.isa = isa
+        self.bytes_in_line = bytes_in_line
+        self.wordsize = wordsize
+        self.host_period = host_period
+        self.period = period
+
+        depth = int(np.log2(isa.num_mults)) + 1
+        skeleton = Skeleton(depth, isa.num_ports, bytes_in_line)
+        self.latency = {node.id : node.latency for node in skeleton.all_nodes}
+
+    def reset(self, image):
+        self.image = image
+        self.cycle = 0
+        self.cycles = {}
+        self.stalls = {'memory' : 0, 'arbitration' : 0}
+        self.macs = 0
+        # line the memory adaptor holds, when memory is next
+        # free and when the host next asks for it
+        self.line = None
+        self.mem_free = 0
+        self.host_next = self.host_period
+        self.state = None
+
+    def tick(self, cycles, stall=None):
+        self.cycles[self.state] = self.cycles.get(self.state, 0) + cycles
+        self.cycle += cycles
+        if stall is not None:
+            self.stalls[stall] += cycles
+
+    def access(self, write=False):
+        """
+        Waits for ``Mem`` to grant an access and charges its
+        two cycles.
+        """
+        while True:
+            start = max(self.cycle, self.mem_free)
+            if self.host_next is None:
+                break
+            # the host is served on idle cycles before ours,
+            # and ahead of our writes
+            served = max(self.host_next, self.mem_free)
+            if (served > start) or ((served == start) and not write):
+                break
+            self.mem_free = served + 2
+            self.host_next += self.host_period
+        self.tick(start - self.cycle, 'arbitration')
+        self.mem_free = start + 2
+        self.tick(1, 'memory')
+        self.tick(1)
+
+    def read_bytes(self, address, count):
+        """
+        Reads ``count`` bytes from byte ``address`` on through
+        the memory adaptor, one per cycle once their line is
+        held.
+        """
+        end = address + count
+        while address < end:
+            line, select = divmod(address, self.bytes_in_line)
+            stop = min(end, (line + 1)*self.bytes_in_line)
+            if (select == 0) or (line != self.line):
+                # the access delivers the first byte
+                self.line = line
+                self.access()
+                self.tick(stop - address - 1)
+            else:
+                self.tick(stop - address)
+            address = stop
+
+    def read_lines(self, line, count):
+        for offset in range(count):
+            self.line = line + offset
+            self.access()
+
+    def store(self, address, count):
+        """
+        Writes ``count`` bytes from byte ``address`` on, after
+        reading the lines at either end, a byte per cycle into
+        every line.
+        """
+        bil = self.bytes_in_line
+        first, last = address//bil, (address + count - 1)//bil
+        self.read_bytes(first*bil, bil)
+        self.read_bytes(last*bil, bil)
+        for line in range(first, last + 1):
+            self.tick(bil)
+            self.access(write=True)
+
+    def payload(self, line, lead, length):
+        start = line*self.bytes_in_line + lead
+        return self.image[start:start + length]
+
+    def predict(self, image):
+        """
+        Walks the program at address 0 of ``image`` up to its
+        reset and returns its ``Timing``.
+        """
+        isa = self.isa
+        bil = self.bytes_in_line
+        self.reset(np.asarray(image, dtype=np.uint8))
+        collectors = [0]*isa.num_ports
+        weights = np.zeros(isa.num_mults)
+
+        pc = 0
+        while True:
+            self.state = 'FETCH_OP'
+            self.read_bytes(pc, 1)
+            op_type = op_v_type.get(int(self.image[pc]))
+            if op_type is None:
+                # resets and undefined opcodes end the program
+                break
+
+            self.state = 'FETCH_PARAMS'
+            num_params = op_type.num_params(isa)
+            self.read_bytes(pc + 1, num_params)
+            params = self.image[pc + 1:pc + 1 + num_params].tolist()
+            address = int.from_bytes(bytes(params[:isa.bytes_in_address]), 'little')
+            pc += 1 + num_params
+
+            if op_type is ConfigureStates:
+                # a line per node group, then a cycle to leave
+                self.state = 'CONFIGURE_STATES'
+                self.read_lines(address, -(-isa.num_nodes//bil))
+                self.tick(1)
+            elif op_type is ConfigureWeights:
+                # the line after the last one is requested as well
+                self.state = 'CONFIGURE_WEIGHTS'
+                self.read_lines(address, -(-isa.num_mults//bil) + 1)
+                weights = self.payload(address, isa.num_adders % bil, isa.num_mults)
+            elif op_type is ConfigureCollectors:
+                self.state = 'CONFIGURE_COLLECTORS'
+                self.read_lines(address, max(1, isa.num_ports//bil))
+                collectors = self.payload(address, 0, isa.num_ports).tolist()
+            elif op_type is ConfigureRelus:
+                self.state = 'CONFIGURE_RELUS'
+                self.read_lines(address, -(-isa.num_ports//bil))
+
+            elif op_type is LoadFeatures:
+                offset, port, count = params[isa.bytes_in_address:]
+                self.state = 'LOAD_FEATURES'
+                self.read_bytes(address*bil + offset, count*self.wordsize)
+            elif op_type is StoreFeatures:
+                offset, port, count = params[isa.bytes_in_address:]
+                self.state = 'STORE_FEATURES'
+                self.store(address*bil + offset, count*self.wordsize)
+
+            elif op_type is Run:
+                length = params[0]
+                latency = max([self.latency.get(node, 0) for node in collectors])
+                self.state = 'RUN'
+                self.tick(length + latency)
+                self.macs += int(np.count_nonzero(weights))*max(length - latency, 0)
+
+            elif op_type is Debug:
+                line, offset, count = DEBUG_STORE
+                self.state = 'DEBUG'
+                self.store(line*bil + offset, count)
+
+        return Timing(self.cycles, self.stalls, self.macs, self.period)
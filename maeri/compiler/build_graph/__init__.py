@@ -1,12 +1,19 @@
+from .build_add import build_add
 from .build_conv import build_conv
 from .build_memories import build_memories
+from .build_relu import build_relu
 from .build_result import build_result
 from .build_root import build_root
+from .plan_memories import plan_memories, MemoryPlan
 
 
 __all__ = [
+    "build_add",
     "build_conv",
     "build_memories",
+    "build_relu",
     "build_result",
-    "build_root"
+    "build_root",
+    "plan_memories",
+    "MemoryPlan"
     ]
@@ -0,0 +1,49 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Add, AddLayer
+
+def build_add(add_node, name_v_mem):
+    A = add_node.input[0]
+    B = add_node.input[1]
+    OUTPUT = add_node.output[0]
+
+    a_mem = name_v_mem[A]
+    b_mem = name_v_mem[B]
+    output_mem = name_v_mem[OUTPUT]
+
+    a_dims = a_mem.data.shape
+    b_dims = b_mem.data.shape
+    output_dims = output_mem.data.shape
+
+    # compiler currently unable to reason about
+    # broadcasting adds
+    if not (a_dims == b_dims == output_dims):
+        raise NotImplementedError("Compiler does not yet support " +\
+            f"broadcasting adds of {a_dims} and {b_dims}.")
+
+    # Compiler currently unable to reason about add
+    # inputs that are not 4d
+    assert(len(output_dims) == 4)
+
+    ops = []
+    mems = []
+
+    # build elementwise graph, one add per channel
+    h_size_slice = slice(0, output_dims[2])
+    w_size_slice = slice(0, output_dims[3])
+    batch_slice = slice(0, output_dims[0])
+
+    for channel in range(output_dims[1]):
+        channel_slice = (batch_slice, channel, h_size_slice, w_size_slice)
+
+        a = Input(channel_slice, a_mem)
+        b = Input(channel_slice, b_mem)
+        c = Output(channel_slice, output_mem)
+
+        ops += [Add(a, b, c)]
+
+    layer = AddLayer(a_mem, b_mem, output_mem)
+    for op in ops:
+        op.layer = layer
+
+    return ops, mems
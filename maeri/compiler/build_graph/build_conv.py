@@ -1,6 +1,8 @@
 from maeri.common.logger import logger, LogIndent
 from maeri.compiler.nodes import Memory, Input, Output
 from maeri.compiler.nodes import Conv2, Add
+from maeri.compiler.nodes import ConvLayer
+from maeri.compiler.nodes.Conv2 import input_window, split_evenly, ports_per_row
 
 import numpy as np
 
@@ -12,17 +14,18 @@ def get_pads(conv_node):
     
     return pads
 
-def build_conv(conv_node, name_v_mem):
+def build_conv(conv_node, name_v_mem, mults=64, ports=16):
     INPUT = conv_node.input[0]
     FILTER = conv_node.input[1]
     OUTPUT = conv_node.output[0]
+    BIAS = None
     if len(conv_node.input) == 3:
         BIAS = conv_node.input[2]
-        raise NotImplementedError("Compiler does not yet support bias.")
 
     input_mem = name_v_mem[INPUT]
     filter_mem = name_v_mem[FILTER]
     output_mem = name_v_mem[OUTPUT]
+    bias_mem = name_v_mem[BIAS] if BIAS else None
 
     input_dims = input_mem.data.shape
     filter_dims = filter_mem.data.shape
@@ -31,6 +34,8 @@ def build_conv(conv_node, name_v_mem):
     # SANITY CHECK : For matching dimensions on inputs
     # and outputs
     assert(output_dims[1] == filter_dims[0])
+    if bias_mem is not None:
+        assert(bias_mem.data.shape == (filter_dims[0],))
 
     # Compiler currently unable to reason about conv
     # inputs that are not 4d
@@ -42,12 +47,10 @@ def build_conv(conv_node, name_v_mem):
     assert(input_dims[2] == input_dims[3])
     assert(filter_dims[2] == filter_dims[3])
 
-    # I don't even know how to perform a convolution on
-    # on inputs having a 4th dimension with a depth
-    # greater than 1
-    # NOTE : 0 indexes into the 4th dimension below 
-    # due to onnx's reversed indexing
-    assert(input_dims[0] == 1)
+    # the leading dimension is the batch, every op
+    # covers the whole batch so that its filter is
+    # configured once for all images
+    assert(input_dims[0] == output_dims[0])
 
     pads = get_pads(conv_node)
     assert(len(pads) == 4)
@@ -67,51 +70,82 @@ def build_conv(conv_node, name_v_mem):
     f_size_slice = slice(0, filter_dims[2])
     i_size_slice = slice(0, input_dims[2])
     o_size_slice = slice(0, output_dims[2])
+    batch_slice = slice(0, input_dims[0])
 
-    # if there is only one channel
-    if filter_dims[1] == 1:
-        for output in range(filter_dims[0]):
-            input_slice = (0, 0, i_size_slice, i_size_slice)
-            X = Input(input_slice, input_mem)
-
-            filter_slice = (output, 0, f_size_slice, f_size_slice)
-            W = Input(filter_slice, filter_mem)
-
-            output_slice = (0, output, o_size_slice, o_size_slice)
-            res = Output(output_slice, output_mem)
+    if filter_dims[1] < 1:
+        raise ValueError(f"filter_dims[1] of {filter_dims[1]} is less than 1.")
 
-            ops += [Conv2(X, W, res, [pad]*4)]
-    
-    # if there is more than one channel
-    elif filter_dims[1] > 1:
+    # channels of one filter are reduced together in the
+    # tree, as many as there are ports for their filter
+    # rows, see ``ports_per_row``. The bias takes up a port
+    # of the first group. With fewer ports than the filter
+    # rows of two channels and a bias, as for 3x3 filters
+    # on the default four ports, every channel takes a pass
+    # of its own.
+    channels = filter_dims[1]
+    budget = (ports - 1) if (bias_mem is not None) else ports
+    per_channel = ports_per_row(1, filter_dims[2], filter_dims[3], 0, ports, mults)
+    if per_channel <= budget:
+        group = max(1, min(channels, budget//per_channel))
+        passes = -(-channels//group)
+        channel_slices = [slice(begin, end)
+            for begin, end in split_evenly(channels, passes)]
+        row_slices = [f_size_slice]
+        logger.debug(f"Reducing {group} of {channels} channels per tree pass")
+
+    # filters with more rows than ports are split into
+    # bands of filter rows, one channel at a time
+    else:
+        per_row = ports_per_row(1, 1, filter_dims[3], 0, ports, mults)
+        rows = max(1, budget//per_row)
+        passes = -(-filter_dims[2]//rows)
+        channel_slices = [slice(channel, channel + 1) for channel in range(channels)]
+        row_slices = [slice(begin, end)
+            for begin, end in split_evenly(filter_dims[2], passes)]
+        logger.debug(f"Reducing {rows} of {filter_dims[2]} filter rows per tree pass")
+
+    # every partition of the filter is one pass, partial
+    # sums beyond the first are accumulated through a
+    # buffer and an add
+    partitions = [(channel_slice, row_slice)
+        for channel_slice in channel_slices for row_slice in row_slices]
+    if len(partitions) > 1:
         # TODO, return buffer
-        buffer_mem = Memory(np.zeros([1,1,output_dims[2],output_dims[2]]))
+        buffer_mem = Memory(np.zeros([input_dims[0],1,output_dims[2],output_dims[2]]))
         mems += [buffer_mem]
-        buffer_slice = (0, 0, o_size_slice, o_size_slice)
+        buffer_slice = (batch_slice, 0, o_size_slice, o_size_slice)
+
+    for output in range(filter_dims[0]):
+        for index, (channel_slice, row_slice) in enumerate(partitions):
+            # a band of filter rows reads the input rows its
+            # rows meet, with its own share of the padding
+            begin, end, pad_upper, pad_bottom = input_window(row_slice.start,
+                row_slice.start + output_dims[2], pad, input_dims[2],
+                row_slice.stop - row_slice.start)
+            input_slice = (batch_slice, channel_slice, slice(begin, end), i_size_slice)
+            X = Input(input_slice, input_mem)
+            op_pad = [pad, pad_upper, pad, pad_bottom]
 
-        for output in range(filter_dims[0]):
-            for channel in range(filter_dims[1]):
-                input_slice = (0, channel, i_size_slice, i_size_slice)
-                X = Input(input_slice, input_mem)
+            filter_slice = (output, channel_slice, row_slice, f_size_slice)
+            W = Input(filter_slice, filter_mem)
 
-                filter_slice = (output, channel, f_size_slice, f_size_slice)
-                W = Input(filter_slice, filter_mem)
+            output_slice = (batch_slice, output, o_size_slice, o_size_slice)
 
-                output_slice = (0, output, o_size_slice, o_size_slice)
+            if index == 0:
+                res = Output(output_slice, output_mem)
+                bias = Input((output,), bias_mem) if (bias_mem is not None) else None
+                ops += [Conv2(X, W, res, op_pad, bias)]
 
-                if channel == 0:
-                    res = Output(output_slice, output_mem)
-                    ops += [Conv2(X, W, res, [pad]*4)]
+            else:
+                buf_res = Output(buffer_slice, buffer_mem)
 
-                else:
-                    buf_res = Output(buffer_slice, buffer_mem)
-                    
-                    a = Input(output_slice, output_mem)
-                    b = Input(buffer_slice, buffer_mem)
-                    c = Output(output_slice, output_mem)
-                    ops += [Conv2(X, W, buf_res, [pad]*4), Add(a, b, c)]
+                a = Input(output_slice, output_mem)
+                b = Input(buffer_slice, buffer_mem)
+                c = Output(output_slice, output_mem)
+                ops += [Conv2(X, W, buf_res, op_pad), Add(a, b, c)]
 
-    else:
-        raise ValueError(f"filter_dims[1] of {filter_dims[1]} is less than 1.")
+    layer = ConvLayer(input_mem, filter_mem, output_mem, [pad]*4, bias_mem)
+    for op in ops:
+        op.layer = layer
 
     return ops, mems
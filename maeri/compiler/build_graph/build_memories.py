@@ -1,69 +1,46 @@
 from maeri.common.logger import logger, LogIndent
 from maeri.compiler.nodes import Memory
+from maeri.compiler.build_graph.plan_memories import plan_memories
+from maeri.compiler.build_graph.load_initializer import load_initializer
 
 import numpy as np
 
-def build_memories(model):
+def build_memories(model, ordered_nodes, base_dir=""):
+    """
+    Creates a ``Memory`` for every tensor in ``model``.
 
-    name_v_mem = {}
-
-    input_names = [_.name for _ in model.graph.input]
-    output_names = [_.name for _ in model.graph.output]
-    valueinfo_names = [_.name for _ in model.graph.value_info]
-
-    logger.debug("Adding memory for model.graph.input")
-    with LogIndent():
-        for input_ in model.graph.input:
-            dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
+    Activations are views into one shared arena laid out
+    by ``plan_memories``, so tensors that are never live at
+    the same time share storage. Initializers keep their
+    own buffers as they are needed for the whole program,
+    loaded without copies from ``model`` or from external
+    data files relative to ``base_dir``.
 
-            # add memory node to lists
-            name_v_mem[input_.name] = Memory(data)
-            logger.debug(f"Creating memory for {input_.name}")
-
-    logger.debug("Adding memory for model.graph.value_info")
-    with LogIndent():
-        for input_ in model.graph.value_info:
-            dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
+    Returns the name to memory dict and the memory plan.
+    """
+    name_v_mem = {}
 
-            # add memory node to lists
-            name_v_mem[input_.name] = Memory(data)
-            if input_.name in input_names:
-                logger.debug(f"Replacing memory for {input_.name}")
-            else:
-                logger.debug(f"Creating memory for {input_.name}")
+    plan = plan_memories(model, ordered_nodes)
+    views = plan.build_arena()
 
-    logger.debug("Adding memory for model.graph.output")
+    logger.debug("Adding memory for activations")
     with LogIndent():
-        for input_ in model.graph.output:
-            dims = [dim.dim_value for dim in input_.type.tensor_type.shape.dim]
-            data = np.zeros(dims)
-
+        for name, data in views.items():
             # add memory node to lists
-            name_v_mem[input_.name] = Memory(data)
-            if input_.name in input_names + valueinfo_names:
-                logger.debug(f"Replacing memory for {input_.name}")
-            else:
-                logger.debug(f"Creating memory for {input_.name}")
+            name_v_mem[name] = Memory(data, name)
+            logger.debug(f"Creating memory for {name} at arena offset {plan.offsets[name]}")
 
     logger.debug("Adding memory for model.graph.initializer")
     with LogIndent():
         for input_ in model.graph.initializer:
-            dims = input_.dims
-
             # get data for memory instance
-            if input_.float_data:
-                data = np.array(input_.float_data).reshape(dims)
-            else:
-                logger.debug(f"{input_.name} has no data")
-                data = np.zeros(dims)
-            
+            data = load_initializer(input_, base_dir)
+
             # add memory node to lists
-            name_v_mem[input_.name] = Memory(data)
-            if input_.name in input_names + valueinfo_names + output_names:
-                logger.debug(f"Replacing memory for {input_.name}")
-            else:
-                logger.debug(f"Creating memory for {input_.name}")
-    
-    return name_v_mem
+            name_v_mem[input_.name] = Memory(data, input_.name)
+            logger.debug(f"Creating memory for {input_.name}")
+
+    itemsize = np.dtype(np.float64).itemsize
+    logger.info(f"Peak memory footprint : {plan.peak_footprint(itemsize)} bytes")
+
+    return name_v_mem, plan
@@ -0,0 +1,42 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes import Relu, ReluLayer
+
+def build_relu(relu_node, name_v_mem):
+    INPUT = relu_node.input[0]
+    OUTPUT = relu_node.output[0]
+
+    input_mem = name_v_mem[INPUT]
+    output_mem = name_v_mem[OUTPUT]
+
+    input_dims = input_mem.data.shape
+    output_dims = output_mem.data.shape
+
+    # SANITY CHECK : relu is elementwise
+    assert(input_dims == output_dims)
+
+    # Compiler currently unable to reason about relu
+    # inputs that are not 4d
+    assert(len(input_dims) == 4)
+
+    ops = []
+    mems = []
+
+    # build elementwise graph, one relu per channel
+    h_size_slice = slice(0, output_dims[2])
+    w_size_slice = slice(0, output_dims[3])
+    batch_slice = slice(0, output_dims[0])
+
+    for channel in range(output_dims[1]):
+        channel_slice = (batch_slice, channel, h_size_slice, w_size_slice)
+
+        data = Input(channel_slice, input_mem)
+        res = Output(channel_slice, output_mem)
+
+        ops += [Relu(data, res)]
+
+    layer = ReluLayer(input_mem, output_mem)
+    for op in ops:
+        op.layer = layer
+
+    return ops, mems
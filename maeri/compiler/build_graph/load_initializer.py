@@ -0,0 +1,65 @@
+from maeri.common.logger import logger
+from onnx import TensorProto
+
+import numpy as np
+import os
+
+# onnx data types the compiler can load, with the
+# typed field holding their data when not raw
+dtype_v_field = {
+    TensorProto.FLOAT : (np.dtype('<f4'), 'float_data'),
+    TensorProto.DOUBLE : (np.dtype('<f8'), 'double_data'),
+    TensorProto.FLOAT16 : (np.dtype('<f2'), 'int32_data'),
+    TensorProto.INT8 : (np.dtype('<i1'), 'int32_data'),
+    TensorProto.UINT8 : (np.dtype('<u1'), 'int32_data'),
+    TensorProto.INT16 : (np.dtype('<i2'), 'int32_data'),
+    TensorProto.INT32 : (np.dtype('<i4'), 'int32_data'),
+    TensorProto.INT64 : (np.dtype('<i8'), 'int64_data'),
+}
+
+def load_external(init, dtype, base_dir):
+    """
+    Memory maps the file holding the data of an
+    initializer stored outside of the model.
+    """
+    info = {entry.key : entry.value for entry in init.external_data}
+    path = os.path.join(base_dir, info['location'])
+    offset = int(info.get('offset', 0))
+    count = int(np.prod(init.dims, dtype=np.int64))
+
+    logger.debug(f"Mapping {init.name} from {path} at offset {offset}")
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+    return data.reshape(init.dims)
+
+def load_initializer(init, base_dir=""):
+    """
+    Returns the data of an onnx initializer as a NumPy
+    array without converting it through Python lists.
+
+    Raw data is viewed in place and external data is
+    memory mapped, so both are read-only.
+    """
+    if init.data_type not in dtype_v_field:
+        raise NotImplementedError(f"Compiler does not yet support initializer " +\
+            f"{init.name} of onnx data type {init.data_type}.")
+
+    dtype, field = dtype_v_field[init.data_type]
+    dims = tuple(init.dims)
+
+    if init.data_location == TensorProto.EXTERNAL:
+        return load_external(init, dtype, base_dir)
+
+    if init.raw_data:
+        return np.frombuffer(init.raw_data, dtype=dtype).reshape(dims)
+
+    values = getattr(init, field)
+    if len(values) == 0:
+        logger.debug(f"{init.name} has no data")
+        return np.zeros(dims, dtype=dtype)
+
+    # half floats are stored as their bit patterns
+    if init.data_type == TensorProto.FLOAT16:
+        data = np.fromiter(values, dtype=np.uint16, count=len(values))
+        return data.view(dtype).reshape(dims)
+
+    return np.fromiter(values, dtype=dtype, count=len(values)).reshape(dims)
@@ -0,0 +1,158 @@
+from maeri.common.logger import logger, LogIndent
+
+import numpy as np
+
+class MemoryPlan():
+    def __init__(self):
+        """
+        Attributes:
+        ===========
+        self.dims:
+            dict of tensor name to tensor dimensions
+        self.live_ranges:
+            dict of tensor name to the inclusive (first, last)
+            schedule steps during which the tensor must hold
+            its value. Step -1 is before the first node and
+            step len(schedule) is after the last node.
+        self.offsets:
+            dict of tensor name to the element offset of the
+            tensor within the shared arena
+        self.arena_size:
+            number of elements in the shared arena
+        self.constant_size:
+            number of elements held by initializers, which
+            live for the whole program and are not packed
+        """
+        self.dims = {}
+        self.live_ranges = {}
+        self.offsets = {}
+        self.arena_size = 0
+        self.constant_size = 0
+
+    def size(self, name):
+        return int(np.prod(self.dims[name], dtype=np.int64))
+
+    def unplanned_size(self):
+        """
+        Number of elements that would be needed if
+        every tensor were given its own buffer.
+        """
+        return sum([self.size(name) for name in self.offsets])
+
+    def peak_footprint(self, itemsize=1):
+        return (self.arena_size + self.constant_size)*itemsize
+
+    def build_arena(self):
+        """
+        Allocates the shared arena and returns a dict
+        of tensor name to the view of the tensor into it.
+        """
+        arena = np.zeros(self.arena_size)
+        views = {}
+        for name, dims in self.dims.items():
+            offset = self.offsets[name]
+            views[name] = arena[offset : offset + self.size(name)].reshape(dims)
+        return views
+
+    def overlaps(self, name_a, name_b):
+        first_a, last_a = self.live_ranges[name_a]
+        first_b, last_b = self.live_ranges[name_b]
+        return (first_a <= last_b) and (first_b <= last_a)
+
+def get_dims(value_info):
+    return [dim.dim_value for dim in value_info.type.tensor_type.shape.dim]
+
+def compute_live_ranges(model, ordered_nodes, names):
+    """
+    The live range of a tensor spans from the step of
+    its producer to the step of its last consumer.
+    Graph inputs are produced before the first step
+    and graph outputs are consumed after the last.
+    """
+    end = len(ordered_nodes)
+    first = {name : -1 for name in names}
+    last = {name : -1 for name in names}
+
+    for step, node in enumerate(ordered_nodes):
+        for name in node.output:
+            if name in first:
+                first[name] = step
+                last[name] = max(last[name], step)
+        for name in node.input:
+            if name in last:
+                last[name] = step
+
+    for output in model.graph.output:
+        if output.name in last:
+            last[output.name] = end
+
+    return {name : (first[name], last[name]) for name in names}
+
+def align(value, alignment):
+    return -(-value//alignment)*alignment
+
+def first_fit_decreasing(sizes, overlaps, alignment=1):
+    """
+    Places the largest tensors first, each at the
+    lowest ``alignment`` aligned offset not used by an
+    already placed tensor that is live at the same time.
+
+    ``sizes`` maps names to sizes and ``overlaps`` is a
+    callable telling whether two names are live together.
+    Returns the dict of offsets and the total size.
+    """
+    offsets = {}
+    total = 0
+    order = sorted(sizes.keys(), key=lambda name: (-sizes[name], name))
+
+    for name in order:
+        size = sizes[name]
+        conflicts = [(offsets[other], offsets[other] + sizes[other])
+            for other in offsets if overlaps(name, other)]
+        conflicts.sort()
+
+        offset = 0
+        for begin, end in conflicts:
+            if (offset + size) <= begin:
+                break
+            offset = max(offset, align(end, alignment))
+
+        offsets[name] = offset
+        total = max(total, offset + size)
+
+    return offsets, total
+
+def plan_memories(model, ordered_nodes):
+    """
+    Computes the live range of every activation tensor
+    in ``model`` given the schedule ``ordered_nodes`` and
+    packs the tensors into one shared arena so that tensors
+    which are never live at the same time share storage.
+    """
+    plan = MemoryPlan()
+
+    init_names = {_.name for _ in model.graph.initializer}
+    for init in model.graph.initializer:
+        plan.constant_size += int(np.prod(init.dims, dtype=np.int64))
+
+    # later definitions replace earlier ones, as in onnx
+    # value_info refines graph inputs and outputs
+    value_infos = list(model.graph.input) + list(model.graph.value_info)
+    value_infos += list(model.graph.output)
+    for value_info in value_infos:
+        if value_info.name not in init_names:
+            plan.dims[value_info.name] = get_dims(value_info)
+
+    plan.live_ranges = compute_live_ranges(model, ordered_nodes, plan.dims.keys())
+    sizes = {name : plan.size(name) for name in plan.dims}
+    plan.offsets, plan.arena_size = first_fit_decreasing(sizes, plan.overlaps)
+
+    logger.debug("PLANNED MEMORIES")
+    with LogIndent():
+        for name in sorted(plan.offsets, key=plan.offsets.get):
+            logger.debug(f"{name} : offset {plan.offsets[name]} : " +\
+                f"size {plan.size(name)} : live {plan.live_ranges[name]}")
+        logger.debug(f"arena size {plan.arena_size} elements, " +\
+            f"{plan.unplanned_size()} without reuse")
+
+    return plan
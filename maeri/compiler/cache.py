@@ -0,0 +1,156 @@
+from maeri.common.logger import logger
+
+import numpy as np
+import hashlib
+import pickle
+import onnx
+import os
+
+# bump whenever the layout of compiled artifacts changes
+CACHE_VERSION = 8
+
+class ArenaPickler(pickle.Pickler):
+    """
+    Stores references to activation arrays instead of their
+    contents. Activations are views into the shared arena and
+    hold no information between runs.
+    """
+    def __init__(self, file, activations):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.activations = {id(data) : name for name, data in activations.items()}
+
+    def persistent_id(self, obj):
+        return self.activations.get(id(obj))
+
+class ArenaUnpickler(pickle.Unpickler):
+    def __init__(self, file, views):
+        super().__init__(file)
+        self.views = views
+
+    def persistent_load(self, name):
+        return self.views[name]
+
+def hash_arrays(arrays):
+    """
+    Hashes the shapes, types and contents of ``arrays``.
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.shape, array.dtype.str)).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+def hash_model(model_path):
+    """
+    Hashes the content of an onnx model together with any
+    external data files it references.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    model = onnx.load(model_path, load_external_data=False)
+    base_dir = os.path.dirname(model_path)
+    locations = set()
+    for init in model.graph.initializer:
+        if init.data_location == onnx.TensorProto.EXTERNAL:
+            locations |= {entry.value for entry in init.external_data
+                if entry.key == 'location'}
+
+    for location in sorted(locations):
+        with open(os.path.join(base_dir, location), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+class CompileCache():
+    def __init__(self, directory, max_bytes=1 << 30):
+        """
+        On disk cache of compiled models.
+
+        The built graph is keyed by the content of the model
+        and the hardware parameters it was compiled for, the
+        state after every later stage by the key before it
+        and the parameters of the stage, see ``chain``. When the cache
+        grows beyond ``max_bytes``, the least recently used
+        entries are evicted.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, model_path, **params):
+        digest = hashlib.sha256()
+        digest.update(hash_model(model_path).encode())
+        digest.update(repr((CACHE_VERSION, sorted(params.items()))).encode())
+        return digest.hexdigest()
+
+    def chain(self, key, stage, *params):
+        """
+        Key of the state after running ``stage`` with
+        ``params`` on the state of ``key``.
+        """
+        digest = hashlib.sha256()
+        digest.update(key.encode())
+        digest.update(repr((stage, params)).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def load(self, key):
+        """
+        Returns the cached state for ``key`` or None.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            logger.debug(f"Cache miss for {key}")
+            return None
+
+        with open(path, 'rb') as f:
+            plan = pickle.load(f)
+            state = ArenaUnpickler(f, plan.build_arena()).load()
+
+        # mark as recently used
+        os.utime(path)
+        logger.debug(f"Cache hit for {key}")
+        return state
+
+    def store(self, key, state, plan):
+        """
+        Writes ``state`` for ``key``, the activations laid out
+        by ``plan`` are rebuilt rather than stored.
+        """
+        activations = {}
+        for obj in state.get('memories', []):
+            if obj.name in plan.dims:
+                activations[obj.name] = obj.data
+
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+            ArenaPickler(f, activations).dump(state)
+        os.replace(temp_path, path)
+
+        logger.debug(f"Cached {key}")
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries += [(stat.st_mtime, stat.st_size, path)]
+
+        total = sum([size for _, size, _ in entries])
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logger.debug(f"Evicted {path}")
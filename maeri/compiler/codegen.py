@@ -0,0 +1,273 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run
+
+import numpy as np
+
+def indices(slice_, length):
+    """
+    Indices an operand axis selects, an index axis
+    selects one.
+    """
+    if isinstance(slice_, slice):
+        return range(*slice_.indices(length))
+    return range(slice_, slice_ + 1)
+
+def address(memory, index):
+    """
+    Byte address of the element at ``index`` of ``memory``
+    in device memory.
+    """
+    flat = np.ravel_multi_index(index, memory.data.shape)
+    return memory.offset + int(memory.position(flat))*memory.itemsize
+
+class Program():
+    def __init__(self, isa, instructions, eliminated):
+        """
+        Instructions running a solved op graph on the
+        compute unit.
+
+        Attributes:
+        ===========
+        self.isa:
+            ``ISA`` of the tree the instructions target
+        self.instructions:
+            list of instructions of ``maeri.compiler.assembler.opcodes``
+        self.eliminated:
+            number of configuration instructions left out by
+            type, because the tree already held them
+        """
+        self.isa = isa
+        self.instructions = instructions
+        self.eliminated = eliminated
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def count(self, instruction_type):
+        return sum([type(instruction) is instruction_type
+            for instruction in self.instructions])
+
+class CodeGenerator():
+    def __init__(self, isa, mapper, memory_map, zeros, ones, gains=None):
+        """
+        Lowers the passes of a mapped op graph to instructions.
+
+        Every pass configures the tree, loads every port
+        with the padded input row its weights are applied
+        to, runs and stores the sum collected for every
+        neuron from its port. Padding is loaded from
+        ``zeros``, the constant feature a folded bias is
+        weighted against from ``ones``. Configurations the
+        tree already holds and rows a port already holds are
+        not loaded again.
+
+        Passes are lowered from one op of ``op_graph`` at a
+        time, an ``OpView`` when it is a table.
+
+        The filter rows of a convolution are chained on the
+        multipliers behind their port, see ``TreeMapper.map``,
+        so the first ``filter width - 1`` sums of a row are
+        incomplete. They are stored into the slack in front
+        of the row, or over columns to their left that the
+        solver computes later.
+        """
+        self.isa = isa
+        self.mapper = mapper
+        self.num_ports = mapper.num_ports
+        self.b_in_line = memory_map.b_in_line
+        self.itemsize = memory_map.wordsize
+        self.zeros = zeros
+        self.ones = ones
+        self.gains = {} if gains is None else gains
+        self.latency = {node.id : node.latency for node in mapper.skeleton.all_nodes}
+
+        self.instructions = []
+        # payload of every configuration instruction
+        # the tree holds
+        self.configured = {}
+        self.eliminated = {}
+        # (byte address, element count) segments every
+        # port holds
+        self.resident = {}
+
+    def configure(self, instruction_type, payload):
+        payload = tuple(payload)
+        if self.configured.get(instruction_type) == payload:
+            name = instruction_type.__name__
+            self.eliminated[name] = self.eliminated.get(name, 0) + 1
+            return
+        self.configured[instruction_type] = payload
+        self.instructions += [instruction_type(self.isa, list(payload))]
+
+    def configure_tree(self, mapping, relus):
+        collectors = mapping.collectors + [0]*(self.num_ports - len(mapping.collectors))
+        enables = relus + [0]*(self.num_ports - len(relus))
+
+        input_width = self.isa.INPUT_WIDTH
+        low = -2**(input_width - 1)
+        high = 2**(input_width - 1) - 1
+        weights = mapping.weights
+        if (weights != np.rint(weights)).any() or (weights < low).any() or (weights > high).any():
+            raise RuntimeError(f"Weights are not {input_width} bit integers, " +\
+                "quantize the model before generating code.")
+
+        self.configure(ConfigureStates, mapping.states)
+        self.configure(ConfigureWeights, [int(weight) for weight in weights])
+        self.configure(ConfigureCollectors, collectors)
+        self.configure(ConfigureRelus, enables)
+
+    def load(self, port, segments):
+        """
+        Loads the ``segments`` of (byte address, element count)
+        into ``port``, unless it already holds them.
+        """
+        segments = tuple([(start, count) for start, count in segments if count > 0])
+        if self.resident.get(port) == segments:
+            return
+        for start, count in segments:
+            self.instructions += [LoadFeatures(port, count,
+                start//self.b_in_line, start % self.b_in_line)]
+        self.resident[port] = segments
+
+    def run(self, length, mapping):
+        # the last sums leave the tree after the latency
+        # of the deepest collected adder
+        latency = max([self.latency[node] for node in mapping.collectors])
+        self.instructions += [Run(length + latency, 1)]
+
+    def store(self, port, start, count):
+        self.instructions += [StoreFeatures(port, count,
+            start//self.b_in_line, start % self.b_in_line)]
+
+        # ports holding what was overwritten must load it again
+        end = start + count*self.itemsize
+        for other, segments in list(self.resident.items()):
+            if any([(begin < end) and (start < begin + length*self.itemsize)
+                    for begin, length in segments]):
+                del self.resident[other]
+
+    def conv_pass(self, op_graph, pass_):
+        op = op_graph[pass_.ops[0]]
+        X = op.X.mem_ref
+        X_slice = op.X.slice
+        shape = X.data.shape
+        channels = indices(X_slice[1], shape[1])
+        rows = indices(X_slice[2], shape[2])
+        cols = indices(X_slice[3], shape[3])
+        width = op.pad_left + len(cols) + op.pad_right
+
+        self.configure_tree(pass_.mapping, [])
+        for image in indices(X_slice[0], shape[0]):
+            # every neuron reads the padded window rows of its
+            # output row, on the ports of its ring
+            for (index, row), ports in zip(pass_.neurons, pass_.mapping.ports):
+                neuron_op = op_graph[index]
+                res = neuron_op.res
+                out = indices(res.slice[2], res.mem_ref.data.shape[2])[row]
+                depth = neuron_op.W.get_data().shape[-2]
+                for position, channel in enumerate(channels):
+                    for slot in range(depth):
+                        input_row = row + (slot - out) % depth - op.pad_upper
+                        if 0 <= input_row < len(rows):
+                            start = address(X, (image, channel, rows[input_row], cols[0]))
+                            segments = [(self.zeros.offset, op.pad_left), (start, len(cols)),
+                                (self.zeros.offset, op.pad_right)]
+                        else:
+                            segments = [(self.zeros.offset, width)]
+                        self.load(ports[position*depth + slot], segments)
+                if neuron_op.bias is not None:
+                    self.load(ports[-1], [(self.ones.offset, width)])
+
+            self.run(width, pass_.mapping)
+
+            for port, (index, row) in enumerate(pass_.neurons):
+                neuron_op = op_graph[index]
+                res = neuron_op.res
+                res_shape = res.mem_ref.data.shape
+                res_row = indices(res.slice[2], res_shape[2])[row]
+                res_cols = indices(res.slice[3], res_shape[3])
+                channel = indices(res.slice[1], res_shape[1])[0]
+                lead = neuron_op.W.get_data().shape[-1] - 1
+                assert(lead + len(res_cols) == width)
+                start = address(res.mem_ref, (image, channel, res_row, res_cols[0]))
+                self.store(port, start - lead*self.itemsize, width)
+
+    def elementwise_pass(self, operands, res, relu, gains=None):
+        """
+        Computes every row of ``res`` as the sum of the same
+        row of ``operands`` on a neuron of its own, every
+        operand loaded into a port of its own. Operands are
+        weighed by ``gains`` of the channel, or by one.
+        """
+        # operands select as many elements along every axis
+        # as ``res``, though from other memories and channels,
+        # as the partial sums of a split convolution do
+        terms = operands + [res]
+        axes = [[indices(term.slice[axis], term.mem_ref.data.shape[axis]) for term in terms]
+            for axis in range(4)]
+        assert(all([len(set(map(len, axis))) == 1 for axis in axes]))
+        images, channels, rows, cols = [range(len(axis[0])) for axis in axes]
+
+        def index(term, image, channel, row, col):
+            return tuple([axis[term][position] for axis, position
+                in zip(axes, (image, channel, row, col))])
+
+        max_rows = self.num_ports//len(operands)
+        max_cols = self.zeros.data.shape[1]
+        for row_begin in range(0, len(rows), max_rows):
+            count = min(max_rows, len(rows) - row_begin)
+            mappings = {}
+            configured = None
+            for col_begin in range(0, len(cols), max_cols):
+                width = min(max_cols, len(cols) - col_begin)
+                for image in images:
+                    for channel in channels:
+                        # gains are those of the channel written
+                        res_channel = axes[1][-1][channel]
+                        weights = tuple([1]*len(operands) if gains is None else
+                            [int(gain[res_channel]) for gain in gains])
+                        if weights not in mappings:
+                            mappings[weights] = self.mapper.map(
+                                [[[weight] for weight in weights]]*count)
+                        mapping = mappings[weights]
+                        if mapping is None:
+                            raise RuntimeError(f"{count} rows of {len(operands)} " +\
+                                "operands do not fit the tree.")
+                        # channels of equal gains share a configuration
+                        if mapping is not configured:
+                            self.configure_tree(mapping, [int(relu)]*count)
+                            configured = mapping
+
+                        for neuron, ports in enumerate(mapping.ports):
+                            for position, operand in enumerate(operands):
+                                start = address(operand.mem_ref, index(position, image,
+                                    channel, row_begin + neuron, col_begin))
+                                self.load(ports[position], [(start, width)])
+
+                        self.run(width, mapping)
+
+                        for neuron in range(count):
+                            start = address(res.mem_ref, index(-1, image, channel,
+                                row_begin + neuron, col_begin))
+                            self.store(neuron, start, width)
+
+    def generate(self, op_graph, passes):
+        logger.debug("GENERATING CODE")
+        with LogIndent():
+            for pass_ in passes:
+                op = op_graph[pass_.ops[0]]
+                if pass_.mapping is not None:
+                    self.conv_pass(op_graph, pass_)
+                elif hasattr(op, 'A'):
+                    self.elementwise_pass([op.A, op.B], op.C, relu=False,
+                        gains=self.gains.get(op.layer))
+                else:
+                    self.elementwise_pass([op.data], op.res, relu=True,
+                        gains=self.gains.get(op.layer))
+
+            logger.debug(f"{len(self.instructions)} instructions, " +\
+                f"eliminated {self.eliminated}")
+
+        return Program(self.isa, self.instructions, self.eliminated)
@@ -3,32 +3,78 @@ from maeri.compiler.sanitize.sanitize import sanitize
 from maeri.compiler.build_graph import build_memories
 from maeri.compiler.schedule import schedule
 from maeri.compiler.build_graph import build_conv
+from maeri.compiler.build_graph import build_add
+from maeri.compiler.build_graph import build_relu
 from maeri.compiler.build_graph import build_root
 from maeri.compiler.build_graph import build_result
 
 from maeri.compiler.nodes.Conv2 import Conv2
+from maeri.compiler.nodes.ConvLayer import ConvLayer
 from maeri.compiler.nodes.Add import Add
+from maeri.compiler.nodes.Relu import Relu
+from maeri.compiler.nodes.Memory import Memory
+from maeri.compiler.nodes.Input import Input
+from maeri.compiler.memory_map import MemoryMap
+from maeri.compiler.op_table import OpTable, CONV, SECOND, RESULT
+from maeri.compiler.mapper import TreeMapper, pack, utilization
+from maeri.compiler.codegen import CodeGenerator, indices
+from maeri.compiler.assembler.opcodes import ISA
+from maeri.compiler.assembler.assemble import assemble, program_size
+from maeri.compiler.assembler.timing import TimingModel
+from maeri.compiler.quantize import Quantization, layer_io, channel_max
+from maeri.compiler.cache import hash_arrays
 
 from maeri.compiler.solver import solve_conv
 from maeri.compiler.solver import solve_add
+from maeri.compiler.solver import solve_table
+from maeri.compiler.solver import TilingSolver
+from maeri.compiler.solver import reorder
+from maeri.compiler.solver import multiplier_utilization
 
+from functools import partial
 import numpy as np
+import os
 
 import onnx
 
 class Compile():
-    def __init__(self, model_path, buff_length=128, ports=4, mults=64, wordsize=2):
+    def __init__(self, model_path, buff_length=128, ports=4, mults=64, wordsize=2,
+            batch_size=None, cache=None, compact=False):
+        # a warm cache restores the graph built below, later
+        # stages are restored as they are run again
+        self.cache = cache
+        self.cache_key = None
+        if cache is not None:
+            self.cache_key = cache.key(model_path, buff_length=buff_length,
+                ports=ports, mults=mults, wordsize=wordsize, batch_size=batch_size,
+                compact=compact)
+            state = cache.load(self.cache_key)
+            if state is not None:
+                self.__dict__.update(state)
+                return
+
         self.buff_length = buff_length
         self.ports = ports
         self.mults = mults
+        self.wordsize = wordsize
+        self.solved = False
+        self.passes = None
+        self.memory_map = None
+        self.program = None
+        self.binary = None
+        self.quantization = None
+        self.reconfigurations_saved = None
 
-        model = onnx.load(model_path)
-        model = sanitize(model)
+        # external data is memory mapped when building
+        # memories rather than read in here
+        model = onnx.load(model_path, load_external_data=False)
+        model = sanitize(model, batch_size)
         #onnx.save(model, f"{model_path[:-5]}-sanitized.onnx")
 
         ordered_nodes = schedule(model)
         # TODO : remove name_v_mem from self
-        name_v_mem = build_memories(model)
+        name_v_mem, self.memory_plan = build_memories(model, ordered_nodes,
+            os.path.dirname(model_path))
         self.memories = memories = list(name_v_mem.values())
 
         self.op_graph = op_graph = []
@@ -36,56 +82,461 @@ class Compile():
         self.exitpoint = build_result(model, name_v_mem)
 
         for node in ordered_nodes:
+            for name in list(node.input) + list(node.output):
+                if name and (name not in name_v_mem):
+                    raise RuntimeError(f"No memory for tensor {name} of " +\
+                        f"node {node.name}, was shape inference run?")
+
             if node.op_type == "Conv":
                 logger.debug(f"Compiling Convolutional Node: {node.name}")
+                builder = partial(build_conv, mults=self.mults, ports=self.ports)
+            elif node.op_type == "Add":
+                logger.debug(f"Compiling Add Node: {node.name}")
+                builder = build_add
+            elif node.op_type == "Relu":
+                logger.debug(f"Compiling Relu Node: {node.name}")
+                builder = build_relu
+            else:
+                raise NotImplementedError(f"Compiler does not yet support " +\
+                    f"{node.op_type} nodes such as {node.name}.")
 
-                with LogIndent():
-                    ops_, mems_ = build_conv(node, name_v_mem)
-                    op_graph += ops_
-                    memories += mems_
-                
-                break
+            with LogIndent():
+                ops_, mems_ = builder(node, name_v_mem)
+                op_graph += ops_
+                memories += mems_
+
+        # the op graph can instead be kept as one table,
+        # which solving expands without creating op objects
+        if compact:
+            self.op_graph = OpTable.from_ops(op_graph)
+
+        self.save()
+
+    def save(self):
+        """
+        Stores the compiled state in the cache, if any, under
+        the key of the last stage run.
+        """
+        if self.cache is None:
+            return
+        state = {key : value for key, value in self.__dict__.items() if key != 'cache'}
+        self.cache.store(self.cache_key, state, self.memory_plan)
+
+    def advance(self, stage, *params):
+        """
+        Moves the cache key on past ``stage`` run with
+        ``params``, so that the key of every stage covers
+        every stage before it.
+        """
+        if self.cache is not None:
+            self.cache_key = self.cache.chain(self.cache_key, stage, *params)
+
+    def restore(self, stage, *params):
+        """
+        Advances past ``stage`` and restores the state the
+        cache holds after it. Returns whether it did.
+        """
+        self.advance(stage, *params)
+        if self.cache is None:
+            return False
+        state = self.cache.load(self.cache_key)
+        if state is None:
+            return False
+        self.__dict__.update(state)
+        return True
     
-    def sim(self, data):
+    def sim(self, data, fast=False, observe=None):
+        """
+        Runs the op graph on ``data``. With ``fast`` set, the
+        ops are grouped by the layer they were lowered from
+        and every layer is evaluated at once, otherwise every
+        op is simulated on its own for verification. With
+        ``observe`` set, layers are evaluated at once and
+        ``observe`` is called with every layer after it.
+
+        A quantized model is simulated op by op with the
+        arithmetic of the compute unit, see ``Quantization``.
+        """
         logger.debug("RUNNING SIMULATION")
         with LogIndent():
+            if self.quantization is not None:
+                return self.quantization.sim(self.ops(), self.entrypoint,
+                    self.exitpoint, data, observe)
+
             self.entrypoint.init_root(data)
-            [op.sim() for op in self.op_graph]
+            if observe is not None:
+                for layer in self.layers():
+                    layer.sim()
+                    observe(layer)
+            elif isinstance(self.op_graph, OpTable):
+                self.op_graph.sim(fast)
+            elif fast:
+                layers = dict.fromkeys([op.layer for op in self.op_graph])
+                [layer.sim() for layer in layers]
+            else:
+                [op.sim() for op in self.op_graph]
             return self.exitpoint.get_data()
-    
-    def solve(self):
+
+    def ops(self):
+        """
+        The op objects of the op graph. A table is only solved,
+        reordered and simulated as a whole, so its ops are
+        materialized here one op at a time for quantizing.
+        """
+        if isinstance(self.op_graph, OpTable):
+            return self.op_graph.to_ops()
+        return self.op_graph
+
+    def layers(self):
+        """
+        Whole layers of the op graph, in the order their
+        first ops run.
+        """
+        if isinstance(self.op_graph, OpTable):
+            table = self.op_graph
+            layers, first = np.unique(table.ops['layer'], return_index=True)
+            return [table.layers[layer] for layer in layers[np.argsort(first)] if layer >= 0]
+        return [layer for layer in dict.fromkeys([op.layer for op in self.op_graph])
+            if layer is not None]
+
+    def quantize(self, samples, per_channel=False, input_width=8, headroom=1.25):
+        """
+        Quantizes the model to the ``input_width`` bit integers
+        of the compute unit, see ``Quantization``. The range
+        of every activation is calibrated running ``samples``
+        through ``sim``, per channel with ``per_channel`` set
+        and with ``headroom`` to spare. Weights are rewritten
+        in place and biases corrected for the mean error of
+        the integer model on ``samples``. Returns the error
+        of every layer output against the float model on
+        ``samples``, by name.
+
+        Convolutions gain a bias for the correction and the
+        constant feature biases are weighted against changes,
+        so offsets must be baked again after.
+        """
+        if self.quantization is not None:
+            raise RuntimeError("Model is already quantized.")
+        samples = list(samples)
+        if not samples:
+            raise ValueError("Calibration needs at least one sample.")
+        if self.restore('quantize', hash_arrays(samples), per_channel, input_width, headroom):
+            return self.quantization.report()
+
+        # truncated products leave a mean error only a bias
+        # takes up, convolutions without one get a zero bias
+        # where the tree has room for its weight
+        ops = self.ops()
+        first_ops = {}
+        for op in ops:
+            if (type(op) is Conv2) and (op.res.mem_ref is op.layer.res_mem):
+                first_ops.setdefault(op.layer, []).append(op)
+        for layer, first in first_ops.items():
+            if layer.bias_mem is not None:
+                continue
+            # a bias takes a port of its own next to every
+            # output row the solved ops compute at once
+            rows = lambda op: len(indices(op.res.slice[2], op.res.mem_ref.data.shape[2]))
+            if any([(op.ports_per_row(self.ports, self.mults) + 1)*
+                    (rows(op) if self.solved else 1) > self.ports for op in first]):
+                continue
+            layer.bias_mem = Memory(np.zeros(layer.res_mem.data.shape[1], dtype=np.float32),
+                f"{layer.res_mem.name}_bias")
+            self.memories += [layer.bias_mem]
+            for op in first:
+                op.bias = Input((op.res.slice[1],), layer.bias_mem)
+        if isinstance(self.op_graph, OpTable):
+            self.op_graph = OpTable.from_ops(ops)
+
+        logger.debug("CALIBRATING")
+        entry = self.entrypoint.mem_ref
+        # float outputs of every layer, the integer runs
+        # reuse the arena
+        references = []
+        ranges = {entry : 0}
+        for sample in samples:
+            reference = {}
+            def calibrate(layer):
+                output = layer_io(layer)[1]
+                reference[layer] = np.array(output.data)
+                ranges[output] = np.maximum(ranges.get(output, 0),
+                    channel_max(output.data, per_channel))
+            ranges[entry] = np.maximum(ranges[entry], channel_max(sample, per_channel))
+            self.sim(sample, fast=True, observe=calibrate)
+            references += [reference]
+
+        quantization = Quantization(self.layers(), ops, ranges, entry,
+            per_channel, input_width, headroom)
+
+        # biases are corrected in order, every one against
+        # the outputs of the corrected layers before it
+        for layer in self.layers():
+            if (type(layer) is not ConvLayer) or (layer.bias_mem is None):
+                continue
+            errors = []
+            def difference(observed):
+                if observed is layer:
+                    output = layer_io(layer)[1]
+                    error = quantization.dequantize(output.data, output) - reference[layer]
+                    axes = tuple([axis for axis in range(error.ndim) if axis != 1])
+                    errors.append(error.mean(axis=axes))
+            for sample, reference in zip(samples, references):
+                quantization.sim(ops, self.entrypoint, self.exitpoint, sample, difference)
+            quantization.correct(layer, np.mean(errors, axis=0))
+
+        for sample, reference in zip(samples, references):
+            quantization.sim(ops, self.entrypoint, self.exitpoint, sample,
+                observe=lambda layer: quantization.measure(layer, reference[layer]))
+
+        quantization.apply()
+        self.quantization = quantization
+        # mappings hold the weights they were made with, the
+        # memory map the constant feature
+        self.passes = None
+        self.memory_map = None
+        self.program = None
+
+        report = quantization.report()
+        print(f"Quantized to {input_width} bits per {'channel' if per_channel else 'tensor'}")
+        for name, error in report.items():
+            print(f"    {name:<16} SQNR {error['sqnr']:6.1f} dB, max error {error['max']:.4g}")
+        self.save()
+        return report
+
+    def solve(self, cost_model=None):
+        """
+        Splits ops to fit the hardware. Convolutions are split
+        greedily, or with ``cost_model`` set by the tiling
+        with the lowest cost under it.
+        """
+        if self.solved:
+            logger.debug("GRAPH ALREADY SOLVED")
+            return
+        if self.restore('solve', None if cost_model is None else cost_model.key()):
+            return
+
         logger.debug("SOLVING GRAPH")
         op_graph = self.op_graph
         op_graph_new = []
+        compact = isinstance(op_graph, OpTable)
+        if cost_model is not None:
+            tiler = TilingSolver(self.buff_length, self.ports, self.mults, cost_model)
 
         with LogIndent():
-            for op in op_graph:
-
-                # Solve Conv2 nodes
-                if type(op) is Conv2:
-                    op_graph_new += solve_conv(op, self.buff_length, self.ports, self.mults)
-                elif type(op) is Add:
-                    op_graph_new += solve_add(op, self.buff_length, self.ports)
-                else:
-                    # TODO : should be raising error
-                    op_graph_new += [op]
+            # tables are solved as a whole, the tiling
+            # solver works on the few unsolved op objects
+            if compact and (cost_model is None):
+                op_graph_new = solve_table(op_graph, self.buff_length,
+                    self.ports, self.mults)
+            else:
+                for op in (op_graph.to_ops() if compact else op_graph):
+
+                    # Solve Conv2 nodes
+                    if (type(op) is Conv2) and (cost_model is not None):
+                        solved_ops = tiler.solve(op)
+                    elif type(op) is Conv2:
+                        solved_ops = solve_conv(op, self.buff_length, self.ports, self.mults)
+                    elif type(op) is Add:
+                        solved_ops = solve_add(op, self.buff_length, self.ports)
+                    elif type(op) is Relu:
+                        # relus run over whole tensors as they are
+                        solved_ops = [op]
+                    else:
+                        raise NotImplementedError(f"Compiler can not yet solve " +\
+                            f"{type(op).__name__} ops.")
+
+                    # solved ops belong to the layer of their origin
+                    for solved_op in solved_ops:
+                        solved_op.layer = op.layer
+                    op_graph_new += solved_ops
+
+                if compact:
+                    op_graph_new = OpTable.from_ops(op_graph_new)
         print(f"Original op count : {len(op_graph)}")
         print(f"Final op count : {len(op_graph_new)}")
+        utilization = multiplier_utilization(op_graph_new, self.mults)
+        print(f"Multiplier utilization : {100*utilization:.1f}%")
         self.op_graph = op_graph_new
+        self.solved = True
+        self.save()
     
-    def bake_offsets(self):
-        # first, build the zero node
-        zeros = np.zeros([self.ports, self.buff_length])
+    def reorder(self):
+        """
+        Reorders the solved ops to reconfigure the tree as
+        few times as the dependencies between them allow.
+        Returns the number of reconfigurations saved.
+        """
+        if not self.solved:
+            raise RuntimeError("Graph must be solved before reordering, call Compile.solve().")
+        if self.restore('reorder'):
+            return self.reconfigurations_saved
+
+        self.op_graph, before, after = reorder(self.op_graph)
+        self.passes = None
+        self.program = None
+        self.reconfigurations_saved = before - after
+        print(f"Reconfigurations : {before} -> {after}, saved {before - after}")
+        self.save()
+        return before - after
+
+    def map(self):
+        """
+        Packs the solved convolutions into passes of the
+        reduction tree, every pass computing several output
+        rows or filters on disjoint subtrees. Returns the
+        passes.
+        """
+        if not self.solved:
+            raise RuntimeError("Graph must be solved before mapping, call Compile.solve().")
+        if self.restore('map'):
+            return self.passes
+
+        self.passes = pack(self.op_graph, self.mapper())
+        print(f"Pass count : {len(self.passes)}")
+        print(f"Multiplier utilization per pass : {100*utilization(self.passes):.1f}%")
+        self.save()
+        return self.passes
+
+    def mapper(self):
+        depth = int(np.log2(self.mults)) + 1
+        if 2**(depth - 1) != self.mults:
+            raise RuntimeError(f"mults = {self.mults} is not the leaf count of a tree.")
+        return TreeMapper(depth, self.ports)
+
+    def codegen(self, input_width=8):
+        """
+        Generates the instructions running the mapped op
+        graph on the compute unit. Offsets must be baked
+        first. Returns the ``Program``.
+        """
+        if self.passes is None:
+            self.map()
+        if self.memory_map is None:
+            raise RuntimeError("Offsets must be baked before generating code, " +\
+                "call Compile.bake_offsets().")
+        if self.restore('codegen', input_width):
+            return self.program
+
+        mapper = self.mapper()
+        bits = max(1, int(np.ceil(np.log2(self.memory_map.m_depth))))
+        isa = ISA.for_tree(self.mults, self.ports, -(-bits//8), input_width)
+
+        gains = None
+        if self.quantization is not None:
+            if self.quantization.input_width != input_width:
+                raise RuntimeError(f"Model is quantized to {self.quantization.input_width} " +\
+                    f"bits, not {input_width}.")
+            gains = self.quantization.gains
 
-        # the zeros memory is always the first node
-        # on the memory list
-        self.memories.insert(0, zeros)
+        generator = CodeGenerator(isa, mapper, self.memory_map, self.zeros, self.ones, gains)
+        self.program = generator.generate(self.op_graph, self.passes)
+        print(f"Instruction count : {len(self.program)}")
+        print(f"Eliminated configurations : {sum(self.program.eliminated.values())}")
+        self.save()
+        return self.program
 
-        offset = len(self.memories[0].data.flatten())
-        self.memories[0].offset = 0
+    def assemble(self):
+        """
+        Encodes the generated program as the bytes of device
+        memory from address 0 on. Memories are moved further
+        out if the program outgrows the room left for it.
+        """
+        if self.program is None:
+            raise RuntimeError("Code must be generated before assembling, call Compile.codegen().")
+        if self.restore('assemble'):
+            return self.binary
+        key = self.cache_key
+
+        memory_map = self.memory_map
+        size = program_size(self.program.instructions, self.program.isa,
+            memory_map.b_in_line, memory_map.b_in_packet)
+        if size > memory_map.program_size:
+            # addresses do not change the size of a program
+            self.bake_offsets(memory_map.config, size)
+            self.codegen(self.program.isa.INPUT_WIDTH)
+
+        memory_map = self.memory_map
+        self.binary = assemble(self.program.instructions, self.program.isa, as_bytes=True,
+            bytes_in_line=memory_map.b_in_line, bytes_in_packet=memory_map.b_in_packet)
+        print(f"Program size : {len(self.binary)} bytes")
+        # stored as what assembling after the stages before gives
+        self.cache_key = key
+        self.save()
+        return self.binary
+
+    def estimate(self, host_period=None):
+        """
+        Predicts how long the assembled program takes on the
+        compute unit, see ``TimingModel``. Returns the
+        ``Timing``.
+        """
+        binary = self.assemble()
+        model = TimingModel(self.program.isa, self.memory_map.b_in_line,
+            self.wordsize, host_period)
+        timing = model.predict(binary)
+        print(f"Predicted cycles : {timing.total}")
+        print(f"Predicted time : {1e3*timing.seconds:.3f} ms")
+        return timing
+
+    def bake_offsets(self, config, program_size=0):
+        """
+        Assigns every memory an aligned address range in
+        device memory. ``config`` is the device configuration
+        from the driver's ``get_config`` and ``program_size``
+        the number of bytes reserved for the program at
+        address 0.
+        """
+        self.advance('bake_offsets', sorted(config.items()), program_size)
+        memory_map = MemoryMap(config, self.wordsize, program_size)
+        plan = self.memory_plan
+
+        # the zeros memory is always the first memory
+        # after the program, followed by the constant feature
+        # folded biases are weighted against, the largest
+        # feature of a quantized model standing for a one
+        self.zeros = Memory(np.zeros([self.ports, self.buff_length]), "zeros")
+        memory_map.append("zeros", self.zeros)
+        one = 1 if self.quantization is None else self.quantization.high
+        self.ones = Memory(np.full([1, self.buff_length], one), "ones")
+        memory_map.append("ones", self.ones)
+
+        # convolutions store the leading sums of every row
+        # in front of it
+        table = self.op_graph
+        if not isinstance(table, OpTable):
+            table = OpTable.from_ops(table)
         for memory in self.memories:
-            memory.offset = offset
-            offset = len(memory.data.flatten())
+            memory.lead = 0
+        conv = table.ops[table.ops['opcode'] == CONV]
+        leads = conv['stop'][:, SECOND, 3] - conv['start'][:, SECOND, 3] - 1
+        for tensor, lead in zip(conv['tensor'][:, RESULT].tolist(), leads.tolist()):
+            memory = table.memories[tensor]
+            memory.lead = max(memory.lead, lead)
+
+        # constants are uploaded once, so keep them next to
+        # each other to upload them with a single transfer
+        activations = []
+        scratch = []
+        for memory in self.memories:
+            if memory.name in plan.dims:
+                activations += [memory]
+            elif memory.name is not None:
+                memory_map.append("constant", memory)
+            else:
+                scratch += [memory]
+
+        # scratch memories from lowering live for the
+        # whole program
+        for memory in scratch:
+            memory_map.append("scratch", memory)
+
+        # activations share device memory just as they
+        # share the host arena
+        memory_map.pack("activation", activations, plan.overlaps)
+        memory_map.finalize()
+
+        self.memory_map = memory_map
+        return memory_map
     
     def debug(self):
         op_graph = self.op_graph
@@ -0,0 +1,470 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.common.skeleton import Skeleton
+from maeri.compiler.assembler.states import ConfigUp, ConfigForward, InjectEn
+from maeri.compiler.op_table import OpTable, CONV, FIRST
+from maeri.compiler.codegen import indices
+from maeri.compiler.solver.reorder import dependencies
+
+import numpy as np
+
+# adder states by value, see ``maeri.compiler.assembler.states``
+SUM = ConfigUp.sum_l_r
+FORWARD_SUM = ConfigForward.sum_l_r
+SUM_FORWARDED = ConfigUp.sum_l_r_f
+UP_LEFT = ConfigUp.l
+UP_RIGHT = ConfigUp.r
+state_v_value = {int(state) : state for state in
+    [SUM, FORWARD_SUM, SUM_FORWARDED, UP_LEFT, UP_RIGHT]}
+
+def wrap(values, width):
+    """
+    ``values`` wrapped around to ``width`` bit two's
+    complement integers.
+    """
+    half = 2**(width - 1)
+    return ((np.asarray(values, dtype=np.int64) + half) & (2*half - 1)) - half
+
+class TreeMapping():
+    def __init__(self, starts, lengths, ports, taps, states, weights, collectors):
+        """
+        Configuration of the reduction tree computing several
+        dot products, or virtual neurons, at once.
+
+        Attributes:
+        ===========
+        self.starts:
+            first multiplier of every neuron, neurons take up
+            contiguous groups of the multipliers behind a port
+        self.lengths:
+            number of multipliers of every neuron
+        self.ports:
+            for every neuron, the port injecting every row
+            of its weights
+        self.taps:
+            number of weights of every neuron
+        self.states:
+            state of every node of the tree by node id,
+            ``ConfigUp`` or ``ConfigForward`` states of the
+            adders followed by the ``InjectEn`` states of
+            the multipliers
+        self.weights:
+            weight of every multiplier, unused multipliers
+            hold zero
+        self.collectors:
+            id of the adder whose sum is collected for every
+            neuron
+        """
+        self.starts = starts
+        self.lengths = lengths
+        self.ports = ports
+        self.taps = taps
+        self.states = states
+        self.weights = weights
+        self.collectors = collectors
+
+    @property
+    def utilization(self):
+        return sum(self.taps)/len(self.weights)
+
+class TreeMapper():
+    def __init__(self, depth, num_ports):
+        """
+        Maps dot products onto disjoint ranges of the
+        multipliers of a reduction tree of ``depth``. A
+        neuron whose range straddles two subtrees is reduced
+        over the forwarding link between them.
+
+        Every port injects into the rightmost multiplier of
+        its group of ``num_leaves//num_ports``, the others
+        read their right neighbour a cycle late.
+        """
+        # config groups play no part in mapping
+        self.skeleton = skeleton = Skeleton(depth, num_ports, bytes_in_line=1)
+        self.num_ports = num_ports
+        self.num_adders = len(skeleton.adder_nodes)
+        self.num_leaves = len(skeleton.mult_nodes)
+
+        # nodes are addressed by heap index, node id + 1,
+        # the children of node n are 2n and 2n + 1
+        self.partner = np.full(self.num_leaves, -1)
+        for left, right in skeleton.adder_forwarding_links:
+            self.partner[left.id + 1] = right.id + 1
+            self.partner[right.id + 1] = left.id + 1
+
+        self.group = self.num_leaves//num_ports
+        self.port_by_leaf = np.full(self.num_leaves, -1)
+        for port, node in enumerate(skeleton.inject_nodes):
+            self.port_by_leaf[node.id - self.num_adders] = port
+
+        # layouts only depend on the neuron lengths
+        self.layouts = {}
+
+    def feeds(self, inject):
+        """
+        Port feeding every multiplier and the number of cycles
+        its features lag the port by, for the ``InjectEn``
+        state ``inject`` of every multiplier. ``num_ports``
+        stands for an undriven input, which reads zero.
+        """
+        source = np.full(self.num_leaves, self.num_ports)
+        delay = np.zeros(self.num_leaves, dtype=int)
+        port = self.num_ports
+        lag = 0
+        for leaf in reversed(range(self.num_leaves)):
+            if inject[leaf]:
+                port = self.port_by_leaf[leaf] if self.port_by_leaf[leaf] >= 0 else self.num_ports
+                lag = 0
+            else:
+                lag += 1
+            source[leaf] = port
+            delay[leaf] = lag
+        return source, delay
+
+    def route(self, neuron, lengths):
+        """
+        Chooses the state of every adder for the neuron of
+        every multiplier in ``neuron``, -1 where unused.
+        Returns the states by heap index and the heap index
+        of the adder completing every neuron, or None when
+        the neurons can not be reduced apart.
+        """
+        leaves = self.num_leaves
+        up = np.concatenate([np.full(leaves, -1), neuron])
+        count = np.concatenate([np.zeros(leaves, dtype=int), (neuron >= 0).astype(int)])
+        states = np.full(leaves, int(SUM))
+        collect = np.full(len(lengths), -1)
+
+        # first and last multiplier of every neuron
+        used = np.flatnonzero(neuron >= 0)
+        first = np.full(len(lengths), leaves)
+        last = np.full(len(lengths), -1)
+        np.minimum.at(first, neuron[used], used)
+        np.maximum.at(last, neuron[used], used)
+
+        level = leaves//2
+        while level >= 1:
+            forwards = {}
+            for node in range(level, 2*level):
+                a, b = up[2*node], up[2*node + 1]
+                count_a, count_b = count[2*node], count[2*node + 1]
+
+                # zero products add to any neuron
+                if (a < 0) or (b < 0) or (a == b):
+                    up[node], count[node] = max(a, b), count_a + count_b
+                    continue
+
+                # a complete neuron was collected below
+                if count_a == lengths[a]:
+                    states[node], up[node], count[node] = UP_RIGHT, b, count_b
+                elif count_b == lengths[b]:
+                    states[node], up[node], count[node] = UP_LEFT, a, count_a
+
+                # the left neuron continues left and the right
+                # one right, one leaves over the forwarding link
+                elif self.partner[node] < 0:
+                    return None
+                elif self.partner[node] < node:
+                    states[node], up[node], count[node] = UP_RIGHT, b, count_b
+                    forwards[self.partner[node]] = (a, count_a)
+                else:
+                    states[node], up[node], count[node] = UP_LEFT, a, count_a
+                    forwards[self.partner[node]] = (b, count_b)
+
+            # the partner adds the forwarded sum to its own
+            for node, (forwarded, forwarded_count) in forwards.items():
+                if states[node] != SUM or up[node] not in (-1, forwarded):
+                    return None
+                states[node] = SUM_FORWARDED
+                up[node] = forwarded
+                count[node] += forwarded_count
+
+            # neighbours summing parts of one neuron join them
+            # early, leaving one of them free to carry another.
+            # The neuron is kept on the side it continues to.
+            span = leaves//level
+            for node in range(level, 2*level):
+                partner = self.partner[node]
+                if (partner < node) or (up[node] < 0) or (up[node] != up[partner]) or\
+                        (states[node] != SUM) or (states[partner] != SUM) or\
+                        (count[node] == lengths[up[node]]):
+                    continue
+                if (first[up[node]] >= (node - level)*span) and\
+                        (last[up[node]] >= (partner - level + 1)*span):
+                    sender, receiver = node, partner
+                else:
+                    sender, receiver = partner, node
+                states[sender], states[receiver] = FORWARD_SUM, SUM_FORWARDED
+                count[receiver] += count[sender]
+                up[sender], count[sender] = -1, 0
+
+            for node in range(level, 2*level):
+                if (up[node] >= 0) and (count[node] == lengths[up[node]]) and\
+                        (collect[up[node]] < 0):
+                    collect[up[node]] = node
+            level //= 2
+
+        if (collect < 0).any():
+            return None
+        return states, collect
+
+    def reduce(self, states, products, width=None):
+        """
+        Sums of every adder for the multiplier ``products``,
+        of shape (..., leaves), with the adders in ``states``
+        by node id. Returns the up sums by adder node id,
+        of shape (..., adders).
+
+        With ``width`` given, products are integers and every
+        adder wraps around to ``width`` bits as the adders of
+        the compute unit do.
+        """
+        if width is None:
+            limit = lambda values: values
+            dtype = float
+        else:
+            limit = lambda values: wrap(values, width)
+            dtype = np.int64
+        products = np.asarray(products, dtype=dtype)
+        states = np.concatenate([[int(SUM)], np.asarray(states[:self.num_adders], dtype=int)])
+        sums = np.zeros(products.shape, dtype=dtype)
+        lower = products
+
+        level = self.num_leaves//2
+        while level >= 1:
+            nodes = np.arange(level, 2*level)
+            state = states[nodes]
+            left, right = lower[..., 0::2], lower[..., 1::2]
+
+            forward = limit(np.select([state == FORWARD_SUM, state == UP_LEFT, state == UP_RIGHT],
+                [left + right, right, left], 0))
+            partner = self.partner[nodes]
+            forward_in = np.where(partner >= 0, forward[..., np.maximum(partner - level, 0)], 0)
+
+            sums[..., nodes] = limit(np.select(
+                [state == SUM, state == SUM_FORWARDED, state == UP_LEFT, state == UP_RIGHT],
+                [left + right, left + right + forward_in, left, right], 0))
+            lower = sums[..., nodes]
+            level //= 2
+
+        return sums[..., 1:]
+
+    def layout(self, lengths):
+        """
+        Places neurons of ``lengths`` left to right, every one
+        at the first group of multipliers it can be reduced
+        from. Returns
+        the first multiplier of every neuron, the adder states
+        and collected adders by heap index, or None when they
+        do not fit.
+        """
+        lengths = tuple(lengths)
+        if lengths in self.layouts:
+            return self.layouts[lengths]
+
+        layout = None
+        if len(lengths) <= self.num_ports:
+            neuron = np.full(self.num_leaves, -1)
+            starts = []
+            routed = None
+            for index, length in enumerate(lengths):
+                assert(length >= 2)
+                begin = (starts[-1] + lengths[index - 1]) if starts else 0
+                routed = None
+                for start in range(begin, self.num_leaves - length + 1, self.group):
+                    trial = neuron.copy()
+                    trial[start:start + length] = index
+                    routed = self.route(trial, lengths[:index + 1])
+                    if routed is not None:
+                        break
+                if routed is None:
+                    break
+                neuron = trial
+                starts += [start]
+
+            if routed is not None:
+                layout = (starts, *routed)
+                self.verify(neuron, *routed)
+
+        self.layouts[lengths] = layout
+        return layout
+
+    def verify(self, neuron, states, collect):
+        # every leaf is a product of its own, the collected
+        # sums must hold exactly the leaves of their neuron
+        used = neuron >= 0
+        sums = self.reduce(states[1:], np.diag(used.astype(float)))
+        for index, node in enumerate(collect):
+            assert((sums[:, node - 1] == (neuron == index)).all())
+
+    def map(self, neurons):
+        """
+        Maps every neuron of ``neurons``, given as rows of
+        weights, to its own range of multipliers. Every row
+        is chained on the multipliers fed by one port, over
+        as many groups as it needs, the groups before the
+        last not injecting. The multiplier ``d`` places left
+        of the injecting one reads the port ``d`` cycles late
+        and holds ``row[-1 - d]``, so the sum of a row of
+        ``K`` weights collected at entry ``j + K - 1`` is the
+        row correlated with features ``j`` to ``j + K - 1``.
+        Returns a ``TreeMapping`` or None when they do not
+        fit the tree at once.
+        """
+        group = self.group
+        spans = [[-(-np.size(row)//group) for row in rows] for rows in neurons]
+        if sum(map(sum, spans)) > self.num_ports:
+            return None
+        lengths = [group*sum(span) for span in spans]
+        layout = self.layout(lengths)
+        if layout is None:
+            return None
+
+        starts, states, collect = layout
+        weights = np.zeros(self.num_leaves)
+        inject = self.port_by_leaf >= 0
+        ports = []
+        taps = []
+        for start, rows, span in zip(starts, neurons, spans):
+            end = start
+            ports += [[]]
+            for row, groups in zip(rows, span):
+                row = np.ravel(row)
+                end += groups*group
+                weights[end - len(row):end] = row
+                inject[end - groups*group:end - 1] = False
+                ports[-1] += [self.port_by_leaf[end - 1]]
+                taps += [(end - len(row), end, ports[-1][-1])]
+
+        # every weight must read its own row, as late as it
+        # lies left of the injecting multiplier
+        source, delay = self.feeds(inject)
+        for begin, end, port in taps:
+            assert((source[begin:end] == port).all())
+            assert((delay[begin:end] == np.arange(end - begin)[::-1]).all())
+
+        node_states = [state_v_value[int(state)] for state in states[1:]]
+        node_states += [InjectEn.on if enabled else InjectEn.off for enabled in inject]
+        collectors = [int(node) - 1 for node in collect]
+        counts = [sum([np.size(row) for row in rows]) for rows in neurons]
+        return TreeMapping(starts, lengths, ports, counts, node_states, weights, collectors)
+
+class Pass():
+    def __init__(self, ops, neurons, mapping):
+        """
+        Ops run with one configuration of the tree.
+
+        Attributes:
+        ===========
+        self.ops:
+            indices of the ops in the op graph
+        self.neurons:
+            (op index, output row) of every neuron of
+            ``mapping``, empty for ops other than convolutions
+        self.mapping:
+            ``TreeMapping`` of the pass, None for ops other
+            than convolutions
+        """
+        self.ops = ops
+        self.neurons = neurons
+        self.mapping = mapping
+
+def conv_neurons(op):
+    """
+    Rows of weights of every output row an op computes at
+    once, see ``TreeMapper.map``. Every filter row of every
+    channel takes a port of its own, the filter rows of a
+    channel a ring of ports, padded input row ``g`` going
+    to position ``g % filter_depth`` of it, so that the
+    next op finds the rows it shares with this one in
+    place. A folded bias is a row of its own, weighted
+    against the constant feature of the ones memory.
+    """
+    W = op.W.get_data()
+    W = W.reshape((-1,) + W.shape[-2:])
+    depth = W.shape[1]
+
+    neurons = []
+    shape = op.res.mem_ref.data.shape
+    for row in indices(op.res.slice[2], shape[2]):
+        rows = [W[channel, (position - row) % depth]
+            for channel in range(len(W)) for position in range(depth)]
+        if op.bias is not None:
+            rows += [np.ravel(op.bias.get_data())]
+        neurons += [rows]
+    return neurons
+
+def pack(op_graph, mapper):
+    """
+    Packs the solved conv ops of ``op_graph``, a list of ops
+    or an ``OpTable``, into passes. Conv ops reading the same
+    input window share a pass while their neurons fit the
+    tree and the dependencies let them run together. A pass
+    runs at the position of its first op.
+
+    Dependencies are found on the table as a whole, but the
+    neurons of every conv op are built from its ``OpView``.
+    """
+    logger.debug("PACKING OPS INTO PASSES")
+    with LogIndent():
+        table = op_graph if isinstance(op_graph, OpTable) else OpTable.from_ops(op_graph)
+        ops = table.ops
+        src, dst = dependencies(ops, table.memories)
+        by_dst = np.argsort(dst, kind='stable')
+        bounds = np.searchsorted(dst[by_dst], np.arange(len(ops) + 1))
+
+        passes = []
+        position = np.zeros(len(ops), dtype=int)
+        open_passes = {}
+        for index in range(len(ops)):
+            op = op_graph[index]
+            if ops['opcode'][index] != CONV:
+                position[index] = len(passes)
+                passes += [Pass([index], [], None)]
+                continue
+
+            neurons = conv_neurons(op)
+            rows = list(range(len(neurons)))
+            key = (int(ops['tensor'][index, FIRST]), ops['start'][index, FIRST].tobytes(),
+                ops['stop'][index, FIRST].tobytes(), ops['pad'][index].tobytes(),
+                int(ops['resident'][index]), len(neurons))
+
+            # the op runs with an earlier pass only if all
+            # the ops it depends on ran before that pass
+            candidate = open_passes.get(key)
+            if candidate is not None:
+                predecessors = src[by_dst[bounds[index]:bounds[index + 1]]]
+                if (position[predecessors] < candidate).all():
+                    current = passes[candidate]
+                    mapping = mapper.map(pass_neurons(op_graph, current) + neurons)
+                    if mapping is not None:
+                        current.ops += [index]
+                        current.neurons += [(index, row) for row in rows]
+                        current.mapping = mapping
+                        position[index] = candidate
+                        continue
+
+            mapping = mapper.map(neurons)
+            if mapping is None:
+                raise RuntimeError(f"Op {index} of {len(neurons)} rows of " +\
+                    f"{sum(map(np.size, neurons[0]))} weights does not fit the tree.")
+            position[index] = len(passes)
+            open_passes[key] = len(passes)
+            passes += [Pass([index], [(index, row) for row in rows], mapping)]
+
+        logger.debug(f"{len(ops)} ops in {len(passes)} passes")
+
+    return passes
+
+def pass_neurons(op_graph, pass_):
+    neurons = []
+    for index in pass_.ops:
+        neurons += conv_neurons(op_graph[index])
+    return neurons
+
+def utilization(passes):
+    """
+    Fraction of multipliers holding a weight, averaged over
+    the passes of convolutions.
+    """
+    mapped = [pass_.mapping.utilization for pass_ in passes if pass_.mapping is not None]
+    return sum(mapped)/len(mapped) if mapped else 0.0
@@ -0,0 +1,157 @@
+from maeri.common.logger import logger, LogIndent
+from maeri.compiler.build_graph.plan_memories import first_fit_decreasing, align
+
+import numpy as np
+
+class Region():
+    def __init__(self, kind, memory, address, size):
+        self.kind = kind
+        self.memory = memory
+        self.address = address
+        self.size = size
+
+class MemoryMap():
+    def __init__(self, config, wordsize=1, program_size=0):
+        """
+        Lays out ``Memory`` instances in device memory.
+
+        ``config`` is the device configuration reported by
+        the driver's ``get_config``. Every memory begins on
+        a line and packet boundary so that it can be written
+        with the driver's packet sized transfers.
+
+        Attributes:
+        ===========
+        self.config:
+            the device configuration
+        self.b_in_line:
+            bytes in one line of device memory
+        self.b_in_packet:
+            bytes in one packet sent to the device
+        self.m_depth:
+            number of lines in device memory
+        self.wordsize:
+            bytes per tensor element in device memory
+        self.alignment:
+            byte alignment of every region
+        self.regions:
+            list of ``Region`` sorted by address
+        self.size:
+            number of bytes spanned by all regions
+        """
+        self.config = config
+        self.b_in_line = config['b_in_line']
+        self.b_in_packet = config['b_in_packet']
+        self.m_depth = config['m_depth']
+        self.wordsize = wordsize
+
+        self.alignment = int(np.lcm(self.b_in_line, self.b_in_packet))
+        self.regions = []
+        self.size = align(program_size, self.alignment)
+        self.program_size = self.size
+
+    def nbytes(self, memory):
+        return align(self.elements(memory)*self.wordsize, self.alignment)
+
+    def elements(self, memory):
+        """
+        Number of elements ``memory`` spans in device memory,
+        slack in front of its rows included.
+        """
+        width = memory.data.shape[-1] if memory.data.ndim else 1
+        return memory.data.size + (memory.data.size//max(width, 1))*memory.lead
+
+    def place(self, kind, memory, address):
+        memory.offset = address
+        memory.itemsize = self.wordsize
+        self.regions += [Region(kind, memory, address, self.nbytes(memory))]
+        self.size = max(self.size, address + self.nbytes(memory))
+
+    def append(self, kind, memory):
+        self.place(kind, memory, self.size)
+
+    def pack(self, kind, memories, overlaps):
+        """
+        Places ``memories`` after the current regions,
+        letting memories that are never live together,
+        according to ``overlaps``, share addresses.
+        """
+        base = self.size
+        sizes = {memory.name : self.nbytes(memory) for memory in memories}
+        offsets, _ = first_fit_decreasing(sizes, overlaps, self.alignment)
+
+        for memory in memories:
+            self.place(kind, memory, base + offsets[memory.name])
+
+    def finalize(self):
+        self.regions.sort(key=lambda region: region.address)
+        capacity = self.m_depth*self.b_in_line
+        if self.size > capacity:
+            raise RuntimeError(f"Memory map of {self.size} bytes exceeds " +\
+                f"device memory of {capacity} bytes.")
+
+        logger.debug("MEMORY MAP")
+        with LogIndent():
+            for region in self.regions:
+                logger.debug(f"{region.kind} {region.memory.name} : " +\
+                    f"line {self.line_address(region.memory)} : {region.size} bytes")
+
+    def line_address(self, memory):
+        return memory.offset//self.b_in_line
+
+    def encode(self, memory):
+        """
+        Returns the bytes of ``memory`` as stored on the
+        device, padded to the region size.
+        """
+        data = np.zeros(self.nbytes(memory), dtype=np.uint8)
+        words = np.rint(memory.data).astype(f"<i{self.wordsize}")
+        if memory.lead:
+            words = words.reshape(-1, words.shape[-1])
+            words = np.pad(words, [(0, 0), (memory.lead, 0)])
+        words = words.flatten()
+        data[:words.nbytes] = words.view(np.uint8)
+        return data
+
+    def decode(self, memory, data):
+        """
+        Returns the elements of ``memory`` from the bytes of
+        its region, stored as ``encode`` stores them.
+        """
+        count = self.elements(memory)
+        words = np.frombuffer(bytes(data), dtype=f"<i{self.wordsize}", count=count)
+        if memory.lead:
+            words = words.reshape(-1, memory.data.shape[-1] + memory.lead)[:, memory.lead:]
+        return words.reshape(memory.data.shape)
+
+    def transfers(self, memories):
+        """
+        Coalesces the regions of ``memories`` that are
+        adjacent in device memory into as few transfers as
+        possible. Returns a list of (line address, bytes)
+        pairs ready to be handed to the driver's ``write``.
+        """
+        memories = {id(memory) for memory in memories}
+        regions = [region for region in self.regions
+            if id(region.memory) in memories]
+
+        transfers = []
+        start = None
+        chunks = []
+        end = None
+        for region in regions:
+            if (start is not None) and (region.address != end):
+                transfers += [(start//self.b_in_line, np.concatenate(chunks))]
+                start = None
+
+            if start is None:
+                start = region.address
+                chunks = []
+
+            chunks += [self.encode(region.memory)]
+            end = region.address + region.size
+
+        if start is not None:
+            transfers += [(start//self.b_in_line, np.concatenate(chunks))]
+
+        return transfers
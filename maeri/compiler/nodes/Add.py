@@ -1,12 +1,15 @@
 from maeri.common.logger import LogIndent, logger
 from .Output import Output
 from .Input import Input
+import logging
 
 class Add():
     def __init__(self, A, B, C):
         self.A = A
         self.B = B
         self.C = C
+        # whole layer this op was lowered from
+        self.layer = None
     
     def split(self):
         raise NotImplementedError()
@@ -16,10 +19,12 @@ class Add():
         B = self.B.get_data()
         self.C.write_data(A + B)
 
-        logger.debug("EXECUTING ADD")
-        logger.debug(f"A = \n{A}")
-        logger.debug(f"B = \n{B}")
-        logger.debug(f"res = \n{A + B}")
+        # formatting arrays is costly, only do it when asked
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("EXECUTING ADD")
+            logger.debug(f"A = \n{A}")
+            logger.debug(f"B = \n{B}")
+            logger.debug(f"res = \n{A + B}")
     
     def split_to_buff_lengths(self, buff_length):
         length_A = self.A.slice[3].stop - self.A.slice[3].start
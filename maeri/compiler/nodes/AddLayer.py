@@ -0,0 +1,16 @@
+from maeri.common.logger import LogIndent, logger
+import numpy as np
+
+class AddLayer():
+    def __init__(self, A_mem, B_mem, C_mem):
+        """
+        Whole layer view of an elementwise add, used to
+        evaluate every op lowered from it at once.
+        """
+        self.A_mem = A_mem
+        self.B_mem = B_mem
+        self.C_mem = C_mem
+
+    def sim(self):
+        logger.debug("EXECUTING ADD LAYER")
+        np.add(self.A_mem.data, self.B_mem.data, out=self.C_mem.data)
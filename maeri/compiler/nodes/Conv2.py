@@ -3,88 +3,158 @@ from scipy.signal import correlate2d
 from .Output import Output
 from .Input import Input
 import numpy as np
+import logging
+
+def correlate(X, W, pad, bias=None, verbose=False):
+    """
+    Correlates ``X`` of shape (batch, channel, height, width)
+    with ``W`` of shape (channel, height, width) after padding
+    ``X`` by ``pad``, given as [left, upper, right, bottom].
+    Channels are reduced together and the same filter is
+    applied to every image of the batch.
+    """
+    pad_left, pad_upper, pad_right, pad_bottom = pad
+
+    # pad the height and width of the input
+    x_shape = list(X.shape)
+    x_shape[-2] += pad_upper + pad_bottom
+    x_shape[-1] += pad_left + pad_right
+    X_padded = np.zeros(x_shape)
+
+    # form slice where data will be placed in x_padded
+    slice_h = slice(pad_upper, x_shape[-2] - pad_bottom)
+    slice_w = slice(pad_left, x_shape[-1] - pad_right)
+    X_padded[..., slice_h, slice_w] = X
+    if verbose:
+        logger.debug(f"X = \n{X_padded}")
+        logger.debug(f"W = \n{W}")
+
+    res = np.stack([sum([correlate2d(channel, W_channel, mode='valid')
+        for channel, W_channel in zip(image, W)]) for image in X_padded])
+    if bias is not None:
+        res += bias
+    return res
+
+def input_window(begin, end, pad_before, input_len, filter_len):
+    """
+    Outputs ``begin:end`` along one axis read the padded
+    inputs ``begin:end + filter_len - 1``. Returns the range
+    of those that lie within the ``input_len`` long input,
+    and the number that lie in the padding before and
+    after it.
+    """
+    stop = end + filter_len - 1
+    input_begin = min(max(begin - pad_before, 0), input_len)
+    input_end = min(max(stop - pad_before, 0), input_len)
+    pad_low = min(max(pad_before - begin, 0), stop - begin)
+    pad_high = (stop - begin) - (input_end - input_begin) - pad_low
+    return input_begin, input_end, pad_low, pad_high
+
+def split_evenly(length, parts):
+    """
+    Splits ``range(length)`` into ``parts`` ranges whose
+    lengths differ by at most one.
+    """
+    bounds = [(length*index)//parts for index in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def ports_per_row(channels, filter_depth, filter_width, bias, no_ports, mults):
+    """
+    Injection ports one output row of a convolution takes
+    up. Every filter row of every channel is chained on the
+    multipliers behind one port, over as many groups of
+    ``mults//no_ports`` as it needs, and a folded bias takes
+    a port of its own. Works on arrays alike.
+    """
+    group = mults//no_ports
+    return channels*filter_depth*(-(-filter_width//group)) + bias
 
 class Conv2():
-    def __init__(self, X, W, res, pad):
+    def __init__(self, X, W, res, pad, bias=None):
         self.X = X
         self.W = W
         self.res = res
+        # bias is folded into the accumulation, as a weight
+        # of its own applied to the constant feature loaded
+        # from the ones memory, see ``Compile.bake_offsets``
+        self.bias = bias
+        # whole layer this op was lowered from
+        self.layer = None
+        # input rows of every output row left in the
+        # injection buffers by the previous op, which are
+        # not loaded again
+        self.resident = 0
 
         self.pad_left = pad[0]
         self.pad_upper = pad[1]
         self.pad_right = pad[2]
         self.pad_bottom = pad[3]
     
-    def split_to_ports(self, no_ports):
+    def rows_per_pass(self, no_ports, mults=None):
+        """
+        Number of output rows computed at once, each taking
+        up ``ports_per_row`` ports of its own.
+        Without ``mults``, one row is computed per pass.
+        """
+        if mults is None:
+            return 1
+        return max(1, no_ports//self.ports_per_row(no_ports, mults))
+
+    def ports_per_row(self, no_ports, mults):
+        channels = self.X.slice[1].stop - self.X.slice[1].start
+        filter_depth = self.W.slice[2].stop - self.W.slice[2].start
+        filter_width = self.W.slice[3].stop - self.W.slice[3].start
+        return ports_per_row(channels, filter_depth, filter_width,
+            int(self.bias is not None), no_ports, mults)
+
+    def split_to_ports(self, no_ports, mults=None):
         op_graph = []
-        input_depth = (self.X.slice[2].stop - self.X.slice[2].start)
-
-        # probably already checked this actually...
-        # but again, only allowing square filters and
-        # by extension, square padding
-        assert(self.pad_upper == self.pad_bottom)
+        X_slice = self.X.slice
+        res_slice = self.res.slice
+        input_depth = (X_slice[2].stop - X_slice[2].start)
+        output_depth = (res_slice[2].stop - res_slice[2].start)
 
-        # check that effective filter fits within the 
-        # number of ports, where the effective filter considers
-        # padding
-        filter_depth = self.W.mem_ref.data.shape[2]
-        effective_depth = filter_depth + self.pad_bottom + self.pad_upper
-        assert(effective_depth <= no_ports)
+        # every op reads the rows of one window, taking
+        # rows beyond the input from the padding, so the
+        # filter must fit within the number of ports
+        filter_depth = self.W.slice[2].stop - self.W.slice[2].start
+        assert(filter_depth <= no_ports)
+        assert(output_depth == input_depth + self.pad_upper + self.pad_bottom - filter_depth + 1)
 
         # we must split the operator input field depthwise
-        # into new inputs
-
-        # we first handle padding above the input field
-        offset = filter_depth - self.pad_upper
-        for padding in range(self.pad_upper):
-            input_slice = slice(0, padding + offset)
-            input_slice = (self.X.slice[0], self.X.slice[1], input_slice, self.X.slice[3])
+        # into new inputs, packing as many output rows into
+        # every op as the ports and multipliers allow. Every
+        # output row holds the filter rows of a channel on a
+        # ring of ports, the same row of the next op lies
+        # ``rows`` further down and finds all but as many of
+        # its input rows in place.
+        rows = self.rows_per_pass(no_ports, mults)
+        for row in range(0, output_depth, rows):
+            row_end = min(row + rows, output_depth)
+            begin, end, pad_upper, pad_bottom = input_window(row, row_end,
+                self.pad_upper, input_depth, filter_depth)
+
+            input_slice = slice(X_slice[2].start + begin, X_slice[2].start + end)
+            input_slice = (X_slice[0], X_slice[1], input_slice, X_slice[3])
             X_input = Input(input_slice, self.X.mem_ref)
 
-            output_slice = (self.res.slice[0], self.res.slice[1], padding, self.res.slice[3])
+            output_rows = res_slice[2].start + row
+            if (row_end - row) > 1:
+                output_rows = slice(output_rows, res_slice[2].start + row_end)
+            output_slice = (res_slice[0], res_slice[1], output_rows, res_slice[3])
             res = Output(output_slice, self.res.mem_ref)
 
-            pad = [self.pad_left, self.pad_upper - padding, self.pad_right, 0]
-
-            op_graph += [Conv2(X_input, self.W, res, pad)]
-
-        # now we handle the input field
-        out_inner_len = input_depth - filter_depth + 1
-
-        for index in range(out_inner_len):
-            input_slice = slice(index, index + filter_depth)
-            input_slice = (self.X.slice[0], self.X.slice[1], input_slice, self.X.slice[3])
-            X_input = Input(input_slice, self.X.mem_ref)
-
-            output_slice = (self.res.slice[0], self.res.slice[1], index + self.pad_upper, self.res.slice[3])
-            res = Output(output_slice, self.res.mem_ref)
+            pad = [self.pad_left, pad_upper, self.pad_right, pad_bottom]
 
-            pad = [self.pad_left, 0, self.pad_right, 0]
-
-            op_graph += [Conv2(X_input, self.W, res, pad)]
-
-        # last, we handle padding below the input field
-        for padding in range(self.pad_bottom):
-            if padding == (filter_depth - 1):
-                input_slice = input_depth - 1
-            else:
-                input_slice = slice(out_inner_len + padding, input_depth)
-
-            input_slice = (self.X.slice[0], self.X.slice[1], input_slice, self.X.slice[3])
-            X_input = Input(input_slice, self.X.mem_ref)
-
-            output_slice = (self.res.slice[0], self.res.slice[1], out_inner_len + self.pad_upper + padding, self.res.slice[3])
-            res = Output(output_slice, self.res.mem_ref)
-
-            pad = [self.pad_left, 0, self.pad_right, padding + 1]
-
-            op_graph += [Conv2(X_input, self.W, res, pad)]
+            op = Conv2(X_input, self.W, res, pad, self.bias)
+            op.resident = max(filter_depth - rows, 0) if row else 0
+            op_graph += [op]
         
         return op_graph
     
     def split_left_right(self):
         op_graph = []
-        filter_width = self.W.mem_ref.data.shape[2]
+        filter_width = self.W.slice[3].stop - self.W.slice[3].start
         input_shape = self.X.slice[3].stop - self.X.slice[3].start
         inner_output_len = input_shape - filter_width + 1
         
@@ -123,11 +193,13 @@ class Conv2():
         logger.debug(f"X_slice_right = {X_slice_right}")
         X_input_right = Input(X_slice_right, self.X.mem_ref)
 
-        # schedule convolution operators
+        # schedule convolution operators, the right half
+        # first, the leading sums it stores left of its
+        # columns are overwritten by the left half
         pad_left = [self.pad_left, self.pad_upper, 0, self.pad_bottom]
-        op_graph += [Conv2(X_input_left, self.W, left_res, pad_left)]
         pad_right = [0, self.pad_upper, self.pad_right, self.pad_bottom]
-        op_graph += [Conv2(X_input_right, self.W, right_res, pad_right)]
+        op_graph += [Conv2(X_input_right, self.W, right_res, pad_right, self.bias)]
+        op_graph += [Conv2(X_input_left, self.W, left_res, pad_left, self.bias)]
 
 
         # verify resulting computation is possible
@@ -148,32 +220,29 @@ class Conv2():
         return op_graph
     
     def sim(self):
+        # formatting arrays is costly, only do it when asked
+        verbose = logger.isEnabledFor(logging.DEBUG)
         logger.debug("EXECUTING CONV")
 
-        # get input
+        # get input, shaped as (batch, channel, height, width)
         X = self.X.get_data()
+        if not isinstance(self.X.slice[1], slice):
+            X = np.expand_dims(X, -3)
+        if not isinstance(self.X.slice[0], slice):
+            X = X[np.newaxis]
 
-        # pad input
-        x_shape = list(X.shape)
-        x_shape[0] += self.pad_upper + self.pad_bottom
-        x_shape[1] += self.pad_left + self.pad_right
-        X_padded = np.zeros(x_shape)
-
-        # form slice where data will be placed in x_padded
-        slice_h = slice(self.pad_upper, x_shape[0] - self.pad_bottom)
-        slice_w = slice(self.pad_left, x_shape[1] - self.pad_right)
-        X_padded[slice_h, slice_w] = X
-        logger.debug(f"X = \n{X_padded}")
-
-        # get filter
+        # get filter, shaped as (channel, height, width)
         W = self.W.get_data()
-        logger.debug(f"W = \n{W}")
+        if W.ndim == 2:
+            W = W[np.newaxis]
 
-        # compute result
-        res = correlate2d(X_padded, W, mode='valid')
-        self.res.write_data(res)
+        bias = self.bias.get_data() if (self.bias is not None) else None
+        pad = [self.pad_left, self.pad_upper, self.pad_right, self.pad_bottom]
+        res = correlate(X, W, pad, bias, verbose)
+        self.res.write_data(res.reshape(self.res.debug().shape))
 
-        logger.debug(f"res = \n{self.res.debug()}")
+        if verbose:
+            logger.debug(f"res = \n{self.res.debug()}")
     
     def debug(self):
         X_raw = self.X.get_data()
@@ -0,0 +1,38 @@
+from maeri.common.logger import LogIndent, logger
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+class ConvLayer():
+    def __init__(self, X_mem, W_mem, res_mem, pad, bias_mem=None):
+        """
+        Whole layer view of a convolution, used to
+        evaluate every op lowered from it at once.
+        """
+        self.X_mem = X_mem
+        self.W_mem = W_mem
+        self.res_mem = res_mem
+        self.bias_mem = bias_mem
+
+        self.pad_left = pad[0]
+        self.pad_upper = pad[1]
+        self.pad_right = pad[2]
+        self.pad_bottom = pad[3]
+
+    def sim(self):
+        logger.debug("EXECUTING CONV LAYER")
+
+        X = self.X_mem.data
+        W = self.W_mem.data
+
+        X_padded = np.pad(X, ((0, 0), (0, 0),
+            (self.pad_upper, self.pad_bottom), (self.pad_left, self.pad_right)))
+
+        # im2col through a strided view, windows have
+        # shape (batch, channel, out_h, out_w, f_h, f_w)
+        windows = sliding_window_view(X_padded, W.shape[2:], axis=(2, 3))
+
+        # contract channels and filter window in one matmul
+        res = np.tensordot(windows, W, axes=([1, 4, 5], [1, 2, 3]))
+        if self.bias_mem is not None:
+            res += self.bias_mem.data
+        self.res_mem.data[...] = res.transpose(0, 3, 1, 2)
@@ -4,7 +4,7 @@ class Input():
         self.mem_ref = mem_ref
 
     def get_offset(self):
-        raise NotImplementedError()
+        return self.mem_ref.get_offset(self.slice)
 
     def get_data(self):
         return self.mem_ref.data[self.slice]
@@ -1,11 +1,52 @@
+import numpy as np
+
 class Memory():
-    def __init__(self, data):
+    def __init__(self, data, name=None):
+        # byte address of the first element in device
+        # memory, assigned when the memory map is baked
         self.offset = None
+        # bytes per element in device memory
+        self.itemsize = None
+        # elements of slack before every row along the last
+        # axis in device memory, convolutions store the
+        # leading sums of their rows there
+        self.lead = 0
+        self.name = name
         self.data = data # data is a Numpy array
     
-    def get_offset(self, tuple_of_slices, shape):
+    def position(self, flat):
+        """
+        Position in device memory, in elements, of the
+        element at ``flat`` in the data.
+        """
+        width = self.data.shape[-1] if self.data.ndim else 1
+        return (flat//width)*(width + self.lead) + self.lead + flat % width
+
+    def get_offset(self, tuple_of_slices):
         """
         Takes a tuple of slices and returns a dict of
         address offsets keys and slice values.
+
+        Every key is the device byte address at which a
+        contiguous run of elements begins, and its value
+        is the tuple of slices selecting that run.
         """
-        raise NotImplementedError()
+        if self.offset is None:
+            raise RuntimeError("Memory has not been placed, call Compile.bake_offsets().")
+
+        shape = self.data.shape
+        indices = np.arange(self.data.size).reshape(shape)[tuple_of_slices]
+        indices = np.atleast_1d(indices)
+
+        # the innermost axis of a slice is contiguous,
+        # every other index starts a new run
+        runs = indices.reshape(-1, indices.shape[-1])
+        inner = tuple_of_slices[-1]
+
+        offsets = {}
+        for run in runs:
+            start = np.unravel_index(run[0], shape)
+            run_slice = tuple(start[:-1]) + (inner,)
+            offsets[self.offset + int(self.position(run[0]))*self.itemsize] = run_slice
+
+        return offsets
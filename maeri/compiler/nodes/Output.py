@@ -4,7 +4,7 @@ class Output():
         self.mem_ref = mem_ref
 
     def get_offset(self):
-        raise NotImplementedError()
+        return self.mem_ref.get_offset(self.slice)
 
     def write_data(self, data):
         self.mem_ref.data[self.slice] = data
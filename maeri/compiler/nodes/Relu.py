@@ -1,4 +1,28 @@
+from maeri.common.logger import LogIndent, logger
+import numpy as np
+import logging
+
 class Relu():
     def __init__(self, data, res):
         self.data = data
         self.res = res
+        # whole layer this op was lowered from
+        self.layer = None
+
+    def sim(self):
+        data = self.data.get_data()
+        self.res.write_data(np.maximum(data, 0))
+
+        # formatting arrays is costly, only do it when asked
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("EXECUTING RELU")
+            logger.debug(f"data = \n{data}")
+            logger.debug(f"res = \n{self.res.debug()}")
+
+    def debug(self):
+        data = self.data.get_data()
+        res = self.res.debug()
+
+        logger.debug("EXECUTING RELU")
+        logger.debug(f"data = \n{data}")
+        logger.debug(f"res = \n{res}")
@@ -0,0 +1,15 @@
+from maeri.common.logger import LogIndent, logger
+import numpy as np
+
+class ReluLayer():
+    def __init__(self, data_mem, res_mem):
+        """
+        Whole layer view of a relu, used to evaluate
+        every op lowered from it at once.
+        """
+        self.data_mem = data_mem
+        self.res_mem = res_mem
+
+    def sim(self):
+        logger.debug("EXECUTING RELU LAYER")
+        np.maximum(self.data_mem.data, 0, out=self.res_mem.data)
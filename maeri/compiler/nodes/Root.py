@@ -7,4 +7,10 @@ class Root():
         pass
     
     def init_root(self, data):
+        # refuse to silently broadcast a single image
+        # over a batch
+        shape = self.mem_ref.data[self.slice].shape
+        if data.shape != shape:
+            raise ValueError(f"Input of shape {data.shape} does not match " +\
+                f"compiled input shape {shape}.")
         self.mem_ref.data[self.slice] = data
@@ -1,17 +1,23 @@
 from .Add import Add
+from .AddLayer import AddLayer
 from .Conv2 import Conv2
+from .ConvLayer import ConvLayer
 from .Input import Input
 from .Memory import Memory
 from .Output import Output
 from .Relu import Relu
+from .ReluLayer import ReluLayer
 from .Root import Root
 from .Result import Result
 
 __all__ = [
     "Add",
+    "AddLayer",
     "Conv2",
+    "ConvLayer",
     "Input",
     "Memory",
     "Output",
-    "Relu"
+    "Relu",
+    "ReluLayer"
     ]
\ No newline at end of file
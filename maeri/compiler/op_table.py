@@ -0,0 +1,278 @@
+from maeri.common.logger import logger
+from maeri.compiler.nodes import Conv2, Add, Relu
+from maeri.compiler.nodes import Input, Output
+from maeri.compiler.nodes.Conv2 import correlate
+
+import numpy as np
+import logging
+
+# opcodes
+CONV = 1
+ADD = 2
+RELU = 3
+
+# operand positions, an op reads operands 0, 1 and 3
+# and writes operand 2
+FIRST = 0
+SECOND = 1
+RESULT = 2
+BIAS = 3
+
+OPERANDS = 4
+AXES = 4
+
+# kinds of an operand axis
+ABSENT = 0
+INDEX = 1
+RANGE = 2
+
+op_dtype = np.dtype([
+    ('opcode', np.uint8),
+    ('layer', np.int32),
+    ('tensor', np.int32, (OPERANDS,)),
+    ('kind', np.int8, (OPERANDS, AXES)),
+    ('start', np.int32, (OPERANDS, AXES)),
+    ('stop', np.int32, (OPERANDS, AXES)),
+    ('pad', np.int16, (4,)),
+    ('resident', np.int16),
+    ])
+
+# operand attribute names of every op type
+names_v_opcode = {
+    CONV : {'X' : FIRST, 'W' : SECOND, 'res' : RESULT, 'bias' : BIAS},
+    ADD : {'A' : FIRST, 'B' : SECOND, 'C' : RESULT},
+    RELU : {'data' : FIRST, 'res' : RESULT},
+    }
+opcode_v_type = {Conv2 : CONV, Add : ADD, Relu : RELU}
+
+class OpView():
+    """
+    Lightweight stand in for a ``Conv2``, ``Add`` or ``Relu``
+    op stored in row ``index`` of an ``OpTable``. Operands
+    are only materialized as ``Input`` and ``Output`` when
+    accessed.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getattr__(self, name):
+        row = self.table.ops[self.index]
+        operand = names_v_opcode[int(row['opcode'])].get(name)
+        if operand is None:
+            raise AttributeError(name)
+        return self.table.operand(self.index, operand)
+
+    @property
+    def opcode(self):
+        return int(self.table.ops['opcode'][self.index])
+
+    @property
+    def layer(self):
+        layer = self.table.ops['layer'][self.index]
+        return self.table.layers[layer] if layer >= 0 else None
+
+    @property
+    def resident(self):
+        return int(self.table.ops['resident'][self.index])
+
+    @property
+    def pad_left(self):
+        return int(self.table.ops['pad'][self.index, 0])
+
+    @property
+    def pad_upper(self):
+        return int(self.table.ops['pad'][self.index, 1])
+
+    @property
+    def pad_right(self):
+        return int(self.table.ops['pad'][self.index, 2])
+
+    @property
+    def pad_bottom(self):
+        return int(self.table.ops['pad'][self.index, 3])
+
+    def sim(self):
+        self.table.sim_op(self.index)
+
+class OpTable():
+    def __init__(self, ops, memories, layers):
+        """
+        Op graph stored as one structured NumPy array
+        instead of one object per op.
+
+        Attributes:
+        ===========
+        self.ops:
+            structured array of ``op_dtype``, one row per op
+            in execution order. Operand axes of kind ``INDEX``
+            select ``start`` and drop the axis, axes of kind
+            ``RANGE`` select ``start:stop``.
+        self.memories:
+            list of ``Memory`` indexed by the ``tensor`` ids
+            of the operands, -1 marks a missing operand
+        self.layers:
+            list of whole layers indexed by ``layer``
+
+        Conv rows also hold ``resident``, the number of
+        input rows of every output row left in the injection
+        buffers by the previous op.
+        """
+        self.ops = ops
+        self.memories = memories
+        self.layers = layers
+
+    @classmethod
+    def from_ops(cls, op_graph):
+        ops = np.zeros(len(op_graph), dtype=op_dtype)
+        ops['tensor'] = -1
+        ops['layer'] = -1
+
+        memories = []
+        tensor_v_memory = {}
+        layers = []
+        index_v_layer = {}
+
+        for row, op in zip(ops, op_graph):
+            opcode = opcode_v_type[type(op)]
+            row['opcode'] = opcode
+            if opcode == CONV:
+                row['pad'] = [op.pad_left, op.pad_upper, op.pad_right, op.pad_bottom]
+                row['resident'] = op.resident
+
+            if op.layer is not None:
+                if id(op.layer) not in index_v_layer:
+                    index_v_layer[id(op.layer)] = len(layers)
+                    layers += [op.layer]
+                row['layer'] = index_v_layer[id(op.layer)]
+
+            for name, operand in names_v_opcode[opcode].items():
+                ref = getattr(op, name)
+                if ref is None:
+                    continue
+
+                if id(ref.mem_ref) not in tensor_v_memory:
+                    tensor_v_memory[id(ref.mem_ref)] = len(memories)
+                    memories += [ref.mem_ref]
+                row['tensor'][operand] = tensor_v_memory[id(ref.mem_ref)]
+
+                shape = ref.mem_ref.data.shape
+                for axis, slice_ in enumerate(ref.slice):
+                    if isinstance(slice_, slice):
+                        start, stop, step = slice_.indices(shape[axis])
+                        assert(step == 1)
+                        row['kind'][operand, axis] = RANGE
+                    else:
+                        start, stop = int(slice_), int(slice_) + 1
+                        row['kind'][operand, axis] = INDEX
+                    row['start'][operand, axis] = start
+                    row['stop'][operand, axis] = stop
+
+        return cls(ops, memories, layers)
+
+    def derive(self, ops):
+        """
+        Returns a table of ``ops`` sharing the memories and
+        layers of this table.
+        """
+        return OpTable(ops, self.memories, self.layers)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, index):
+        return OpView(self, index)
+
+    def __iter__(self):
+        return (OpView(self, index) for index in range(len(self.ops)))
+
+    def get_slice(self, index, operand, keep_dims=False):
+        """
+        Returns the tuple of slices of an operand. With
+        ``keep_dims`` set, index axes are kept as ranges of
+        length one.
+        """
+        kind = self.ops['kind'][index, operand]
+        start = self.ops['start'][index, operand]
+        stop = self.ops['stop'][index, operand]
+
+        slices = []
+        for axis in range(AXES):
+            if kind[axis] == RANGE or (keep_dims and kind[axis] == INDEX):
+                slices += [slice(int(start[axis]), int(stop[axis]))]
+            elif kind[axis] == INDEX:
+                slices += [int(start[axis])]
+        return tuple(slices)
+
+    def get_data(self, index, operand, keep_dims=False):
+        memory = self.memories[self.ops['tensor'][index, operand]]
+        return memory.data[self.get_slice(index, operand, keep_dims)]
+
+    def operand(self, index, operand):
+        tensor = self.ops['tensor'][index, operand]
+        if tensor < 0:
+            return None
+        slice_ = self.get_slice(index, operand)
+        if operand == RESULT:
+            return Output(slice_, self.memories[tensor])
+        return Input(slice_, self.memories[tensor])
+
+    def to_ops(self):
+        """
+        Materializes the table back into op objects.
+        """
+        op_graph = []
+        for view in self:
+            opcode = view.opcode
+            if opcode == CONV:
+                op = Conv2(view.X, view.W, view.res,
+                    [view.pad_left, view.pad_upper, view.pad_right, view.pad_bottom],
+                    view.bias)
+                op.resident = view.resident
+            elif opcode == ADD:
+                op = Add(view.A, view.B, view.C)
+            else:
+                op = Relu(view.data, view.res)
+            op.layer = view.layer
+            op_graph += [op]
+        return op_graph
+
+    def sim_op(self, index):
+        verbose = logger.isEnabledFor(logging.DEBUG)
+        opcode = self.ops['opcode'][index]
+
+        # every operand is read with all four axes, so
+        # no normalization of the shapes is needed
+        res = self.get_data(index, RESULT, keep_dims=True)
+        if opcode == CONV:
+            X = self.get_data(index, FIRST, keep_dims=True)
+            W = self.get_data(index, SECOND, keep_dims=True)[0]
+            bias = None
+            if self.ops['tensor'][index, BIAS] >= 0:
+                bias = self.get_data(index, BIAS)
+            pad = self.ops['pad'][index].tolist()
+            res[...] = correlate(X, W, pad, bias, verbose).reshape(res.shape)
+        elif opcode == ADD:
+            res[...] = self.get_data(index, FIRST, True) + self.get_data(index, SECOND, True)
+        else:
+            res[...] = np.maximum(self.get_data(index, FIRST, True), 0)
+
+        if verbose:
+            logger.debug(f"EXECUTING OP {index} : opcode {opcode}")
+            logger.debug(f"res = \n{res}")
+
+    def sim(self, fast=False):
+        """
+        Runs every op in order, or with ``fast`` set every
+        layer the ops were lowered from.
+        """
+        if fast:
+            layers, first = np.unique(self.ops['layer'], return_index=True)
+            for layer in layers[np.argsort(first)]:
+                if layer >= 0:
+                    self.layers[layer].sim()
+        else:
+            for index in range(len(self.ops)):
+                self.sim_op(index)
@@ -0,0 +1,327 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes.Conv2 import Conv2
+from maeri.compiler.nodes.Add import Add
+from maeri.compiler.nodes.ConvLayer import ConvLayer
+from maeri.compiler.nodes.AddLayer import AddLayer
+from maeri.compiler.codegen import indices
+from maeri.compiler.mapper import wrap
+
+from numpy.lib.stride_tricks import sliding_window_view
+import numpy as np
+
+def layer_io(layer):
+    """
+    Memories ``layer`` reads its activations from, and the
+    memory it writes.
+    """
+    if type(layer) is ConvLayer:
+        return [layer.X_mem], layer.res_mem
+    if type(layer) is AddLayer:
+        return [layer.A_mem, layer.B_mem], layer.C_mem
+    return [layer.data_mem], layer.res_mem
+
+def channel_max(data, per_channel):
+    """
+    Largest magnitude of ``data`` in every channel along
+    axis 1, or in all of it.
+    """
+    magnitude = np.abs(np.asarray(data, dtype=np.float64))
+    if per_channel and (magnitude.ndim > 1):
+        axes = tuple([axis for axis in range(magnitude.ndim) if axis != 1])
+        return magnitude.max(axis=axes)
+    return np.array([magnitude.max()])
+
+def expand(scale, ndim):
+    """
+    Shapes per channel ``scale`` to broadcast along axis 1
+    of an array of ``ndim`` dimensions.
+    """
+    if ndim < 2:
+        return scale
+    return scale.reshape((1, -1) + (1,)*(ndim - 2))
+
+def channel_gain(gain, operand):
+    """
+    Per channel ``gain`` shaped to broadcast against the
+    data ``operand`` selects.
+    """
+    channel = operand.slice[1]
+    if not isinstance(channel, slice):
+        return gain[channel]
+    kept = sum([isinstance(axis, slice) for axis in operand.slice[2:]])
+    return gain[channel].reshape((-1,) + (1,)*kept)
+
+class Quantization():
+    def __init__(self, layers, ops, ranges, entry, per_channel=False, input_width=8,
+            headroom=1.25):
+        """
+        Integer model of a network for the compute unit.
+
+        Every activation holds ``input_width`` bit integers
+        ``q`` standing for ``q*scale``, with one scale for the
+        whole tensor or one per channel. ``ranges`` holds the
+        largest magnitude calibrated for the memory of ``entry``
+        and the output of every one of ``layers``, the scales
+        map them ``headroom`` times over to the largest
+        integer. Adders wrap around rather than saturate, so
+        sums must keep clear of the ends of their range.
+
+        A multiplier keeps its product shifted right by
+        ``shift``, ``input_width - 1`` bits, and adders wrap
+        around, so the sum collected for output channel ``o``
+        is ``q_y = sum(q_x*q_w >> shift)``. Weights are stored
+        as ``w*s_x*2**shift/s_y`` for this to stand for the
+        output, where the largest weight would not fit an
+        output scale is raised until it does. A folded bias
+        is weighted against the largest feature, which the
+        ones memory holds to stand for a one.
+
+        Elementwise ops weigh every operand by the ratio of
+        its scale to the output scale times ``2**shift``. A
+        gain of one takes ``2**shift``, which does not fit, so
+        relus raise their output scale by ``2**shift/high``.
+        Partial sums of a convolution split into several
+        passes are accumulated by adds of the same gain,
+        which every partition is scaled up to undo.
+
+        Truncating every product loses half a step on average,
+        ``correct`` moves a bias by the mean error left.
+
+        Attributes:
+        ===========
+        self.scales:
+            scale of every activation and constant memory, one
+            per channel or one for the whole tensor
+        self.weights:
+            integer weights, biases and constant operands by
+            memory, written over the memories by ``apply``
+        self.gains:
+            weight of every operand per channel, for every
+            layer lowered to elementwise ops
+        self.errors:
+            for every layer output, by name, the energy of the
+            float output, the energy of the error of the
+            integer one and the largest error
+        """
+        self.per_channel = per_channel
+        self.input_width = input_width
+        self.shift = input_width - 1
+        self.high = 2**(input_width - 1) - 1
+        self.dtype = np.min_scalar_type(-2**(input_width - 1))
+        self.headroom = headroom
+        self.entry = entry
+
+        self.scales = {entry : self.scale(ranges[entry])}
+        self.weights = {}
+        self.gains = {}
+        self.errors = {}
+
+        ops_by_layer = {}
+        for op in ops:
+            ops_by_layer.setdefault(op.layer, []).append(op)
+
+        for layer in layers:
+            inputs, output = layer_io(layer)
+            for memory in inputs:
+                if memory not in self.scales:
+                    self.constant(memory)
+
+            if type(layer) is ConvLayer:
+                self.conv(layer, ops_by_layer.get(layer, []), ranges[output])
+            elif type(layer) is AddLayer:
+                self.add(layer, ranges[output])
+            else:
+                self.relu(layer)
+
+            logger.debug(f"{output.name} : scale {self.scales[output]}")
+
+    def scale(self, magnitude):
+        return self.headroom*np.where(magnitude > 0, magnitude, 1.0)/self.high
+
+    def fit(self, scale, bound):
+        """
+        Raises ``scale`` to ``bound``, over all channels unless
+        scales are per channel.
+        """
+        if not self.per_channel:
+            bound = np.array([np.max(bound)])
+        return np.maximum(scale, bound)
+
+    def integers(self, values):
+        low = -self.high - 1
+        return np.clip(np.rint(values), low, self.high).astype(self.dtype)
+
+    def constant(self, memory):
+        data = np.asarray(memory.data, dtype=np.float64)
+        scale = self.scale(channel_max(data, self.per_channel))
+        self.scales[memory] = scale
+        self.weights[memory] = self.integers(data/expand(scale, data.ndim))
+
+    def conv(self, layer, ops, magnitude):
+        if layer.W_mem in self.weights:
+            raise NotImplementedError(f"Weights {layer.W_mem.name} are shared between layers.")
+
+        W = np.asarray(layer.W_mem.data, dtype=np.float64)
+        s_x = expand(self.scales[layer.X_mem], W.ndim)
+
+        # every add accumulating a partition scales both
+        # partial sums by ``decay``, partitions are scaled up
+        # by the adds they pass through
+        partitions = dict.fromkeys([(indices(op.W.slice[1], W.shape[1]),
+            indices(op.W.slice[2], W.shape[2])) for op in ops if type(op) is Conv2])
+        count = max(1, len(partitions))
+        decay = self.high/2**self.shift
+        growth = np.ones(W.shape)
+        for index, (channels, rows) in enumerate(partitions):
+            growth[:, channels.start:channels.stop, rows.start:rows.stop] = \
+                decay**-(count - max(index, 1))
+
+        W = W*growth*s_x*2**self.shift
+        bound = np.abs(W).reshape(W.shape[0], -1).max(axis=1)/self.high
+        if layer.bias_mem is not None:
+            bias = np.asarray(layer.bias_mem.data, dtype=np.float64)
+            bias = bias*decay**-(count - 1)*2**self.shift/self.high
+            bound = np.maximum(bound, np.abs(bias)/self.high)
+
+        s_y = self.fit(self.scale(magnitude), bound)
+        self.weights[layer.W_mem] = self.integers(W/s_y.reshape(-1, 1, 1, 1))
+        if layer.bias_mem is not None:
+            self.weights[layer.bias_mem] = self.integers(bias/s_y)
+        self.scales[layer.res_mem] = s_y
+
+        if count > 1:
+            outputs = layer.res_mem.data.shape[1]
+            self.gains[layer] = [np.full(outputs, self.high)]*2
+
+    def add(self, layer, magnitude):
+        s_a = self.scales[layer.A_mem]
+        s_b = self.scales[layer.B_mem]
+        bound = np.maximum(s_a, s_b)*2**self.shift/self.high
+        s_c = self.fit(self.scale(magnitude), bound)
+        self.scales[layer.C_mem] = s_c
+
+        channels = layer.C_mem.data.shape[1]
+        self.gains[layer] = [np.broadcast_to(np.rint(scale*2**self.shift/s_c),
+            (channels,)).astype(int) for scale in [s_a, s_b]]
+
+    def relu(self, layer):
+        scale = self.scales[layer.data_mem]
+        self.scales[layer.res_mem] = scale*2**self.shift/self.high
+
+        channels = layer.res_mem.data.shape[1]
+        self.gains[layer] = [np.full(channels, self.high)]
+
+    def correct(self, layer, error):
+        """
+        Moves the bias of ``layer`` against ``error``, the
+        mean error of every output channel.
+        """
+        steps = error/self.scales[layer.res_mem]
+        bias = self.weights[layer.bias_mem].astype(np.float64)
+        self.weights[layer.bias_mem] = self.integers(bias - steps*2**self.shift/self.high)
+
+    def quantize(self, data, memory):
+        data = np.asarray(data, dtype=np.float64)
+        return self.integers(data/expand(self.scales[memory], data.ndim))
+
+    def dequantize(self, data, memory):
+        return data*expand(self.scales[memory], np.ndim(data))
+
+    def data(self, operand):
+        """
+        Integer data ``operand`` selects.
+        """
+        memory = operand.mem_ref
+        data = self.weights.get(memory, memory.data)
+        return np.asarray(data[operand.slice]).astype(np.int64)
+
+    def correlate(self, X, W, pad, bias=None):
+        """
+        ``correlate`` of ``maeri.compiler.nodes.Conv2`` as the
+        tree computes it, every product truncated on its own.
+        """
+        pad_left, pad_upper, pad_right, pad_bottom = pad
+        X_padded = np.pad(X, ((0, 0), (0, 0), (pad_upper, pad_bottom), (pad_left, pad_right)))
+
+        # windows have shape (batch, channel, out_h, out_w, f_h, f_w)
+        windows = sliding_window_view(X_padded, W.shape[1:], axis=(2, 3))
+        products = (windows*W[np.newaxis, :, np.newaxis, np.newaxis]) >> self.shift
+        res = products.sum(axis=(1, 4, 5))
+        if bias is not None:
+            res += (self.high*bias) >> self.shift
+        return wrap(res, self.input_width)
+
+    def run(self, op):
+        if type(op) is Conv2:
+            # shaped as in ``Conv2.sim``
+            X = self.data(op.X)
+            if not isinstance(op.X.slice[1], slice):
+                X = np.expand_dims(X, -3)
+            if not isinstance(op.X.slice[0], slice):
+                X = X[np.newaxis]
+            W = self.data(op.W)
+            if W.ndim == 2:
+                W = W[np.newaxis]
+            bias = self.data(op.bias) if (op.bias is not None) else None
+            pad = [op.pad_left, op.pad_upper, op.pad_right, op.pad_bottom]
+            res = self.correlate(X, W, pad, bias)
+            op.res.write_data(res.reshape(op.res.debug().shape))
+
+        elif type(op) is Add:
+            gain_a, gain_b = self.gains[op.layer]
+            res = (self.data(op.A)*channel_gain(gain_a, op.A) >> self.shift) +\
+                (self.data(op.B)*channel_gain(gain_b, op.B) >> self.shift)
+            op.C.write_data(wrap(res, self.input_width))
+
+        else:
+            # the relu is applied to the collected sum
+            gain, = self.gains[op.layer]
+            res = wrap(self.data(op.data)*channel_gain(gain, op.data) >> self.shift,
+                self.input_width)
+            op.res.write_data(np.maximum(res, 0))
+
+    def sim(self, ops, entrypoint, exitpoint, data, observe=None):
+        """
+        Runs ``ops`` on ``data`` with the arithmetic of the
+        compute unit. Returns the output, scaled back.
+        ``observe`` is called with every layer once its last
+        op ran.
+        """
+        logger.debug("RUNNING QUANTIZED SIMULATION")
+        with LogIndent():
+            entrypoint.init_root(self.quantize(data, self.entry))
+            last = {op.layer : index for index, op in enumerate(ops)}
+            for index, op in enumerate(ops):
+                self.run(op)
+                if (observe is not None) and (last[op.layer] == index):
+                    observe(op.layer)
+            return self.dequantize(exitpoint.get_data(), exitpoint.mem_ref)
+
+    def measure(self, layer, reference):
+        """
+        Accumulates the error of the integer output of
+        ``layer`` against its float ``reference``.
+        """
+        output = layer_io(layer)[1]
+        error = self.dequantize(output.data, output) - reference
+        signal, noise, peak = self.errors.get(output.name, (0.0, 0.0, 0.0))
+        self.errors[output.name] = (signal + float(np.sum(np.square(reference))),
+            noise + float(np.sum(np.square(error))), max(peak, float(np.abs(error).max())))
+
+    def report(self):
+        """
+        Returns the signal to quantization noise ratio in
+        dB and the largest error of every layer output.
+        """
+        report = {}
+        for name, (signal, noise, peak) in self.errors.items():
+            sqnr = 10*np.log10(signal/noise) if noise > 0 else np.inf
+            report[name] = {'sqnr' : sqnr, 'max' : peak}
+        return report
+
+    def apply(self):
+        """
+        Writes the integer weights over their memories.
+        """
+        for memory, data in self.weights.items():
+            memory.data = data
@@ -0,0 +1,27 @@
+import onnx
+
+from maeri.common.logger import logger
+
+def batch_pass(model, batch_size):
+    """
+    Set the leading (batch) dimension of every activation
+    to ``batch_size``. Exporters frequently leave the batch
+    dimension symbolic, which would otherwise be read as 0.
+    """
+    init_names = {_.name for _ in model.graph.initializer}
+
+    value_infos = list(model.graph.input) + list(model.graph.value_info)
+    value_infos += list(model.graph.output)
+
+    for value_info in value_infos:
+        if value_info.name in init_names:
+            continue
+
+        dims = value_info.type.tensor_type.shape.dim
+        if len(dims) == 0:
+            continue
+
+        dims[0].ClearField('dim_param')
+        dims[0].dim_value = batch_size
+
+    logger.debug(f"FINISHED {batch_pass.__name__} pass")
@@ -3,12 +3,13 @@ from maeri.common.logger import logger, LogIndent
 
 from maeri.compiler.sanitize.conv_pad_pass import explicit_pad_pass
 from maeri.compiler.sanitize.conv_valid_pass import conv_valid_pass
+from maeri.compiler.sanitize.batch_pass import batch_pass
 
 import onnx
 import onnx.utils
 from onnx import optimizer
 
-def sanitize(model):
+def sanitize(model, batch_size=None):
     # compiler currently unable to reason about
     # batch normalization, fusing helps
     passes = ['fuse_bn_into_conv', 'fuse_pad_into_conv']
@@ -31,4 +32,8 @@ def sanitize(model):
                 else:
                     logger.debug("No passes applied.")
 
+    # run several images through one compiled program
+    if batch_size is not None:
+        batch_pass(model, batch_size)
+
     return model
@@ -1,26 +1,69 @@
 from maeri.common.logger import LogIndent, logger
+from heapq import heappush, heappop
 import onnx
 
-def schedule(model):
-    schedule = []
-    collected_outputs = []
+def schedule(model, priority=None):
+    """
+    Returns the nodes of ``model.graph`` in an order where
+    every node appears after the nodes producing its inputs.
+
+    Uses dependency counting over producer/consumer indexes
+    so scheduling is linear in the size of the graph. The
+    model is left untouched.
+
+    ``priority`` is an optional callable taking a node and
+    returning a sort key. Among the nodes that are ready,
+    the one with the smallest key is scheduled first, ties
+    being broken by graph order. Without it, the graph order
+    is preserved wherever the dependencies allow.
+    """
+    nodes = list(model.graph.node)
+
+    available = {_.name for _ in model.graph.input}
+    available |= {_.name for _ in model.graph.initializer}
+    # onnx marks omitted optional inputs with the empty name
+    available.add("")
+
+    # index tensor names by the nodes consuming them
+    consumers = {}
+    pending = []
+    for index, node in enumerate(nodes):
+        missing = set(node.input) - available
+        pending += [len(missing)]
+        for name in missing:
+            consumers.setdefault(name, []).append(index)
 
-    collected_inputs = [_.name for _ in model.graph.input]
-    collected_inputs += [_.name for _ in model.graph.initializer]
-    collected_inputs = list(set(collected_inputs))
+    def key(index):
+        if priority is None:
+            return (index,)
+        return (priority(nodes[index]), index)
 
+    ready = []
+    for index, count in enumerate(pending):
+        if count == 0:
+            heappush(ready, (key(index), index))
+
+    schedule = []
     logger.debug("NOW SCHEDULING")
 
     with LogIndent():
-        while len(model.graph.node) > 0:
-            for node in model.graph.node:
-                combined_references = collected_inputs + collected_outputs
-                inputs_satisfied = all([input_ in combined_references for input_ in node.input])
-                if inputs_satisfied:
-                    model.graph.node.remove(node)
-                    collected_outputs += list(node.output)
-                    schedule += [node]
-                    logger.debug(node.name)
-                    break
-    
-    return schedule
\ No newline at end of file
+        while ready:
+            _, index = heappop(ready)
+            node = nodes[index]
+            schedule += [node]
+            logger.debug(node.name)
+
+            for name in node.output:
+                if name in available:
+                    continue
+                available.add(name)
+                for consumer in consumers.pop(name, []):
+                    pending[consumer] -= 1
+                    if pending[consumer] == 0:
+                        heappush(ready, (key(consumer), consumer))
+
+    if len(schedule) != len(nodes):
+        unresolved = sorted(consumers.keys())
+        raise ValueError(f"Unable to schedule graph, unresolved inputs: {unresolved}")
+
+    return schedule
@@ -1,7 +1,17 @@
 from .solve_conv import solve_conv
 from .solve_add import solve_add
+from .solve_table import solve_table
+from .solve_tiling import CostModel, TilingSolver
+from .reorder import reorder
+from .traffic import feature_loads, multiplier_utilization
 
 __all__ = [
+    "CostModel",
+    "TilingSolver",
+    "feature_loads",
+    "multiplier_utilization",
+    "reorder",
     "solve_conv",
-    "solve_add"
+    "solve_add",
+    "solve_table"
     ]
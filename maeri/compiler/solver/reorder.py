@@ -0,0 +1,267 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.op_table import OpTable, OPERANDS, AXES
+from maeri.compiler.op_table import CONV, SECOND, RESULT, BIAS, ABSENT
+
+from heapq import heappush, heappop
+import numpy as np
+
+def aliases(memories):
+    """
+    Returns for every memory the ids of the memories whose
+    data may share storage with it, including its own.
+    Activations that are never live together share the
+    arena, so reordering must treat them as one.
+    """
+    return [np.array([other for other, memory_b in enumerate(memories)
+        if np.may_share_memory(memory_a.data, memory_b.data)])
+        for memory_a in memories]
+
+def expand(lo, hi):
+    """
+    Returns for every value of the ranges ``lo`` to ``hi``
+    the index of its range and the value.
+    """
+    counts = hi - lo
+    owner = np.repeat(np.arange(len(lo)), counts)
+    value = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, value + lo[owner]
+
+def cells(start, stop, absent):
+    """
+    Splits every axis of a memory at the bounds of its
+    accesses, and returns the (access, cell) pairs of the
+    cells each access covers. Accesses overlap exactly
+    when they share a cell.
+    """
+    access = np.arange(len(start))
+    cell = np.zeros(len(start), dtype=np.int64)
+    for axis in range(AXES):
+        present = ~absent[:, axis]
+        points = np.unique(np.concatenate([start[present, axis], stop[present, axis]]))
+        segments = max(len(points) - 1, 1)
+        lo = np.where(present, np.searchsorted(points, start[:, axis]), 0)
+        hi = np.where(present, np.searchsorted(points, stop[:, axis]), segments)
+        owner, segment = expand(lo[access], hi[access])
+        access = access[owner]
+        cell = cell[owner]*segments + segment
+    return access, cell
+
+def sweep(op, write, cell):
+    """
+    Returns the edges ordering the accesses of one memory,
+    given as (op, write, cell) triples. Every access comes
+    after the last earlier write of its cells, and every
+    write after the reads of its cells since that write.
+    """
+    order = np.lexsort((write, op, cell))
+    op, write, cell = op[order], write[order], cell[order]
+    position = np.arange(len(op))
+    first = np.maximum.accumulate(np.where(np.diff(cell, prepend=-1) != 0, position, 0))
+    last = np.minimum.accumulate(np.where(np.diff(cell, append=-1) != 0,
+        position, len(op))[::-1])[::-1]
+
+    written = np.maximum.accumulate(np.where(write, position, -1))
+    previous = np.concatenate([[-1], written[:-1]])
+    after = previous >= first
+    upcoming = np.minimum.accumulate(np.where(write, position, len(op))[::-1])[::-1]
+    following = np.concatenate([upcoming[1:], [len(op)]])
+    before = ~write & (following <= last)
+
+    src = np.concatenate([op[previous[after]], op[before]])
+    dst = np.concatenate([op[after], op[following[before]]])
+    return src, dst
+
+def barriers(op, memory):
+    """
+    Returns the edges ordering the accesses of two memories
+    sharing storage. Accesses of either memory run in turns,
+    the first op of a turn comes after every op of the turn
+    before and before every op of its own turn.
+    """
+    order = np.lexsort((memory, op))
+    op, memory = op[order], memory[order]
+    turn = np.cumsum(np.diff(memory, prepend=-1) != 0) - 1
+    heads = np.flatnonzero(np.diff(turn, prepend=-1))
+    head = op[heads][turn]
+    previous = turn < turn[-1]
+    following = op[heads[np.minimum(turn + 1, turn[-1])]]
+    src = np.concatenate([op[previous], head])
+    dst = np.concatenate([following[previous], op])
+    return src, dst
+
+def dependencies(ops, memories):
+    """
+    Returns the (earlier, later) pairs of ops that must
+    keep their order, because the later op reads what the
+    earlier op writes or writes what it reads or writes.
+    Only the edges to the last writer and the readers since
+    then are kept, the other orders follow from them.
+    Accesses of different memories sharing storage are
+    always ordered.
+
+    A conv op also writes the leading sums of its row over
+    the ``filter width - 1`` columns left of its output.
+    """
+    count = len(ops)
+    op_index = np.repeat(np.arange(count), OPERANDS)
+    operand = np.tile(np.arange(OPERANDS), count)
+    tensor = ops['tensor'].reshape(-1)
+    start = ops['start'].reshape(-1, AXES).copy()
+    lead = ops['stop'][:, SECOND, 3] - ops['start'][:, SECOND, 3] - 1
+    result = np.flatnonzero(ops['opcode'] == CONV)*OPERANDS + RESULT
+    start[result, 3] = np.maximum(start[result, 3] - lead[ops['opcode'] == CONV], 0)
+    stop = ops['stop'].reshape(-1, AXES)
+    absent = ops['kind'].reshape(-1, AXES) == ABSENT
+    write = operand == RESULT
+    valid = tensor >= 0
+
+    src = []
+    dst = []
+    written = set(np.unique(tensor[valid & write]).tolist())
+    accesses = {memory : np.flatnonzero(valid & (tensor == memory))
+        for memory in np.unique(tensor[valid]).tolist()}
+    shared = aliases(memories)
+    for memory, access in accesses.items():
+        # memories that are only read order nothing
+        if memory in written:
+            pair, cell = cells(start[access], stop[access], absent[access])
+            edges = sweep(op_index[access[pair]], write[access[pair]], cell)
+            src += [edges[0]]
+            dst += [edges[1]]
+
+        for other in shared[memory].tolist():
+            if other <= memory or other not in accesses:
+                continue
+            if memory not in written and other not in written:
+                continue
+            both = np.concatenate([access, accesses[other]])
+            edges = barriers(op_index[both], tensor[both])
+            src += [edges[0]]
+            dst += [edges[1]]
+
+    if not src:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    keep = src != dst
+    edges = np.unique(np.stack([src[keep], dst[keep]]), axis=1)
+    return edges[0], edges[1]
+
+def configurations(ops):
+    """
+    Returns an id per op, equal for ops that run on the
+    same weights and tree configuration.
+    """
+    conv = (ops['opcode'] == CONV)[:, np.newaxis]
+    keys = np.concatenate([
+        ops['opcode'][:, np.newaxis].astype(np.int64),
+        ops['tensor'][:, [SECOND, BIAS]],
+        ops['start'][:, SECOND],
+        ops['stop'][:, SECOND],
+        ops['start'][:, BIAS, :1],
+        ], axis=1)
+    keys[:, 1:] *= conv
+    _, config = np.unique(keys, axis=0, return_inverse=True)
+    return config.reshape(-1)
+
+def count_reconfigurations(config):
+    if len(config) == 0:
+        return 0
+    return 1 + int((config[1:] != config[:-1]).sum())
+
+def chains(ops):
+    """
+    Returns the id of the chain of every op. Ops reusing
+    rows left resident by the previous op must run right
+    after it, so the chain runs as one.
+    """
+    return np.cumsum(ops['resident'] == 0) - 1
+
+def schedule_chains(config, src, dst, chain):
+    """
+    Orders chains of ops as ``schedule_ops`` orders ops,
+    keeping the ops of every chain back to back.
+    """
+    heads = np.flatnonzero(np.diff(chain, prepend=-1))
+    keep = chain[src] != chain[dst]
+    order = schedule_ops(config[heads], chain[src[keep]], chain[dst[keep]])
+
+    bounds = np.append(heads, len(chain))
+    return np.concatenate([np.arange(bounds[index], bounds[index + 1])
+        for index in order])
+
+def schedule_ops(config, src, dst):
+    """
+    Orders ops so that ops of one configuration run back
+    to back where the dependencies allow. While ops of the
+    current configuration are ready, they run next. Else the
+    configuration whose remaining ops are the most ready is
+    configured, so that it need not be configured again.
+    """
+    count = len(config)
+    configs = config.max() + 1
+
+    indegree = np.bincount(dst, minlength=count)
+    by_src = np.argsort(src, kind='stable')
+    successors = dst[by_src]
+    bounds = np.searchsorted(src[by_src], np.arange(count + 1))
+
+    remaining = np.bincount(config, minlength=configs)
+    ready = np.zeros(configs, dtype=int)
+    heaps = [[] for _ in range(configs)]
+    for index in np.flatnonzero(indegree == 0):
+        heappush(heaps[config[index]], index)
+        ready[config[index]] += 1
+
+    order = []
+    current = -1
+    while len(order) < count:
+        if (current < 0) or (ready[current] == 0):
+            candidates = np.flatnonzero(ready)
+            ratio = ready[candidates]/remaining[candidates]
+            best = candidates[ratio == ratio.max()]
+            current = min(best, key=lambda candidate: heaps[candidate][0])
+
+        index = heappop(heaps[current])
+        ready[current] -= 1
+        remaining[current] -= 1
+        order += [index]
+
+        for successor in successors[bounds[index]:bounds[index + 1]]:
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                heappush(heaps[config[successor]], successor)
+                ready[config[successor]] += 1
+
+    return np.array(order, dtype=int)
+
+def reorder(op_graph):
+    """
+    Reorders a solved op graph, a list of ops or an
+    ``OpTable``, to reduce the number of times the tree is
+    reconfigured. Returns the reordered graph and the
+    number of reconfigurations before and after.
+    """
+    logger.debug("REORDERING OPS")
+    with LogIndent():
+        table = op_graph if isinstance(op_graph, OpTable) else OpTable.from_ops(op_graph)
+        ops = table.ops
+        if len(ops) == 0:
+            return op_graph, 0, 0
+
+        config = configurations(ops)
+        src, dst = dependencies(ops, table.memories)
+        order = schedule_chains(config, src, dst, chains(ops))
+
+        before = count_reconfigurations(config)
+        after = count_reconfigurations(config[order])
+        logger.debug(f"{len(src)} dependencies, reconfigurations {before} -> {after}")
+
+        # the heuristic is not guaranteed to improve
+        if after >= before:
+            return op_graph, before, before
+
+    if isinstance(op_graph, OpTable):
+        return op_graph.derive(ops[order]), before, after
+    return [op_graph[index] for index in order], before, after
@@ -12,11 +12,11 @@ def solve_for_buff_lengths(nodes, buff_length):
     
     return solution
 
-def solve_for_port_depth(nodes, ports):
+def solve_for_port_depth(nodes, ports, mults=None):
     solution = []
 
     for node in nodes:
-        solution += node.split_to_ports(ports)
+        solution += node.split_to_ports(ports, mults)
 
     return solution
 
@@ -35,12 +35,19 @@ def verify_buff_Lengths(nodes, buff_length):
         input_width = (node.X.slice[3].stop - node.X.slice[3].start) + node.pad_left + node.pad_right
         assert(input_width <= buff_length)
 
-def verify_weight_lengths(nodes, mults):
+def verify_weight_lengths(nodes, ports, mults):
     for node in nodes:
-        weight_length = len(node.W.get_data().flatten())
-        if not (weight_length <= mults):
-            raise RuntimeError(f"Weight length {weight_length} too large. Compiler does not support" +\
-                " splitting weights.")
+        ports_used = node.ports_per_row(ports, mults)
+        if not (ports_used <= ports):
+            raise RuntimeError(f"Output row of {ports_used} ports too large. Compiler does not " +\
+                "support splitting filter rows wider than the tree.")
+
+        # every output row computed at once takes up ports
+        # of its own
+        rows = node.res.slice[2]
+        if isinstance(rows, slice) and (rows.stop - rows.start)*ports_used > ports:
+            raise RuntimeError(f"{rows.stop - rows.start} rows of {ports_used} ports " +\
+                f"exceed {ports} ports.")
 
 def solve_conv(node, buff_length, ports, mults):
     logger.debug("CONV NODE")
@@ -53,12 +60,12 @@ def solve_conv(node, buff_length, ports, mults):
         solved_ops = solve_for_buff_lengths([node], buff_length)
 
         logger.debug("SOLVING FOR BUFFER NUM PORTS CONSTRAINT")
-        solved_ops = solve_for_port_depth(solved_ops, ports)
+        solved_ops = solve_for_port_depth(solved_ops, ports, mults)
 
         logger.debug("AFTER SOLVING CONV")
         debug_buff_lengths(solved_ops, buff_length)
 
         verify_buff_Lengths(solved_ops, buff_length)
-        verify_weight_lengths(solved_ops, mults)
+        verify_weight_lengths(solved_ops, ports, mults)
 
         return solved_ops
\ No newline at end of file
@@ -0,0 +1,214 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.op_table import CONV, ADD
+from maeri.compiler.op_table import FIRST, SECOND, RESULT, BIAS
+from maeri.compiler.op_table import INDEX, RANGE
+from maeri.compiler.nodes.Conv2 import ports_per_row
+
+import numpy as np
+
+# the same splits as solve_conv and solve_add, computed
+# for every op of an OpTable at once
+
+def extent(ops, operand, axis):
+    return ops['stop'][:, operand, axis] - ops['start'][:, operand, axis]
+
+def expand(ops, counts):
+    """
+    Repeats every op ``counts`` times in place. Returns the
+    new ops and the position of every op within its group.
+    """
+    rows = np.repeat(ops, counts)
+    first = np.cumsum(counts) - counts
+    sub = np.arange(len(rows)) - np.repeat(first, counts)
+    return rows, sub
+
+def split_left_right(ops, buff_length):
+    """
+    Halves the output width of conv ops until their padded
+    input fits in ``buff_length``, as ``Conv2.split_left_right``,
+    the right half first.
+    """
+    while True:
+        width = extent(ops, FIRST, 3) + ops['pad'][:, 0] + ops['pad'][:, 2]
+        split = (ops['opcode'] == CONV) & (width > buff_length)
+        if not split.any():
+            return ops
+
+        counts = np.where(split, 2, 1)
+        ops, sub = expand(ops, counts)
+        split = np.repeat(split, counts)
+        right = split & (sub == 0)
+        left = split & (sub == 1)
+
+        filter_width = extent(ops, SECOND, 3)
+        X_start = ops['start'][:, FIRST, 3].copy()
+        X_stop = ops['stop'][:, FIRST, 3].copy()
+        inner_output_len = X_stop - X_start - filter_width + 1
+        left_len = inner_output_len//2
+        right_len = inner_output_len - left_len
+
+        pad = ops['pad']
+        diff = extent(ops, RESULT, 3)
+        assert((diff == pad[:, 0] + inner_output_len + pad[:, 2])[split].all())
+        middle = ops['start'][:, RESULT, 3] + pad[:, 0] + left_len
+
+        ops['stop'][left, RESULT, 3] = middle[left]
+        ops['stop'][left, FIRST, 3] = (X_start + left_len + filter_width - 1)[left]
+        ops['start'][right, RESULT, 3] = middle[right]
+        ops['start'][right, FIRST, 3] = (X_stop - filter_width - (right_len - 1))[right]
+        pad[left, 2] = 0
+        pad[right, 0] = 0
+
+        # verify resulting computation is possible
+        input_width = extent(ops, FIRST, 3) + pad[:, 0] + pad[:, 2]
+        short = split & (input_width < filter_width)
+        if short.any():
+            index = np.flatnonzero(short)[0]
+            message = f"input_width : {input_width[index]} is less than " + \
+                f"filter_width : {filter_width[index]}"
+            raise RuntimeError(message)
+
+def row_ports(ops, ports, mults):
+    """
+    Ports one output row of every conv op takes up, as
+    ``Conv2.ports_per_row``.
+    """
+    channels = np.maximum(extent(ops, FIRST, 1), 1)
+    bias = (ops['tensor'][:, BIAS] >= 0).astype(int)
+    return ports_per_row(channels, extent(ops, SECOND, 2), extent(ops, SECOND, 3),
+        bias, ports, mults)
+
+def split_to_ports(ops, ports, mults=None):
+    """
+    Packs the output rows of every conv op into ops of as
+    many rows as the ports and multipliers allow, as
+    ``Conv2.split_to_ports``.
+    """
+    conv = ops['opcode'] == CONV
+    filter_depth = extent(ops, SECOND, 2)
+    input_depth = extent(ops, FIRST, 2)
+    output_depth = extent(ops, RESULT, 2)
+
+    pad = ops['pad']
+    assert((filter_depth <= ports)[conv].all())
+    assert((output_depth == input_depth + pad[:, 1] + pad[:, 3] - filter_depth + 1)[conv].all())
+
+    # rows per op, as Conv2.rows_per_pass
+    rows = np.ones(len(ops), dtype=int)
+    if mults is not None:
+        rows = np.maximum(ports//row_ports(ops, ports, mults), 1)
+
+    counts = np.where(conv, -(-output_depth//rows), 1)
+    ops, sub = expand(ops, counts)
+
+    conv = np.repeat(conv, counts)
+    filter_depth = np.repeat(filter_depth, counts)
+    input_depth = np.repeat(input_depth, counts)
+    output_depth = np.repeat(output_depth, counts)
+    rows = np.repeat(rows, counts)
+
+    # the window of every op, as input_window
+    pad = ops['pad']
+    row = sub*rows
+    row_end = np.minimum(row + rows, output_depth)
+    stop = row_end + filter_depth - 1
+    begin = np.clip(row - pad[:, 1], 0, input_depth)
+    end = np.clip(stop - pad[:, 1], 0, input_depth)
+    pad_upper = np.clip(pad[:, 1] - row, 0, stop - row)
+    pad_bottom = (stop - row) - (end - begin) - pad_upper
+
+    X_start = ops['start'][:, FIRST, 2].copy()
+    ops['start'][conv, FIRST, 2] = (X_start + begin)[conv]
+    ops['stop'][conv, FIRST, 2] = (X_start + end)[conv]
+
+    # ops of a single output row index it
+    res_start = ops['start'][:, RESULT, 2].copy()
+    ops['kind'][conv, RESULT, 2] = np.where(row_end - row > 1, RANGE, INDEX)[conv]
+    ops['start'][conv, RESULT, 2] = (res_start + row)[conv]
+    ops['stop'][conv, RESULT, 2] = (res_start + row_end)[conv]
+
+    pad[conv, 1] = pad_upper[conv]
+    pad[conv, 3] = pad_bottom[conv]
+
+    # every output row finds all but ``rows`` of its input
+    # rows left by the same row of the op before
+    ops['resident'][conv] = np.where(sub > 0, np.maximum(filter_depth - rows, 0), 0)[conv]
+
+    return ops
+
+def split_axis(ops, split, axis, length, chunk):
+    """
+    Splits every operand of the ops selected by ``split``
+    into chunks of ``chunk`` along ``axis``.
+    """
+    counts = np.where(split, -(-length//chunk), 1)
+    ops, sub = expand(ops, counts)
+    split = np.repeat(split, counts)
+    length = np.repeat(length, counts)
+
+    begin = sub*chunk
+    end = np.minimum(begin + chunk, length)
+    for operand in [FIRST, SECOND, RESULT]:
+        start = ops['start'][:, operand, axis].copy()
+        ops['start'][split, operand, axis] = (start + begin)[split]
+        ops['stop'][split, operand, axis] = (start + end)[split]
+
+    return ops
+
+def verify_table(ops, buff_length, ports, mults):
+    conv = ops['opcode'] == CONV
+    add = ops['opcode'] == ADD
+
+    input_width = extent(ops, FIRST, 3) + ops['pad'][:, 0] + ops['pad'][:, 2]
+    assert((input_width <= buff_length)[conv].all())
+
+    ports_used = row_ports(ops, ports, mults)
+    if (ports_used > ports)[conv].any():
+        ports_used = ports_used[conv].max()
+        raise RuntimeError(f"Output row of {ports_used} ports too large. Compiler does not " +\
+            "support splitting filter rows wider than the tree.")
+
+    # every output row computed at once takes up ports
+    # of its own
+    rows = extent(ops, RESULT, 2)
+    if (rows*ports_used > ports)[conv].any():
+        index = np.flatnonzero(conv & (rows*ports_used > ports))[0]
+        raise RuntimeError(f"{rows[index]} rows of {ports_used[index]} ports " +\
+            f"exceed {ports} ports.")
+
+    assert((extent(ops, FIRST, 3) == extent(ops, SECOND, 3))[add].all())
+    assert((extent(ops, FIRST, 3) <= buff_length)[add].all())
+    assert((extent(ops, FIRST, 2) == extent(ops, SECOND, 2))[add].all())
+    assert((extent(ops, FIRST, 2)*2 <= ports)[add].all())
+
+def solve_table(table, buff_length, ports, mults):
+    """
+    Solves every op of ``table`` for the buffer length,
+    port and multiplier constraints. Returns a new table
+    whose ops are in the same order the op by op solvers
+    produce them.
+    """
+    logger.debug("SOLVING OP TABLE")
+    with LogIndent():
+        ops = table.ops
+
+        logger.debug("SOLVING CONV FOR BUFFER LENGTH CONSTRAINT")
+        ops = split_left_right(ops, buff_length)
+
+        logger.debug("SOLVING CONV FOR BUFFER NUM PORTS CONSTRAINT")
+        ops = split_to_ports(ops, ports, mults)
+
+        add = ops['opcode'] == ADD
+        logger.debug("SOLVING ADD FOR BUFFER LENGTH CONSTRAINT")
+        length = extent(ops, FIRST, 3)
+        ops = split_axis(ops, add & (length > buff_length), 3, length, buff_length)
+
+        add = ops['opcode'] == ADD
+        logger.debug("SOLVING ADD FOR BUFFER NUM PORTS CONSTRAINT")
+        depth = extent(ops, FIRST, 2)
+        ops = split_axis(ops, add & (depth*2 > ports), 2, depth, ports//2)
+
+        verify_table(ops, buff_length, ports, mults)
+        logger.debug(f"{len(ops)} ops in {ops.nbytes} bytes")
+
+    return table.derive(ops)
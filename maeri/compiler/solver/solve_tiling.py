@@ -0,0 +1,213 @@
+from maeri.common.logger import LogIndent, logger
+from maeri.compiler.nodes import Conv2, Input, Output
+from maeri.compiler.nodes.Conv2 import input_window, split_evenly
+from maeri.compiler.solver.solve_conv import verify_buff_Lengths, verify_weight_lengths
+
+import numpy as np
+
+class CostModel():
+    def __init__(self, wordsize=2, reconfiguration_bytes=None, idle_weight=0.25):
+        """
+        Scores a tiling of a convolution by the traffic it
+        causes on the device.
+
+        Attributes:
+        ===========
+        self.wordsize:
+            bytes per tensor element moved
+        self.reconfiguration_bytes:
+            cost of configuring the tree for one op, in bytes.
+            When None, the size of a full weight and state
+            configuration of the tree is assumed.
+        self.idle_weight:
+            cost of every byte of injection buffer capacity
+            left unused by an op
+        """
+        self.wordsize = wordsize
+        self.reconfiguration_bytes = reconfiguration_bytes
+        self.idle_weight = idle_weight
+
+    def key(self):
+        return (self.wordsize, self.reconfiguration_bytes, self.idle_weight)
+
+class Tiling():
+    def __init__(self, width_tiles, row_bands, costs):
+        """
+        Attributes:
+        ===========
+        self.width_tiles:
+            number of tiles the output width is split into
+        self.row_bands:
+            number of bands the output rows are split into,
+            every band is computed by one op
+        self.costs:
+            dict of the terms of the cost model, including
+            the total ``score``
+        """
+        self.width_tiles = width_tiles
+        self.row_bands = row_bands
+        self.costs = costs
+
+def padded_extents(ranges, filter_len):
+    """
+    Number of padded input elements each range of outputs
+    reads along one axis.
+    """
+    return [(end - begin) + filter_len - 1 for begin, end in ranges]
+
+class TilingSolver():
+    def __init__(self, buff_length, ports, mults, cost_model=None):
+        """
+        Splits ``Conv2`` ops into tiles of output rows and
+        columns, choosing the number of tiles along each
+        axis with the lowest cost under ``cost_model``.
+
+        Every output row of an op takes up ``ports_per_row``
+        ports, each reading at most ``buff_length`` padded
+        columns. Unlike the
+        greedy solver, tiles are of even size and an op may
+        compute several output rows with one configuration.
+        """
+        self.buff_length = buff_length
+        self.ports = ports
+        self.mults = mults
+        self.cost_model = cost_model if (cost_model is not None) else CostModel()
+
+        # ops of one layer share their geometry
+        self.tilings = {}
+
+    def reconfiguration_bytes(self):
+        if self.cost_model.reconfiguration_bytes is not None:
+            return self.cost_model.reconfiguration_bytes
+        # one word per multiplier and one state per adder
+        return self.mults*self.cost_model.wordsize + (self.mults - 1)
+
+    def score(self, geometry, width_tiles, row_bands):
+        out_h, out_w, filter_h, filter_w, elements, weights, _ = geometry
+        wordsize = self.cost_model.wordsize
+
+        rows = padded_extents(split_evenly(out_h, row_bands), filter_h)
+        cols = padded_extents(split_evenly(out_w, width_tiles), filter_w)
+        ops = width_tiles*row_bands
+
+        # every band is read once per column tile and every
+        # column tile once per band, including halos
+        loaded = sum(rows)*sum(cols)
+        capacity = ops*self.ports*self.buff_length
+
+        costs = {
+            'ops' : ops,
+            'feature_bytes' : elements*loaded*wordsize,
+            'weight_bytes' : ops*weights*wordsize,
+            'output_bytes' : elements*out_h*out_w*wordsize,
+            'reconfigurations' : ops,
+            'utilization' : loaded/capacity,
+            }
+        costs['score'] = costs['feature_bytes'] + costs['weight_bytes'] +\
+            costs['output_bytes'] +\
+            costs['reconfigurations']*self.reconfiguration_bytes() +\
+            self.cost_model.idle_weight*(capacity - loaded)*wordsize
+        return costs
+
+    def candidates(self, geometry):
+        """
+        Every tiling that fits the hardware, up to twice as
+        many tiles along an axis as strictly needed. More
+        tiles only add halos and reconfigurations.
+        """
+        out_h, out_w, filter_h, filter_w, _, _, row_ports = geometry
+
+        # every row of a band takes up ports of its own
+        max_cols = self.buff_length - filter_w + 1
+        max_rows = self.ports//row_ports
+        if (max_cols < 1) or (max_rows < 1):
+            raise RuntimeError(f"Filter of {filter_h}x{filter_w} does not fit " +\
+                f"{self.ports} ports of {self.buff_length} elements " +\
+                f"and {self.mults} multipliers.")
+
+        min_tiles = -(-out_w//max_cols)
+        min_bands = -(-out_h//max_rows)
+        for width_tiles in range(min_tiles, min(out_w, 2*min_tiles) + 1):
+            for row_bands in range(min_bands, min(out_h, 2*min_bands) + 1):
+                yield width_tiles, row_bands
+
+    def choose(self, geometry):
+        key = (geometry, self.cost_model.key())
+        if key not in self.tilings:
+            best = None
+            for width_tiles, row_bands in self.candidates(geometry):
+                costs = self.score(geometry, width_tiles, row_bands)
+                if (best is None) or (costs['score'] < best.costs['score']):
+                    best = Tiling(width_tiles, row_bands, costs)
+
+            logger.debug(f"Tiling {geometry[:2]} outputs as {best.row_bands} " +\
+                f"bands of {best.width_tiles} tiles : {best.costs}")
+            self.tilings[key] = best
+
+        return self.tilings[key]
+
+    def geometry(self, node):
+        X_slice = node.X.slice
+        res_slice = node.res.slice
+        filter_dims = node.W.get_data().shape[-2:]
+
+        X_elements = node.X.get_data().size
+        X_h = X_slice[2].stop - X_slice[2].start
+        X_w = X_slice[3].stop - X_slice[3].start
+        out_h = res_slice[2].stop - res_slice[2].start
+        out_w = res_slice[3].stop - res_slice[3].start
+        assert(out_h == X_h + node.pad_upper + node.pad_bottom - filter_dims[0] + 1)
+        assert(out_w == X_w + node.pad_left + node.pad_right - filter_dims[1] + 1)
+
+        weights = node.W.get_data().size
+        if node.bias is not None:
+            weights += 1
+
+        # elements moved per input or output position,
+        # over channels and the batch
+        elements = X_elements//(X_h*X_w)
+        row_ports = node.ports_per_row(self.ports, self.mults)
+        return (out_h, out_w, filter_dims[0], filter_dims[1], elements, weights, row_ports)
+
+    def tile(self, node, tiling):
+        filter_h, filter_w = node.W.get_data().shape[-2:]
+        X_slice = node.X.slice
+        res_slice = node.res.slice
+        X_h = X_slice[2].stop - X_slice[2].start
+        X_w = X_slice[3].stop - X_slice[3].start
+        out_h = res_slice[2].stop - res_slice[2].start
+        out_w = res_slice[3].stop - res_slice[3].start
+
+        op_graph = []
+        for row_begin, row_end in split_evenly(out_h, tiling.row_bands):
+            begin, end, pad_upper, pad_bottom = input_window(row_begin, row_end,
+                node.pad_upper, X_h, filter_h)
+            X_rows = slice(X_slice[2].start + begin, X_slice[2].start + end)
+            res_rows = slice(res_slice[2].start + row_begin, res_slice[2].start + row_end)
+
+            # tiles run right to left, the leading sums every
+            # tile stores left of its columns are overwritten
+            # by the tile they belong to
+            for col_begin, col_end in reversed(split_evenly(out_w, tiling.width_tiles)):
+                begin, end, pad_left, pad_right = input_window(col_begin, col_end,
+                    node.pad_left, X_w, filter_w)
+                X_cols = slice(X_slice[3].start + begin, X_slice[3].start + end)
+                res_cols = slice(res_slice[3].start + col_begin, res_slice[3].start + col_end)
+
+                X = Input((X_slice[0], X_slice[1], X_rows, X_cols), node.X.mem_ref)
+                res = Output((res_slice[0], res_slice[1], res_rows, res_cols), node.res.mem_ref)
+                pad = [pad_left, pad_upper, pad_right, pad_bottom]
+                op_graph += [Conv2(X, node.W, res, pad, node.bias)]
+
+        return op_graph
+
+    def solve(self, node):
+        logger.debug("CONV NODE")
+        with LogIndent():
+            tiling = self.choose(self.geometry(node))
+            solved_ops = self.tile(node, tiling)
+
+            verify_buff_Lengths(solved_ops, self.buff_length)
+            verify_weight_lengths(solved_ops, self.ports, self.mults)
+
+        return solved_ops
@@ -0,0 +1,58 @@
+from maeri.compiler.op_table import OpTable
+from maeri.compiler.op_table import CONV, ADD, FIRST, SECOND, RESULT, BIAS, ABSENT
+
+import numpy as np
+
+def operand_size(ops, operand):
+    extent = ops['stop'][:, operand] - ops['start'][:, operand]
+    extent = np.where(ops['kind'][:, operand] == ABSENT, 1, extent)
+    return extent.prod(axis=1)
+
+def feature_loads(op_graph, reuse=True):
+    """
+    Number of feature elements loaded into the injection
+    buffers to run ``op_graph``, a list of ops or an
+    ``OpTable``. Padding rows and columns are loaded from
+    the zeros memory and count as well. Without ``reuse``,
+    rows left resident by the previous op are loaded again.
+    """
+    table = op_graph if isinstance(op_graph, OpTable) else OpTable.from_ops(op_graph)
+    ops = table.ops
+    conv = ops['opcode'] == CONV
+    add = ops['opcode'] == ADD
+
+    # every output row of a conv op loads the padded rows
+    # its filter rows meet in every channel and image, less
+    # those already resident, and the constant feature of a
+    # bias with the first op of a chain
+    X = ops['stop'][:, FIRST] - ops['start'][:, FIRST]
+    X = np.where(ops['kind'][:, FIRST] == ABSENT, 1, X)
+    width = X[:, 3] + ops['pad'][:, 0] + ops['pad'][:, 2]
+    rows = ops['stop'][:, RESULT, 2] - ops['start'][:, RESULT, 2]
+    loaded = ops['stop'][:, SECOND, 2] - ops['start'][:, SECOND, 2]
+    bias = (ops['tensor'][:, BIAS] >= 0).astype(int)
+    if reuse:
+        loaded = loaded - ops['resident']
+        bias = bias*(ops['resident'] == 0)
+    conv_loads = X[:, 0]*rows*(X[:, 1]*loaded + bias)*width
+
+    # elementwise ops load every input
+    loads = np.where(conv, conv_loads, operand_size(ops, FIRST))
+    loads = loads + np.where(add, operand_size(ops, SECOND), 0)
+    return int(loads.sum())
+
+def multiplier_utilization(op_graph, mults):
+    """
+    Fraction of the ``mults`` multipliers holding a weight,
+    averaged over the conv ops of ``op_graph``, a list of
+    ops or an ``OpTable``. Every output row an op computes
+    holds a copy of its filter.
+    """
+    table = op_graph if isinstance(op_graph, OpTable) else OpTable.from_ops(op_graph)
+    ops = table.ops[table.ops['opcode'] == CONV]
+    if len(ops) == 0:
+        return 0.0
+
+    weights = operand_size(ops, SECOND) + (ops['tensor'][:, BIAS] >= 0)
+    rows = ops['stop'][:, RESULT, 2] - ops['start'][:, RESULT, 2]
+    return float((weights*rows).sum())/(len(ops)*mults)
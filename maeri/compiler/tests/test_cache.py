@@ -0,0 +1,127 @@
+from onnx.helper import make_node
+import numpy as np
+
+# conv -> relu, compiled twice through the cache
+input_shape = 8
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+W_shape = (2,1,kernel_width,kernel_width)
+W = np.array([randint(-4,4) for num in range(np.prod(W_shape))])
+W = W.reshape(W_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W'], outputs=['a'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['a'], outputs=['y'], name='relu1'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, input_shape, input_shape])
+W_init = make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_cache',
+        inputs=[x_input],
+        initializer=[W_init],
+        outputs=[y_output])
+
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_cache.onnx')
+
+import tempfile
+from maeri.compiler.compile import Compile
+from maeri.compiler.cache import CompileCache
+from maeri.compiler.solver import CostModel
+import os
+
+directory = tempfile.mkdtemp()
+cache = CompileCache(directory)
+
+# cold compile fills the cache
+cold = Compile("test_cache.onnx", buff_length=buff_length, ports=ports, cache=cache)
+cold.solve()
+res = cold.sim(x).copy()
+
+# warm compile restores the built graph, and solving
+# again restores the solved one
+entries = len(os.listdir(directory))
+warm = Compile("test_cache.onnx", buff_length=buff_length, ports=ports, cache=cache)
+assert(not warm.solved)
+warm.solve()
+assert(warm.solved)
+assert(len(os.listdir(directory)) == entries)
+assert(len(warm.op_graph) == len(cold.op_graph))
+assert(np.abs(res - warm.sim(x)).sum() == 0)
+
+# x and y are never live together and still share
+# the restored arena
+x_mem = warm.entrypoint.mem_ref
+y_mem = warm.exitpoint.mem_ref
+assert(not warm.memory_plan.overlaps('x', 'y'))
+assert(np.shares_memory(x_mem.data, y_mem.data))
+
+# solving under a cost model is a stage of its own
+tiled = Compile("test_cache.onnx", buff_length=buff_length, ports=ports, cache=cache)
+tiled.solve(cost_model=CostModel())
+assert(tiled.solved)
+assert(len(os.listdir(directory)) == entries + 1)
+assert(np.abs(res - tiled.sim(x)).sum() == 0)
+
+# the pipeline runs again from a warm start, quantized,
+# restoring every stage down to the assembled binary
+samples = [x, x[:, :, ::-1].copy()]
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**16}
+def pipeline(sess, samples):
+    report = sess.quantize(samples)
+    sess.solve()
+    sess.reorder()
+    sess.map()
+    sess.bake_offsets(config, program_size=1024)
+    sess.codegen()
+    return report, sess.assemble()
+quantized = Compile("test_cache.onnx", buff_length=buff_length, ports=ports,
+    wordsize=1, cache=cache)
+report, binary = pipeline(quantized, samples)
+entries = len(os.listdir(directory))
+warm = Compile("test_cache.onnx", buff_length=buff_length, ports=ports, wordsize=1, cache=cache)
+assert(warm.quantization is None)
+warm_report, warm_binary = pipeline(warm, samples)
+assert(len(os.listdir(directory)) == entries)
+assert(warm_report == report)
+assert((warm_binary == binary).all())
+assert((warm.sim(x) == quantized.sim(x)).all())
+
+# other calibration samples are another quantization
+other = Compile("test_cache.onnx", buff_length=buff_length, ports=ports, wordsize=1, cache=cache)
+other.quantize(samples[:1])
+assert(len(os.listdir(directory)) == entries + 1)
+
+# different hardware parameters do not hit
+other = Compile("test_cache.onnx", buff_length=buff_length, ports=8, cache=cache)
+assert(not other.solved)
+
+# least recently used entries are evicted
+cache.max_bytes = 1
+cache.evict()
+assert(len(os.listdir(directory)) == 0)
+print("DONE")
+
+# delete generated files
+import shutil
+shutil.rmtree(directory)
+os.remove("test_cache.onnx")
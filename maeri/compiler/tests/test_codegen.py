@@ -0,0 +1,250 @@
+from onnx.helper import make_node
+import numpy as np
+
+# a residual block, the second convolution reads two
+# channels, the rows of each from its own ring of three
+# ports. Padded rows are wider than the buffers, so the
+# convolutions are split into bands of columns.
+input_shape = 8
+channels = 2
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+mults = 64
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W1_shape = (channels,1,kernel_width,kernel_width)
+W1 = np.array([randint(-4,4) for num in range(np.prod(W1_shape))])
+W1 = W1.reshape(W1_shape).astype(np.float32)
+
+B1 = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+W2_shape = (channels,channels,kernel_width,kernel_width)
+W2 = np.array([randint(-4,4) for num in range(np.prod(W2_shape))])
+W2 = W2.reshape(W2_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['c1'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['c1'], outputs=['r1'], name='relu1'),
+    make_node('Conv', inputs=['r1', 'W2'], outputs=['c2'], name='conv2',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Add', inputs=['r1', 'c2'], outputs=['y'], name='add1'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+W1_init = make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten())
+B1_init = make_tensor('B1', TensorProto.FLOAT, list(B1.shape), B1.flatten())
+W2_init = make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_codegen',
+        inputs=[x_input],
+        initializer=[W1_init, B1_init, W2_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_codegen.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_codegen.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# run the assembled image on the bit accurate model of
+# the compute unit, which must store the output the
+# quantized model simulates
+from maeri.drivers.model_driver import ModelDriver
+def execute(sess, x):
+    binary = sess.assemble()
+    memory_map = sess.memory_map
+    config = dict(memory_map.config, ports=sess.ports)
+    config['no.mults'] = sess.mults
+    driver = ModelDriver(config, wordsize=sess.wordsize)
+    driver.write(0, binary.tobytes())
+    constants = [region.memory for region in memory_map.regions
+        if region.kind in {"zeros", "ones", "constant"}]
+    driver.upload(memory_map, constants)
+    entry = sess.entrypoint.mem_ref
+    sess.entrypoint.init_root(sess.quantization.quantize(x, entry))
+    driver.upload(memory_map, [entry])
+
+    driver.start_compute()
+    output = sess.exitpoint.mem_ref
+    data = driver.read(memory_map.line_address(output),
+        memory_map.nbytes(output)//memory_map.b_in_packet)
+    result = memory_map.decode(output, data)
+    return sess.quantization.dequantize(result, output)
+
+def compile(path, x, **kwargs):
+    sess = Compile(path, **kwargs)
+    sess.quantize([x])
+    sess.solve()
+    sess.reorder()
+    sess.map()
+    sess.bake_offsets(config, program_size=1024)
+    sess.codegen()
+    return sess
+
+# compile, map and generate the program
+from maeri.compiler.compile import Compile
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run
+from maeri.compiler.solver import feature_loads
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**23}
+sess = compile("test_codegen.onnx", x, buff_length=buff_length, ports=ports, mults=mults)
+passes = sess.passes
+program = sess.program
+instructions = program.instructions
+print(f"instructions = {len(program)}, eliminated = {program.eliminated}")
+
+# one run per pass of a single image, elementwise ops
+# fit the ports and buffers whole
+runs = [instruction for instruction in instructions if type(instruction) is Run]
+assert(len(runs) == len(passes))
+
+# configurations the tree already holds are left out
+assert(program.count(ConfigureStates) < len(passes))
+assert(program.eliminated['ConfigureCollectors'] > 0)
+
+# rows a port already holds are not loaded again
+loaded = sum([instruction.num_lines for instruction in instructions
+    if type(instruction) is LoadFeatures])
+print(f"loaded = {loaded}, without reuse = {feature_loads(sess.op_graph, reuse=False)}")
+assert(loaded < feature_loads(sess.op_graph, reuse=False))
+
+# the stored output is the one simulated
+result = execute(sess, x)
+assert((result == sess.sim(x)).all())
+assert(np.abs(res - result).max() < 0.25*np.abs(res).max())
+
+# tables are solved with the bands in the same order
+table = compile("test_codegen.onnx", x, buff_length=buff_length, ports=ports, mults=mults,
+    compact=True)
+assert((execute(table, x) == table.sim(x)).all())
+
+# the program outgrows the room left for it, so the
+# memories move and the program is generated again
+from maeri.compiler.assembler import opcodes
+binary = sess.assemble().tolist()
+assert(len(binary) % config['b_in_packet'] == 0)
+assert(sess.memory_map.program_size >= len(binary))
+assert(sess.entrypoint.mem_ref.offset >= len(binary))
+
+# every instruction is encoded with its parameters and
+# configurations point at their payloads
+pc = 0
+addresses = {}
+isa = sess.program.isa
+lengths = {ConfigureStates : isa.num_nodes, ConfigureWeights : mults + 3,
+    ConfigureCollectors : ports, ConfigureRelus : ports}
+for instruction in sess.program.instructions:
+    assert(binary[pc] == instruction.op)
+    params = binary[pc + 1:pc + 1 + instruction.num_params(isa)]
+    if type(instruction) in lengths:
+        line = int.from_bytes(bytes(params), 'little')
+        data = binary[line*4:line*4 + lengths[type(instruction)]]
+        if type(instruction) is ConfigureStates:
+            assert(data == [int(state) for state in instruction.states])
+        if type(instruction) is ConfigureWeights:
+            assert(data[3:] == [weight % 256 for weight in instruction.weights])
+        addresses.setdefault(tuple(data), set()).add(line)
+    if type(instruction) is LoadFeatures:
+        assert(params[3:] == [instruction.offset, instruction.port_buffer_address,
+            instruction.num_lines])
+    pc += 1 + instruction.num_params(isa)
+assert(binary[pc] == opcodes.Reset.op)
+
+# every distinct payload is stored once
+assert(all([len(lines) == 1 for lines in addresses.values()]))
+configs = sum([sess.program.count(kind) for kind in lengths])
+print(f"configurations = {configs}, distinct payloads = {len(addresses)}")
+assert(len(addresses) < configs)
+
+# lines are words over the same bytes
+from maeri.compiler.assembler.assemble import assemble
+words = assemble(sess.program.instructions, isa, bytes_in_line=4, bytes_in_packet=32)
+assert(words.dtype == np.dtype('<u4'))
+assert(words.view(np.uint8).tolist() == binary)
+
+# trees of different sizes are assembled for at once,
+# every program carries the ISA of its own tree
+from concurrent.futures import ThreadPoolExecutor
+from maeri.compiler.assembler.opcodes import ISA
+def program(num_mults):
+    isa = ISA.for_tree(num_mults, ports)
+    ops = [ConfigureWeights(isa, [randint(-128, 127) for _ in range(num_mults)])
+        for _ in range(64)]
+    return ops, isa
+programs = [program(num_mults) for num_mults in [16, 32, 64, 128]*4]
+with ThreadPoolExecutor(4) as pool:
+    images = list(pool.map(lambda args: assemble(*args, as_bytes=True), programs))
+for (ops, isa), image in zip(programs, images):
+    assert((image == assemble(ops, isa, as_bytes=True)).all())
+    lead = isa.num_adders % 4
+    line = int.from_bytes(bytes(image[1:4]), 'little')
+    assert(image[line*4 + lead:line*4 + lead + isa.num_mults].tolist() ==
+        [weight % 256 for weight in ops[0].weights])
+
+# a convolution of more channels than one pass reduces,
+# every output channel accumulating its partial sums
+# through a buffer of one channel
+x_shape = (1, 8, 4, 4)
+x = np.array([randint(-4, 4) for _ in range(np.prod(x_shape))]).reshape(x_shape).astype(np.float32)
+W = np.array([randint(-4, 4) for _ in range(2*8*9)]).reshape(2, 8, 3, 3).astype(np.float32)
+nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['y'], name='conv1',
+    kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)]
+graph = make_graph(nodes=nodes, name='test_codegen_split',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x_shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 4, 4])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_codegen.onnx')
+
+sess = compile("test_codegen.onnx", x, buff_length=8, ports=16)
+assert(any([pass_.mapping is None for pass_ in sess.passes]))
+assert((execute(sess, x) == sess.sim(x)).all())
+
+# a single channel with and without a bias, the bias
+# weighted against the constant feature
+x_shape = (1, 1, 6, 6)
+x = np.array([randint(-4, 4) for _ in range(np.prod(x_shape))]).reshape(x_shape).astype(np.float32)
+W = np.array([randint(-4, 4) for _ in range(9)]).reshape(1, 1, 3, 3).astype(np.float32)
+B = np.array([randint(-4, 4)]).astype(np.float32)
+for initializer in [[('W', W)], [('W', W), ('B', B)]]:
+    nodes = [make_node('Conv', inputs=['x'] + [name for name, _ in initializer],
+        outputs=['y'], name='conv1', kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)]
+    graph = make_graph(nodes=nodes, name='test_codegen_bias',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x_shape))],
+        initializer=[make_tensor(name, TensorProto.FLOAT, list(data.shape), data.flatten())
+            for name, data in initializer],
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT, list(x_shape))])
+    onnx.save(make_model(graph, producer_name='onnx-example'), 'test_codegen.onnx')
+
+    sess = compile("test_codegen.onnx", x, buff_length=16, ports=16, mults=64, wordsize=1)
+    assert((execute(sess, x) == sess.sim(x)).all())
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_codegen.onnx")
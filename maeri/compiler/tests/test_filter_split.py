@@ -0,0 +1,113 @@
+from onnx.helper import make_node
+import numpy as np
+
+# filters larger than the tree : a 9x9 filter and a
+# 3x3 filter over 8 channels, both with a bias
+input_shape = 12
+channels = 8
+buff_length = 32
+ports = 16
+mults = 64
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W1_shape = (channels,1,9,9)
+W1 = np.array([randint(-4,4) for num in range(np.prod(W1_shape))])
+W1 = W1.reshape(W1_shape).astype(np.float32)
+B1 = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+W2_shape = (2,channels,3,3)
+W2 = np.array([randint(-4,4) for num in range(np.prod(W2_shape))])
+W2 = W2.reshape(W2_shape).astype(np.float32)
+B2 = np.array([randint(-4,4) for num in range(2)]).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'], name='conv1',
+        kernel_shape=[9, 9], strides=[1, 1], pads=[4]*4),
+    make_node('Conv', inputs=['a', 'W2', 'B2'], outputs=['y'], name='conv2',
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, 2, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+
+inits = [make_tensor(name, TensorProto.FLOAT, list(data.shape), data.flatten())
+    for name, data in [('W1', W1), ('B1', B1), ('W2', W2), ('B2', B2)]]
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_filter_split',
+        inputs=[x_input],
+        initializer=inits,
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_filter_split.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_filter_split.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# compile and run with compiler's executor
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import Conv2
+sess = Compile("test_filter_split.onnx", buff_length=buff_length, ports=ports,
+    mults=mults)
+assert(np.abs(res - sess.sim(x)).sum() == 0)
+
+# 9 filter rows of three ports each and a bias are split
+# into two bands of filter rows, and 24 filter rows of a
+# port each and a bias into two groups of four channels
+convs = [op for op in sess.op_graph if type(op) is Conv2]
+assert(len(convs) == 2*channels + 2*2)
+for op in convs:
+    assert(op.ports_per_row(ports, mults) <= ports)
+    assert(op.ports_per_row(ports, mults) > ports//2)
+
+# every solver keeps every pass within the tree
+sess.solve()
+assert(np.abs(res - sess.sim(x)).sum() == 0)
+assert(np.abs(res - sess.sim(x, fast=True)).sum() == 0)
+
+from maeri.compiler.solver import CostModel
+tiled = Compile("test_filter_split.onnx", buff_length=buff_length, ports=ports,
+    mults=mults)
+tiled.solve(cost_model=CostModel())
+assert(np.abs(res - tiled.sim(x)).sum() == 0)
+
+table = Compile("test_filter_split.onnx", buff_length=buff_length, ports=ports,
+    mults=mults, compact=True)
+table.solve()
+assert(len(table.op_graph) == len(sess.op_graph))
+assert(np.abs(res - table.sim(x)).sum() == 0)
+
+# the default four ports inject the rows of a single
+# 3x3 channel, so the 9x9 filter takes three bands of
+# three rows and the 3x3 filters a pass per channel
+narrow = Compile("test_filter_split.onnx", buff_length=buff_length, mults=mults)
+assert(narrow.ports == 4)
+convs = [op for op in narrow.op_graph if type(op) is Conv2]
+assert(len(convs) == 3*channels + 2*channels)
+assert(np.abs(res - narrow.sim(x)).sum() == 0)
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_filter_split.onnx")
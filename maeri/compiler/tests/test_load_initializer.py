@@ -0,0 +1,118 @@
+from onnx.helper import make_node, make_tensor_value_info
+from onnx.helper import make_tensor, make_graph, make_model
+from onnx import TensorProto, numpy_helper
+from onnx.external_data_helper import convert_model_to_external_data
+import numpy as np
+import onnx
+
+# conv(bias) -> add(residual), with initializers stored as
+# raw data, as typed fields and outside of the model
+rng = np.random.default_rng(9)
+channels = 2
+x_shape = (1, channels, 6, 6)
+W = rng.integers(-4, 5, (channels, channels, 3, 3)).astype(np.float32)
+B = rng.integers(-4, 5, channels).astype(np.float32)
+x = rng.integers(-4, 5, x_shape).astype(np.float32)
+
+def save(path, initializer, external=None):
+    nodes = [
+        make_node('Conv', inputs=['x', 'W', 'B'], outputs=['a'], name='conv1',
+            kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+        make_node('Add', inputs=['a', 'x'], outputs=['y'], name='add1'),
+        ]
+    graph = make_graph(nodes=nodes, name='test_load_initializer',
+        inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x_shape))],
+        initializer=initializer,
+        outputs=[make_tensor_value_info('y', TensorProto.FLOAT, list(x_shape))])
+    model = make_model(graph, producer_name='onnx-example')
+    if external is not None:
+        convert_model_to_external_data(model, all_tensors_to_one_file=True,
+            location=external, size_threshold=0)
+    onnx.save(model, path)
+
+# initializers are viewed as they are stored, and can not
+# be written to
+from maeri.compiler.build_graph.load_initializer import load_initializer
+raw = numpy_helper.from_array(W, 'W')
+assert(raw.raw_data)
+data = load_initializer(raw)
+assert((data == W).all() and data.dtype == np.float32)
+assert(not data.flags.writeable)
+try:
+    data[0, 0, 0, 0] = 1
+    assert(False)
+except ValueError:
+    pass
+
+typed = make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())
+assert((load_initializer(typed) == W).all())
+half = make_tensor('H', TensorProto.FLOAT16, [channels], B.astype(np.float16))
+assert((load_initializer(half) == B).all())
+
+save('test_load_initializer.onnx', [numpy_helper.from_array(W, 'W'),
+    numpy_helper.from_array(B, 'B')])
+import onnxruntime as rt
+expected = rt.InferenceSession('test_load_initializer.onnx').run(['y'], {'x' : x})[0]
+
+from maeri.compiler.compile import Compile
+def weights(sess):
+    return {memory.name : memory.data for memory in sess.memories
+        if memory.name in ('W', 'B')}
+
+def compile_and_check(path):
+    """
+    Compiles ``path`` through every stage, none of which
+    may write into the read-only initializers.
+    """
+    sess = Compile(path, buff_length=8, ports=16)
+    loaded = weights(sess)
+    assert((loaded['W'] == W).all() and (loaded['B'] == B).all())
+    for data in loaded.values():
+        assert(not data.flags.writeable)
+
+    assert((sess.sim(x) == expected).all())
+    assert((sess.sim(x, fast=True) == expected).all())
+    sess.solve()
+    sess.reorder()
+    sess.map()
+    config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**16}
+    sess.bake_offsets(config, program_size=1024)
+    sess.codegen()
+    sess.assemble()
+    assert((sess.sim(x) == expected).all())
+    assert((loaded['W'] == W).all() and (loaded['B'] == B).all())
+    return sess
+
+# raw data is used in place
+sess = compile_and_check('test_load_initializer.onnx')
+
+# external data is memory mapped from the file next to
+# the model, quantizing rewrites the memories instead of
+# the mapped file
+save('test_load_initializer.onnx', [numpy_helper.from_array(W, 'W'),
+    numpy_helper.from_array(B, 'B')], external='test_load_initializer.data')
+model = onnx.load('test_load_initializer.onnx', load_external_data=False)
+for init in model.graph.initializer:
+    assert(init.data_location == TensorProto.EXTERNAL and not init.raw_data)
+assert((rt.InferenceSession('test_load_initializer.onnx').run(['y'], {'x' : x})[0]
+    == expected).all())
+
+sess = compile_and_check('test_load_initializer.onnx')
+for data in weights(sess).values():
+    assert(isinstance(data.base, np.memmap))
+
+sess = Compile('test_load_initializer.onnx', buff_length=16, ports=8, mults=16,
+    wordsize=1)
+loaded = weights(sess)
+sess.quantize([x])
+assert(weights(sess)['W'].dtype == np.int8)
+assert((loaded['W'] == W).all() and (loaded['B'] == B).all())
+with open('test_load_initializer.data', 'rb') as data:
+    stored = np.frombuffer(data.read(), dtype=np.float32)
+assert((stored[:W.size] == W.flatten()).all())
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_load_initializer.onnx")
+os.remove("test_load_initializer.data")
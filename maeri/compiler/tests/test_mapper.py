@@ -0,0 +1,130 @@
+from onnx.helper import make_node
+import numpy as np
+
+# a convolution of four filters, every op computes up to
+# four output rows of one filter, each on four ports of
+# four multipliers. The last ops of the filters compute
+# two rows and share a pass.
+input_shape = 6
+channels = 4
+kernel_width = 3
+padding = 1
+buff_length = 16
+ports = 16
+mults = 64
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W_shape = (channels,1,kernel_width,kernel_width)
+W = np.array([randint(-4,4) for num in range(np.prod(W_shape))])
+W = W.reshape(W_shape).astype(np.float32)
+
+B = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W', 'B'], outputs=['y'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+W_init = make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())
+B_init = make_tensor('B', TensorProto.FLOAT, list(B.shape), B.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_mapper',
+        inputs=[x_input],
+        initializer=[W_init, B_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_mapper.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_mapper.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# neurons take up whole groups of multipliers behind
+# a port, next to each other, those straddling subtrees
+# are joined by forwarding links
+from maeri.compiler.mapper import TreeMapper
+wide = TreeMapper(7, 16)
+for length in [1, 2, 3, 5, 7, 9, 10, 25]:
+    count = 16//(-(-length//4))
+    assert(wide.map([[np.ones(length)]]*count) is not None)
+    assert(wide.map([[np.ones(length)]]*(count + 1)) is None)
+rows = [np.ones(3)]*3 + [np.ones(1)]
+assert(wide.map([rows]*4) is not None)
+assert(wide.map([rows]*4 + [[np.ones(1)]]) is None)
+
+# compile, solve and pack the filters into passes
+from maeri.compiler.compile import Compile
+from maeri.compiler.solver import multiplier_utilization
+sess = Compile("test_mapper.onnx", buff_length=buff_length, ports=ports, mults=mults)
+sess.solve()
+assert(np.abs(res - sess.sim(x)).sum() == 0)
+passes = sess.map()
+
+# the two row ops of two filters fit one pass
+convs = len(sess.op_graph)
+print(f"convs = {convs}, passes = {len(passes)}")
+assert(convs == 2*channels)
+assert(len(passes) == channels + channels//2)
+assert(sorted(sum([pass_.ops for pass_ in passes], [])) == list(range(convs)))
+from maeri.compiler.mapper import utilization
+before = multiplier_utilization(sess.op_graph, mults)
+after = utilization(passes)
+print(f"multiplier utilization = {before} -> {after}")
+assert(after > 1.25*before)
+
+# every multiplier reads the port of its row, as many
+# cycles late as it lies left of the injecting one, and
+# every collected sum is an output of the convolution
+# once the filter width has passed
+from maeri.compiler.assembler.states import InjectEn
+mapper = sess.mapper()
+padded = np.pad(x[0, 0], padding)
+width = padded.shape[1]
+for pass_ in passes:
+    mapping = pass_.mapping
+    inject = np.array(mapping.states[mapper.num_adders:]) == InjectEn.on
+    source, delay = mapper.feeds(inject)
+    streams = np.zeros((ports + 1, width))
+    expected = []
+    for (index, row), neuron_ports in zip(pass_.neurons, mapping.ports):
+        op = sess.op_graph[index]
+        out_row = op.res.slice[2]
+        out_row = (out_row.start if isinstance(out_row, slice) else out_row) + row
+        for slot, port in enumerate(neuron_ports[:kernel_width]):
+            streams[port] = padded[out_row + (slot - out_row) % kernel_width]
+        streams[neuron_ports[-1]] = 1
+        expected += [res[0, op.res.slice[1], out_row]]
+
+    for entry in range(kernel_width - 1, width):
+        features = streams[source, entry - delay]
+        sums = mapper.reduce(mapping.states, features*mapping.weights)
+        column = entry - kernel_width + 1
+        assert((sums[mapping.collectors] == np.array(expected)[:, column]).all())
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_mapper.onnx")
@@ -0,0 +1,165 @@
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run
+from maeri.compiler.assembler.assemble import assemble
+from maeri.compiler.assembler.states import ConfigUp, ConfigForward, InjectEn
+from maeri.drivers.model_driver import ReductionModel, ModelDriver
+
+from random import randint, choice, seed
+from time import perf_counter
+import numpy as np
+
+seed(7)
+depth = 5
+ports = 4
+width = 8
+
+def signed(value):
+    return ((value + 128) & 0xFF) - 128
+
+class Reference():
+    """
+    Steps the registers of ``ReductionNetwork`` one clock
+    at a time, following the nmigen description node by node.
+    """
+    def __init__(self, skeleton):
+        self.skeleton = skeleton
+        self.adders = skeleton.adder_nodes
+        self.mults = skeleton.mult_nodes
+        self.port_of = {node.id : port for port, node in enumerate(skeleton.inject_nodes)}
+        self.right_of = {left.id : right.id for left, right in skeleton.mult_forwarding_links}
+        self.partner = {}
+        for left, right in skeleton.adder_forwarding_links:
+            self.partner[left.id] = right.id
+            self.partner[right.id] = left.id
+
+        nodes = len(skeleton.all_nodes)
+        self.up = [0]*nodes
+        self.f_out = [0]*nodes
+        self.rp_data = [0]*ports
+
+    def cycle(self, states, weights, collectors, srams, collected,
+            run, length, injection_addr, collector_addr):
+        up, f_out = self.up, self.f_out
+        num_adders = len(self.adders)
+
+        feature = {}
+        for node in self.mults:
+            if states[node.id] == InjectEn.on:
+                port = self.port_of.get(node.id)
+                feature[node.id] = 0 if port is None else self.rp_data[port]
+            else:
+                right = self.right_of.get(node.id)
+                feature[node.id] = 0 if right is None else f_out[right]
+
+        forward = {}
+        for node in self.adders:
+            state, lhs, rhs = states[node.id], up[node.lhs.id], up[node.rhs.id]
+            forward[node.id] = {1 : signed(lhs + rhs), 3 : rhs, 4 : lhs}.get(state, 0)
+
+        next_up = list(up)
+        for node in self.adders:
+            state, lhs, rhs = states[node.id], up[node.lhs.id], up[node.rhs.id]
+            f_in = forward.get(self.partner.get(node.id), 0)
+            total = signed(lhs + rhs + (f_in if state == 2 else 0))
+            next_up[node.id] = {0 : total, 2 : total, 3 : lhs, 4 : rhs}.get(state, 0)
+
+        # collectors listen while the run is past their latency
+        for port, node in enumerate(collectors):
+            latency = self.skeleton.all_nodes[node].latency
+            if run and (injection_addr > latency) and (collector_addr[port] < length - 1):
+                collected[port][collector_addr[port]] = up[node] if node < num_adders else 0
+                collector_addr[port] += 1
+            elif not run:
+                collector_addr[port] = 0
+
+        for node in self.mults:
+            product = feature[node.id]*weights[node.id - num_adders]
+            next_up[node.id] = signed(product >> (width - 1))
+            f_out[node.id] = feature[node.id]
+        self.up[:] = next_up
+
+        if run and (injection_addr < length - 1):
+            self.rp_data = [signed(sram[injection_addr]) for sram in srams]
+            return injection_addr + 1
+        return injection_addr
+
+    def run(self, states, weights, collectors, srams, collected, length):
+        collector_addr = [0]*ports
+        # the tree settles between runs
+        for _ in range(2*len(self.skeleton.all_nodes)):
+            self.cycle(states, weights, collectors, srams, collected,
+                False, length, 0, collector_addr)
+        injection_addr = 0
+        for _ in range(length + depth + 2):
+            injection_addr = self.cycle(states, weights, collectors, srams, collected,
+                True, length, injection_addr, collector_addr)
+
+model = ReductionModel(depth, ports, width)
+reference = Reference(model.skeleton)
+num_adders = model.num_adders
+num_mults = model.num_mults
+
+# random states exercise every forwarding link and every
+# multiplier reading its neighbour, random features and
+# weights overflow the products and sums
+collected = [[0]*model.sram_depth for _ in range(ports)]
+for trial in range(40):
+    states = [randint(0, 4) for _ in range(num_adders)]
+    states += [choice([InjectEn.on, InjectEn.off]) for _ in range(num_mults)]
+    weights = [randint(-128, 127) for _ in range(num_mults)]
+    collectors = [randint(0, num_adders - 1) for _ in range(ports)]
+    srams = [[randint(-128, 127) for _ in range(model.sram_depth)] for _ in range(ports)]
+    length = randint(1, 24)
+
+    model.configure_states(states)
+    model.configure_weights(weights)
+    model.configure_collectors(collectors)
+    model.configure_relus([0]*ports)
+    model.injection_srams[:] = srams
+    model.run(length)
+
+    reference.run(states, weights, collectors, srams, collected, length)
+    assert(model.collection_srams.tolist() == collected)
+
+# a program executes from the assembled image
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 1024,
+    'ports' : ports, 'no.mults' : num_mults}
+driver = ModelDriver(config)
+isa = driver.isa
+adder_states = [ConfigUp.sum_l_r, ConfigForward.sum_l_r, ConfigUp.sum_l_r_f, ConfigUp.l, ConfigUp.r]
+states = [choice(adder_states) for _ in range(num_adders)] + [InjectEn.on]*num_mults
+weights = [randint(-128, 127) for _ in range(num_mults)]
+collectors = [randint(0, num_adders - 1) for _ in range(ports)]
+features = np.array([randint(-128, 127) for _ in range(ports*16)], dtype=np.int8)
+driver.write(256, features.view(np.uint8).tobytes())
+
+ops = [ConfigureStates(isa, states), ConfigureWeights(isa, weights),
+    ConfigureCollectors(isa, collectors), ConfigureRelus(isa, [1, 0, 0, 0])]
+ops += [LoadFeatures(port, 16, 256 + 4*port, 0) for port in range(ports)]
+ops += [Run(17, 1)]
+ops += [StoreFeatures(port, 16, 512 + 4*port, 0) for port in range(ports)]
+driver.write(0, assemble(ops, isa, as_bytes=True, bytes_in_packet=32).tobytes())
+driver.start_compute()
+assert(driver.get_status() == 1)
+result = np.array(driver.read(512, 2), dtype=np.uint8).view(np.int8).reshape(ports, 16)
+
+collected = [[0]*model.sram_depth for _ in range(ports)]
+Reference(model.skeleton).run(states, weights, collectors,
+    features.reshape(ports, 16).tolist(), collected, 17)
+expected = np.array(collected)[:, :16]
+expected[0] = np.maximum(expected[0], 0)
+assert((result == expected).all())
+
+# throughput of whole runs on a tree of 64 multipliers
+model = ReductionModel(7, 16, width)
+states = [ConfigUp.sum_l_r]*model.num_adders + [InjectEn.on]*model.num_mults
+model.configure_states(states)
+model.configure_weights([randint(-128, 127) for _ in range(model.num_mults)])
+model.configure_collectors(list(range(16)))
+begin = perf_counter()
+for _ in range(200):
+    model.run(63)
+elapsed = perf_counter() - begin
+print(f"{model.macs/elapsed/1e6:.1f} million MACs per second")
+print("DONE")
@@ -0,0 +1,160 @@
+from onnx.helper import make_node
+import numpy as np
+
+# conv(bias) -> relu -> conv -> add(residual)
+input_shape = 8
+channels = 2
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W1_shape = (channels,1,kernel_width,kernel_width)
+W1 = np.array([randint(-4,4) for num in range(np.prod(W1_shape))])
+W1 = W1.reshape(W1_shape).astype(np.float32)
+
+B1 = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+W2_shape = (channels,channels,kernel_width,kernel_width)
+W2 = np.array([randint(-4,4) for num in range(np.prod(W2_shape))])
+W2 = W2.reshape(W2_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['a'], outputs=['b'], name='relu1'),
+    make_node('Conv', inputs=['b', 'W2'], outputs=['c'], name='conv2',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Add', inputs=['b', 'c'], outputs=['y'], name='add1'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+W1_input = make_tensor_value_info('W1', TensorProto.FLOAT, list(W1.shape))
+B1_input = make_tensor_value_info('B1', TensorProto.FLOAT, list(B1.shape))
+W2_input = make_tensor_value_info('W2', TensorProto.FLOAT, list(W2.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+
+W1_init = make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten())
+B1_init = make_tensor('B1', TensorProto.FLOAT, list(B1.shape), B1.flatten())
+W2_init = make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_network',
+        inputs=[x_input, W1_input, B1_input, W2_input],
+        initializer=[W1_init, B1_init, W2_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_network.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_network.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# compile whole network and run with compiler's executor
+from maeri.compiler.compile import Compile
+sess = Compile("test_network.onnx", buff_length=buff_length, ports=ports)
+res_1 = sess.sim(x)
+assert(np.abs(res - res_1).sum() == 0)
+
+# both channels of conv2 fit the tree, so the only adds
+# left are the ones lowered from the residual add
+from maeri.compiler.nodes import Add
+adds = [op for op in sess.op_graph if type(op) is Add]
+assert(len(adds) == channels)
+
+# tensors that are never live together share the arena
+plan = sess.memory_plan
+print(f"arena size = {plan.arena_size}, without reuse = {plan.unplanned_size()}")
+assert(plan.arena_size < plan.unplanned_size())
+
+# solve for hardware constraints, result must not change
+sess.solve()
+res_2 = sess.sim(x)
+assert(np.abs(res - res_2).sum() == 0)
+
+# ops pack as many output rows as the ports allow, and
+# every row finds the input rows it shares with the same
+# row of the op before in place
+from maeri.compiler.solver import feature_loads, multiplier_utilization
+from maeri.compiler.nodes import Conv2
+convs = [op for op in sess.op_graph if type(op) is Conv2]
+loads = feature_loads(convs)
+print(f"feature loads = {loads}, without reuse = {feature_loads(convs, reuse=False)}")
+assert(any([op.resident > 0 for op in convs]))
+assert(loads < feature_loads(convs, reuse=False))
+
+# 16 ports fit 4 rows of conv1, of three filter rows and
+# a bias, and 2 rows of conv2, of six filter rows
+rows = [op.res.slice[2] for op in convs]
+rows = [(row.stop - row.start) if isinstance(row, slice) else 1 for row in rows]
+assert(max(rows) == 4)
+utilization = multiplier_utilization(convs, sess.mults)
+print(f"multiplier utilization = {utilization}")
+assert(utilization > 0.5)
+
+# whole layer evaluation agrees with the per op path
+res_3 = sess.sim(x, fast=True)
+assert(np.abs(res - res_3).sum() == 0)
+
+# compile once for a batch of images, every image
+# must match the unbatched reference
+batch = 3
+xs = np.array([randint(-4,4) for num in range(batch*np.prod(x_shape))])
+xs = xs.reshape((batch,) + x_shape[1:]).astype(np.float32)
+ref_sess = rt.InferenceSession('test_network.onnx')
+refs = np.concatenate([ref_sess.run(['y'], {'x':xs[n:n + 1]})[0] for n in range(batch)])
+
+batch_sess = Compile("test_network.onnx", buff_length=buff_length, ports=ports,
+    batch_size=batch)
+batch_sess.solve()
+assert(np.abs(refs - batch_sess.sim(xs)).sum() == 0)
+assert(np.abs(refs - batch_sess.sim(xs, fast=True)).sum() == 0)
+
+# the batch does not multiply the number of ops
+assert(len(batch_sess.op_graph) == len(sess.op_graph))
+
+# place memories on a device like the ulx3s
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**23}
+memory_map = sess.bake_offsets(config, program_size=1024)
+for region in memory_map.regions:
+    assert(region.address % 32 == 0)
+    assert(region.address >= 1024)
+
+# constants, padding and the constant feature of biases
+# are uploaded with a single transfer
+constants = [region.memory for region in memory_map.regions
+    if region.kind in {"zeros", "ones", "constant"}]
+transfers = memory_map.transfers(constants)
+assert(len(transfers) == 1)
+assert(len(transfers[0][1]) % 32 == 0)
+
+# slices resolve to device addresses
+offsets = sess.entrypoint.mem_ref.get_offset((0, 0, slice(0, 2), slice(0, 8)))
+base = sess.entrypoint.mem_ref.offset
+assert(list(offsets.keys()) == [base, base + 8*memory_map.wordsize])
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_network.onnx")
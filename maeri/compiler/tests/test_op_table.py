@@ -0,0 +1,115 @@
+from onnx.helper import make_node
+import numpy as np
+
+# conv(bias) -> relu -> conv -> add(residual), kept as an op table
+input_shape = 16
+channels = 2
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W1_shape = (channels,1,kernel_width,kernel_width)
+W1 = np.array([randint(-4,4) for num in range(np.prod(W1_shape))])
+W1 = W1.reshape(W1_shape).astype(np.float32)
+
+B1 = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+W2_shape = (channels,channels,kernel_width,kernel_width)
+W2 = np.array([randint(-4,4) for num in range(np.prod(W2_shape))])
+W2 = W2.reshape(W2_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['a'], outputs=['b'], name='relu1'),
+    make_node('Conv', inputs=['b', 'W2'], outputs=['c'], name='conv2',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Add', inputs=['b', 'c'], outputs=['y'], name='add1'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+W1_input = make_tensor_value_info('W1', TensorProto.FLOAT, list(W1.shape))
+B1_input = make_tensor_value_info('B1', TensorProto.FLOAT, list(B1.shape))
+W2_input = make_tensor_value_info('W2', TensorProto.FLOAT, list(W2.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+
+W1_init = make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten())
+B1_init = make_tensor('B1', TensorProto.FLOAT, list(B1.shape), B1.flatten())
+W2_init = make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_op_table',
+        inputs=[x_input, W1_input, B1_input, W2_input],
+        initializer=[W1_init, B1_init, W2_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_op_table.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_op_table.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# compile the same network as op objects and as a table
+from maeri.compiler.compile import Compile
+from maeri.compiler.op_table import OpTable
+objects = Compile("test_op_table.onnx", buff_length=buff_length, ports=ports)
+table = Compile("test_op_table.onnx", buff_length=buff_length, ports=ports,
+    compact=True)
+assert(isinstance(table.op_graph, OpTable))
+assert(len(table.op_graph) == len(objects.op_graph))
+assert(np.abs(res - table.sim(x)).sum() == 0)
+
+# both paths solve to the same ops, in the same order
+from maeri.compiler.solver import solve_table
+unsolved = OpTable.from_ops(objects.op_graph)
+objects.solve()
+solved = solve_table(unsolved, buff_length, ports, objects.mults)
+assert(len(solved) == len(objects.op_graph))
+for op, view in zip(objects.op_graph, solved):
+    assert(view.layer is op.layer)
+    if hasattr(op, 'pad_left'):
+        assert([op.pad_left, op.pad_upper, op.pad_right, op.pad_bottom] ==
+            [view.pad_left, view.pad_upper, view.pad_right, view.pad_bottom])
+        assert(view.resident == op.resident)
+    for name in ['X', 'W', 'res', 'bias', 'A', 'B', 'C', 'data']:
+        if hasattr(op, name) and getattr(op, name) is not None:
+            assert(getattr(view, name).slice == getattr(op, name).slice)
+            assert(getattr(view, name).mem_ref is getattr(op, name).mem_ref)
+print(f"{len(solved)} ops in {solved.ops.nbytes} bytes")
+
+# solved tables simulate op by op and layer by layer
+table.solve()
+assert(len(table.op_graph) == len(solved))
+assert(np.abs(res - table.sim(x)).sum() == 0)
+assert(np.abs(res - table.sim(x, fast=True)).sum() == 0)
+
+# and convert back to op objects
+table.op_graph = table.op_graph.to_ops()
+assert(np.abs(res - table.sim(x)).sum() == 0)
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_op_table.onnx")
@@ -0,0 +1,105 @@
+from onnx.helper import make_node, make_tensor_value_info
+from onnx.helper import make_tensor, make_graph, make_model
+from onnx import TensorProto
+import numpy as np
+import onnx
+
+# conv(bias) -> relu -> conv -> add(residual), with real
+# valued weights and more weights per filter than the
+# tree holds, so every convolution is split into passes
+rng = np.random.default_rng(5)
+channels = 4
+x_shape = (1, 2, 8, 8)
+W1 = rng.normal(0, 0.4, (channels, 2, 3, 3)).astype(np.float32)
+B1 = rng.normal(0, 0.2, channels).astype(np.float32)
+W2 = rng.normal(0, 0.2, (channels, channels, 3, 3)).astype(np.float32)
+y_shape = [1, channels, 8, 8]
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'], name='conv1',
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Relu', inputs=['a'], outputs=['b'], name='relu1'),
+    make_node('Conv', inputs=['b', 'W2'], outputs=['c'], name='conv2',
+        kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4),
+    make_node('Add', inputs=['b', 'c'], outputs=['y'], name='add1'),
+    ]
+graph = make_graph(nodes=nodes, name='test_quantize',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x_shape))],
+    initializer=[make_tensor(name, TensorProto.FLOAT, list(data.shape), data.flatten())
+        for name, data in [('W1', W1), ('B1', B1), ('W2', W2)]],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, y_shape)])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_quantize.onnx')
+
+import onnxruntime as rt
+runtime = rt.InferenceSession('test_quantize.onnx')
+samples = [rng.normal(0, 1, x_shape).astype(np.float32) for _ in range(8)]
+test = rng.normal(0, 1, x_shape).astype(np.float32)
+expected = runtime.run(['y'], {'x' : test})[0]
+
+from maeri.compiler.compile import Compile
+from maeri.compiler.assembler.opcodes import ConfigureWeights
+results = []
+for per_channel, compact in [(False, False), (True, False), (True, True)]:
+    print(f"per_channel = {per_channel}, compact = {compact}")
+    sess = Compile("test_quantize.onnx", buff_length=16, ports=8, mults=16,
+        wordsize=1, compact=compact)
+    assert(np.allclose(sess.sim(test, fast=True), expected, atol=1e-4))
+    report = sess.quantize(samples, per_channel=per_channel)
+    quantization = sess.quantization
+
+    # weights are rewritten to int8, scales match the
+    # truncation of the multipliers, the convolution
+    # without a bias gains one to correct
+    for name in ['W1', 'B1', 'W2', 'c_bias']:
+        memory = [memory for memory in sess.memories if memory.name == name][0]
+        assert(memory.data.dtype == np.int8)
+        assert(np.abs(memory.data.astype(int)).max() <= 127)
+    assert(quantization.shift == 7)
+
+    # every layer output is reported, and the integer model
+    # follows the float one
+    assert(set(report) == {'a', 'b', 'c', 'y'})
+    for name, error in report.items():
+        assert(error['sqnr'] > 12)
+    result = sess.sim(test)
+    sqnr = 10*np.log10(np.sum(expected**2)/np.sum((result - expected)**2))
+    print(f"test SQNR {sqnr:.1f} dB")
+    assert(sqnr > 12)
+    if compact:
+        assert((result == results[-1]).all())
+    results += [result]
+
+    # solving leaves the integer model as it is
+    sess.solve()
+    sess.reorder()
+    assert((sess.sim(test) == result).all())
+
+    # the model is not quantized twice
+    try:
+        sess.quantize(samples)
+        assert(False)
+    except RuntimeError:
+        pass
+
+# elementwise ops weigh their operands by their gains, on
+# a tree holding every filter at once
+sess = Compile("test_quantize.onnx", buff_length=16, ports=16, mults=64, wordsize=1)
+sess.quantize(samples)
+sess.solve()
+sess.reorder()
+sess.map()
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**16}
+sess.bake_offsets(config, program_size=1024)
+program = sess.codegen()
+gains = set()
+for instruction in program.instructions:
+    if type(instruction) is ConfigureWeights:
+        gains |= set(instruction.weights)
+for layer, layer_gains in sess.quantization.gains.items():
+    assert(set(np.concatenate(layer_gains).tolist()) <= gains)
+assert(127 in gains)
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_quantize.onnx")
@@ -0,0 +1,125 @@
+from onnx.helper import make_node
+import numpy as np
+
+# two convolutions sharing one filter, one of them behind
+# a relu, so their ops can only be grouped once the relu
+# has run. The residual keeps x alive, so no activation
+# reuses its storage while the convolutions run.
+input_shape = 8
+channels = 2
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,channels,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W_shape = (channels,channels,kernel_width,kernel_width)
+W = np.array([randint(-4,4) for num in range(np.prod(W_shape))])
+W = W.reshape(W_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W'], outputs=['a'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['x'], outputs=['r'], name='relu1'),
+    make_node('Conv', inputs=['r', 'W'], outputs=['b'], name='conv2',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Add', inputs=['a', 'b'], outputs=['s'], name='add1'),
+    make_node('Add', inputs=['s', 'x'], outputs=['y'], name='add2'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+W_init = make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_reorder',
+        inputs=[x_input],
+        initializer=[W_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_reorder.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_reorder.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# compile, solve and reorder
+from maeri.compiler.compile import Compile
+sess = Compile("test_reorder.onnx", buff_length=buff_length, ports=ports)
+sess.solve()
+count = len(sess.op_graph)
+
+# each filter is configured once for both convolutions
+# instead of once per convolution
+saved = sess.reorder()
+assert(saved == channels)
+assert(len(sess.op_graph) == count)
+
+# dependencies are respected
+assert(np.abs(res - sess.sim(x)).sum() == 0)
+assert(np.abs(res - sess.sim(x, fast=True)).sum() == 0)
+
+# reordering an already grouped graph changes nothing
+assert(sess.reorder() == 0)
+
+# tables are reordered alike
+table = Compile("test_reorder.onnx", buff_length=buff_length, ports=ports,
+    compact=True)
+table.solve()
+assert(table.reorder() == channels)
+assert(np.abs(res - table.sim(x)).sum() == 0)
+
+# only the last writer and the readers since are linked,
+# every other conflicting pair is ordered through them
+from maeri.compiler.solver.reorder import dependencies
+from maeri.compiler.op_table import RESULT
+ops = table.op_graph.ops
+src, dst = dependencies(ops, table.op_graph.memories)
+assert((src < dst).all())
+assert(len(src) < 4*len(ops))
+after = [set() for op in ops]
+for index in reversed(range(len(ops))):
+    for later in dst[src == index]:
+        after[index] |= {later} | after[later]
+
+def conflict(a, b):
+    for operand_a in range(4):
+        for operand_b in range(4):
+            if RESULT not in (operand_a, operand_b):
+                continue
+            tensor = ops['tensor'][a, operand_a]
+            if tensor < 0 or tensor != ops['tensor'][b, operand_b]:
+                continue
+            if ((ops['start'][a, operand_a] < ops['stop'][b, operand_b]) &
+                    (ops['start'][b, operand_b] < ops['stop'][a, operand_a])).all():
+                return True
+    return False
+
+for b in range(len(ops)):
+    for a in range(b):
+        assert(not conflict(a, b) or b in after[a])
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_reorder.onnx")
@@ -0,0 +1,45 @@
+from onnx.helper import make_node, make_graph, make_model
+from onnx.helper import make_tensor_value_info
+from onnx import TensorProto
+
+from maeri.compiler.schedule import schedule
+
+# build a small diamond shaped graph whose nodes
+# are listed in reverse topological order
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, [1, 1, 4, 4])
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, [1, 1, 4, 4])
+
+nodes = [
+    make_node('Add', inputs=['b', 'c'], outputs=['y'], name='join'),
+    make_node('Relu', inputs=['a'], outputs=['c'], name='right'),
+    make_node('Relu', inputs=['a'], outputs=['b'], name='left'),
+    make_node('Relu', inputs=['x'], outputs=['a'], name='root'),
+    ]
+
+graph = make_graph(
+        nodes=nodes,
+        name='diamond',
+        inputs=[x_input],
+        outputs=[y_output])
+model = make_model(graph, producer_name='onnx-example')
+
+# graph order is kept wherever dependencies allow
+ordered = [node.name for node in schedule(model)]
+assert(ordered == ['root', 'right', 'left', 'join'])
+
+# the model must not be mutated by scheduling
+assert(len(model.graph.node) == 4)
+
+# a priority hook can reorder ready nodes
+ordered = [node.name for node in schedule(model, priority=lambda node: node.name)]
+assert(ordered == ['root', 'left', 'right', 'join'])
+
+# unsatisfiable inputs are reported instead of looping
+model.graph.node.append(make_node('Relu', inputs=['z'], outputs=['w'], name='orphan'))
+try:
+    schedule(model)
+    raise AssertionError("expected unsatisfiable graph to raise")
+except ValueError:
+    pass
+
+print("DONE")
@@ -0,0 +1,120 @@
+from onnx.helper import make_node
+import numpy as np
+
+# conv(bias) -> relu -> conv -> add(residual), tiled by cost
+input_shape = 14
+channels = 2
+kernel_width = 3
+padding = 1
+buff_length = 8
+ports = 16
+
+print(f"input_shape = {input_shape}, channels = {channels}")
+
+# randomly generate test vectors
+from random import randint
+x_shape = (1,1,input_shape,input_shape)
+x = np.array([randint(-4,4) for num in range(np.prod(x_shape))])
+x = x.reshape(x_shape).astype(np.float32)
+
+W1_shape = (channels,1,kernel_width,kernel_width)
+W1 = np.array([randint(-4,4) for num in range(np.prod(W1_shape))])
+W1 = W1.reshape(W1_shape).astype(np.float32)
+
+B1 = np.array([randint(-4,4) for num in range(channels)]).astype(np.float32)
+
+W2_shape = (channels,channels,kernel_width,kernel_width)
+W2 = np.array([randint(-4,4) for num in range(np.prod(W2_shape))])
+W2 = W2.reshape(W2_shape).astype(np.float32)
+
+nodes = [
+    make_node('Conv', inputs=['x', 'W1', 'B1'], outputs=['a'], name='conv1',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Relu', inputs=['a'], outputs=['b'], name='relu1'),
+    make_node('Conv', inputs=['b', 'W2'], outputs=['c'], name='conv2',
+        kernel_shape=[kernel_width]*2, strides=[1, 1], pads=[padding]*4),
+    make_node('Add', inputs=['b', 'c'], outputs=['y'], name='add1'),
+    ]
+
+import onnx
+from onnx.helper import make_tensor_value_info
+from onnx.helper import make_tensor, make_graph
+from onnx.helper import make_model
+from onnx import TensorProto
+
+y_shape = [1, channels, input_shape, input_shape]
+
+x_input = make_tensor_value_info('x', TensorProto.FLOAT, list(x.shape))
+W1_input = make_tensor_value_info('W1', TensorProto.FLOAT, list(W1.shape))
+B1_input = make_tensor_value_info('B1', TensorProto.FLOAT, list(B1.shape))
+W2_input = make_tensor_value_info('W2', TensorProto.FLOAT, list(W2.shape))
+y_output = make_tensor_value_info('y', TensorProto.FLOAT, y_shape)
+
+W1_init = make_tensor('W1', TensorProto.FLOAT, list(W1.shape), W1.flatten())
+B1_init = make_tensor('B1', TensorProto.FLOAT, list(B1.shape), B1.flatten())
+W2_init = make_tensor('W2', TensorProto.FLOAT, list(W2.shape), W2.flatten())
+
+graph = make_graph(
+        nodes=nodes,
+        name='test_tiling',
+        inputs=[x_input, W1_input, B1_input, W2_input],
+        initializer=[W1_init, B1_init, W2_init],
+        outputs=[y_output])
+
+# write model to file
+model_def = make_model(graph, producer_name='onnx-example')
+onnx.checker.check_model(model_def)
+onnx.save(model_def, 'test_tiling.onnx')
+
+# run model with onnx runtime
+import onnxruntime as rt
+sess = rt.InferenceSession('test_tiling.onnx')
+res = sess.run(['y'], {'x':x})[0]
+
+# greedy solution for reference
+from maeri.compiler.compile import Compile
+from maeri.compiler.nodes import Conv2
+greedy = Compile("test_tiling.onnx", buff_length=buff_length, ports=ports)
+greedy.solve()
+greedy_convs = [op for op in greedy.op_graph if type(op) is Conv2]
+
+# tile by cost, the result must not change
+from maeri.compiler.solver import CostModel, TilingSolver
+tiled = Compile("test_tiling.onnx", buff_length=buff_length, ports=ports)
+tiled.solve(cost_model=CostModel(wordsize=tiled.wordsize))
+assert(np.abs(res - tiled.sim(x)).sum() == 0)
+assert(np.abs(res - tiled.sim(x, fast=True)).sum() == 0)
+
+# even tiles need fewer ops than halving the 14 columns,
+# and bands of rows fewer than one op per row
+tiled_convs = [op for op in tiled.op_graph if type(op) is Conv2]
+print(f"greedy convs = {len(greedy_convs)}, tiled convs = {len(tiled_convs)}")
+assert(len(tiled_convs) < len(greedy_convs))
+
+# every tile fits the buffers and ports
+from maeri.compiler.solver.solve_conv import verify_buff_Lengths, verify_weight_lengths
+verify_buff_Lengths(tiled_convs, buff_length)
+verify_weight_lengths(tiled_convs, tiled.ports, tiled.mults)
+
+# the cheapest tiling uses as few tiles as fit, every
+# row of a band takes up a port per filter row and one
+# for the bias, so 16 ports fit bands of 4 rows
+solver = TilingSolver(buff_length, ports, tiled.mults)
+geometry = (input_shape, input_shape, kernel_width, kernel_width, 1, kernel_width**2 + 1,
+    kernel_width + 1)
+tiling = solver.choose(geometry)
+assert(tiling.width_tiles == 3)
+assert(tiling.row_bands == 4)
+assert(0 < tiling.costs['utilization'] <= 1)
+
+# tables are tiled as well
+table = Compile("test_tiling.onnx", buff_length=buff_length, ports=ports,
+    compact=True)
+table.solve(cost_model=CostModel())
+assert(len(table.op_graph) == len(tiled.op_graph))
+assert(np.abs(res - table.sim(x)).sum() == 0)
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_tiling.onnx")
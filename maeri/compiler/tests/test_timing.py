@@ -0,0 +1,98 @@
+from maeri.compiler.assembler.opcodes import ISA, Debug
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run
+from maeri.compiler.assembler.states import ConfigUp, InjectEn
+from maeri.compiler.assembler.assemble import assemble
+from maeri.compiler.assembler.timing import TimingModel
+
+from random import randint
+import numpy as np
+
+# the program of ``compute_unit/test_top.py`` on the tree
+# of the simulated platform
+isa = ISA.for_tree(32, 16)
+states = [ConfigUp.sum_l_r]*isa.num_adders + [InjectEn.on]*isa.num_mults
+weights = [randint(-128, 127) for _ in range(isa.num_mults)]
+ops = [ConfigureStates(isa, states), ConfigureWeights(isa, weights), Debug()]
+image = assemble(ops, isa, as_bytes=True)
+
+timing = TimingModel(isa).predict(image)
+print(timing.report())
+
+# every opcode and the first parameter begin a line, every
+# access takes a cycle to request and one for the data
+fetch_op = 2 + 2 + 2 + 2
+fetch_params = 3 + 3
+configure_states = 2*16 + 1
+configure_weights = 2*(8 + 1)
+# the debug store reads lines 253 and 255 a byte at a
+# time, then builds and writes lines 253 to 255
+debug = 5 + 5 + 3*(4 + 2)
+assert(timing.cycles == {'FETCH_OP' : fetch_op, 'FETCH_PARAMS' : fetch_params,
+    'CONFIGURE_STATES' : configure_states, 'CONFIGURE_WEIGHTS' : configure_weights,
+    'DEBUG' : debug})
+assert(timing.total == 93)
+assert(timing.stalls == {'memory' : 4 + 16 + 9 + 5, 'arbitration' : 0})
+
+# loads take a cycle per byte and one more per line begun,
+# runs drain through the collected adder
+ops = [LoadFeatures(0, 6, 64, 2), Run(6, 1), StoreFeatures(0, 4, 80, 0)]
+timing = TimingModel(isa).predict(assemble(ops, isa, as_bytes=True))
+print(timing.report())
+assert(timing.cycles['LOAD_FEATURES'] == 6 + 2)
+assert(timing.cycles['RUN'] == 6 + 6)
+assert(timing.cycles['STORE_FEATURES'] == 5 + 5 + 4 + 2)
+
+# a host reading memory while the program runs delays the
+# writes of the compute unit and the reads it does not
+# overlap, never more than by its own accesses
+contended = TimingModel(isa, host_period=3).predict(image)
+print(contended.report())
+assert(contended.stalls['arbitration'] > 0)
+assert(contended.total == 93 + contended.stalls['arbitration'])
+
+# a compiled network
+from onnx.helper import make_node, make_tensor_value_info
+from onnx.helper import make_tensor, make_graph, make_model
+from onnx import TensorProto
+import onnx
+
+x_shape = (1, 1, 8, 8)
+W = np.array([randint(-4, 4) for _ in range(2*9)]).reshape(2, 1, 3, 3).astype(np.float32)
+nodes = [make_node('Conv', inputs=['x', 'W'], outputs=['y'], name='conv1',
+    kernel_shape=[3, 3], strides=[1, 1], pads=[1]*4)]
+graph = make_graph(nodes=nodes, name='test_timing',
+    inputs=[make_tensor_value_info('x', TensorProto.FLOAT, list(x_shape))],
+    initializer=[make_tensor('W', TensorProto.FLOAT, list(W.shape), W.flatten())],
+    outputs=[make_tensor_value_info('y', TensorProto.FLOAT, [1, 2, 8, 8])])
+onnx.save(make_model(graph, producer_name='onnx-example'), 'test_timing.onnx')
+
+from maeri.compiler.compile import Compile
+sess = Compile("test_timing.onnx", buff_length=16, ports=16, mults=64, wordsize=1)
+sess.solve()
+sess.reorder()
+sess.map()
+config = {'b_in_line' : 4, 'b_in_packet' : 32, 'm_depth' : 2**16}
+sess.bake_offsets(config, program_size=1024)
+sess.codegen()
+timing = sess.estimate()
+print(timing.report())
+
+# every run lasts its length and the drain of the deepest
+# adder collected
+from maeri.compiler.assembler.opcodes import ConfigureCollectors
+run_cycles = 0
+for op in sess.program.instructions:
+    if type(op) is ConfigureCollectors:
+        latency = max([7 - int(np.log2(node + 1)) for node in op.node_ids])
+    if type(op) is Run:
+        run_cycles += op.len_runtime + latency
+assert(timing.cycles['RUN'] == run_cycles)
+assert(timing.total == sum(timing.cycles.values()))
+assert(0 < timing.utilization < 1)
+assert(timing.macs > 0)
+print("DONE")
+
+# delete generated model
+import os
+os.remove("test_timing.onnx")
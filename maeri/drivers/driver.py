@@ -1,3 +1,17 @@
+class DriverBase():
+    """
+    Transfers shared by every driver, built on the
+    ``write`` each driver implements for its device.
+    """
+    def upload(self, memory_map, memories):
+        """
+        Writes ``memories`` to the addresses given by
+        ``memory_map``, coalescing adjacent memories into
+        one transfer.
+        """
+        for start_adress, data in memory_map.transfers(memories):
+            self.write(start_adress, bytes(data))
+
 def Driver(platform):
     if platform == 'ulx3s':
         from maeri.drivers.fpga_driver import FPGADriver
@@ -1,9 +1,10 @@
 import usb.core
 import usb.util
 from json import loads
-from maeri.compiler.assembler import opcodes
+from maeri.compiler.assembler.opcodes import ISA
+from maeri.drivers.driver import DriverBase
 
-class FPGADriver():
+class FPGADriver(DriverBase):
     def __init__(self):
         # find our device
         dev = usb.core.find(idVendor=0x16d0, idProduct=0x0f3b)
@@ -39,6 +40,7 @@ class FPGADriver():
 
         config = loads(self.get_config())
         print(f"device config = {config}")
+        self.config = config
         self.max_packet_size = config['b_in_packet']
         self.mem_width = config['b_in_line']
         self.mem_depth = config['m_depth']
@@ -46,11 +48,9 @@ class FPGADriver():
         self.no_mults = config['no.mults']
         self.packets_in_mem = (self.mem_depth * self.mem_width)//self.max_packet_size
         self.mem_size = self.mem_depth * self.mem_width
-        opcodes.InitISA(_bytes_in_address=3,
-                        _num_nodes= (2*self.no_mults) - 1,
-                        _num_adders= (self.no_mults - 1),
-                        _num_mults=self.no_mults,
-                        _input_width=8
+        self.isa = ISA.for_tree(self.no_mults, self.ports,
+                        bytes_in_address=3,
+                        input_width=8
                         )
 
     def get_config(self):
@@ -0,0 +1,237 @@
+from maeri.compiler.assembler.opcodes import ISA, Opcodes
+from maeri.compiler.assembler.opcodes import ConfigureStates, ConfigureWeights
+from maeri.compiler.assembler.opcodes import ConfigureCollectors, ConfigureRelus
+from maeri.compiler.assembler.opcodes import LoadFeatures, StoreFeatures, Run, Debug
+from maeri.compiler.assembler.states import InjectEn
+from maeri.compiler.mapper import TreeMapper, wrap
+from maeri.drivers.driver import DriverBase
+
+from json import dumps
+import numpy as np
+
+op_v_type = {op_type.op : op_type for op_type in [ConfigureStates, ConfigureWeights,
+    ConfigureCollectors, ConfigureRelus, LoadFeatures, StoreFeatures, Run, Debug]}
+
+class ReductionModel():
+    def __init__(self, depth, num_ports, INPUT_WIDTH=8, sram_depth=64):
+        """
+        Bit accurate model of ``ReductionNetwork`` evaluating
+        whole runs at once on NumPy arrays.
+
+        Multipliers keep the bits ``Product_out[(INPUT_WIDTH - 1):-1]``
+        of their product and adders wrap around to
+        ``INPUT_WIDTH`` bits. A multiplier that does not
+        inject reads the feature its right neighbour held the
+        cycle before, so it sees the stream of the nearest
+        injecting multiplier to its right delayed by one
+        cycle per multiplier in between.
+
+        An injection sram is read one cycle after its address
+        is presented, the collector of a node with latency
+        ``L`` writes from cycle ``L + 1`` of a run on, so
+        entry ``j`` of every collector holds the sum of
+        column ``j`` of the injection srams. Between runs
+        every port keeps presenting the last feature it read,
+        the tree is assumed to have settled on them by the
+        next run.
+
+        Attributes:
+        ===========
+        self.injection_srams:
+            features of every port, as written by loads
+        self.collection_srams:
+            sums collected by every port
+        self.held:
+            feature every port presents between runs
+        self.macs:
+            multiply accumulates evaluated so far
+        """
+        self.INPUT_WIDTH = INPUT_WIDTH
+        self.num_ports = num_ports
+        self.sram_depth = sram_depth
+        self.mapper = TreeMapper(depth, num_ports)
+        self.skeleton = skeleton = self.mapper.skeleton
+        self.num_adders = len(skeleton.adder_nodes)
+        self.num_mults = len(skeleton.mult_nodes)
+        self.latency = np.array([node.latency for node in skeleton.all_nodes])
+
+        # the nodes come up in their reset state
+        self.states = np.zeros(self.num_adders + self.num_mults, dtype=int)
+        self.weights = np.zeros(self.num_mults, dtype=np.int64)
+        self.collectors = np.zeros(num_ports, dtype=int)
+        self.relus = np.zeros(num_ports, dtype=bool)
+        self.source = np.full(self.num_mults, num_ports)
+        self.delay = np.zeros(self.num_mults, dtype=int)
+
+        self.injection_srams = np.zeros((num_ports, sram_depth), dtype=np.int64)
+        self.collection_srams = np.zeros((num_ports, sram_depth), dtype=np.int64)
+        self.held = np.zeros(num_ports, dtype=np.int64)
+        self.macs = 0
+
+    def configure_states(self, states):
+        self.states = np.asarray(states, dtype=int)
+
+        inject = self.states[self.num_adders:] == InjectEn.on
+        self.source, self.delay = self.mapper.feeds(inject)
+
+    def configure_weights(self, weights):
+        self.weights = np.asarray(weights, dtype=np.int64)
+
+    def configure_collectors(self, node_ids):
+        self.collectors = np.asarray(node_ids, dtype=int)
+
+    def configure_relus(self, enables):
+        self.relus = np.asarray(enables, dtype=bool)
+
+    def run(self, length):
+        """
+        Streams the first ``length - 1`` features of every
+        injection sram through the tree, leaving ``length - 1``
+        sums in every collection sram.
+        """
+        if not (1 <= length <= self.sram_depth - 1):
+            raise RuntimeError(f"Run of {length} does not fit srams of {self.sram_depth}.")
+        entries = length - 1
+
+        # the feature of cycle ``c`` is the one read from
+        # address ``c - 1``, the held one until the first read
+        # and the last one read after the final address
+        cycles = np.arange(1, entries + 1)[:, np.newaxis] - self.delay
+        addresses = np.clip(cycles - 1, 0, max(entries - 1, 0))
+        features = np.concatenate([self.injection_srams, np.zeros((1, self.sram_depth),
+            dtype=np.int64)])[self.source, addresses]
+        held = np.concatenate([self.held, [0]])[self.source]
+        features = np.where(cycles <= 0, held, features)
+
+        width = self.INPUT_WIDTH
+        products = wrap((features*self.weights) >> (width - 1), width)
+        sums = self.mapper.reduce(self.states, products, width=width)
+        self.macs += products.size
+
+        # collectors of multipliers write zeros, collectors of
+        # nodes deeper than the run write nothing
+        for port, node in enumerate(self.collectors):
+            if self.latency[node] + 1 > entries:
+                continue
+            collected = sums[:, node] if node < self.num_adders else np.zeros(entries)
+            if self.relus[port]:
+                collected = np.maximum(collected, 0)
+            self.collection_srams[port, :entries] = collected
+
+        if entries > 0:
+            self.held = self.injection_srams[:, entries - 1].copy()
+
+class ModelDriver(DriverBase):
+    def __init__(self, config, wordsize=1, INPUT_WIDTH=8):
+        """
+        Runs assembled programs on ``ReductionModel`` in place
+        of a device, with the interface of the other drivers.
+
+        ``config`` is a device configuration as ``get_config``
+        reports it. Loads read the low ``INPUT_WIDTH`` bits
+        of elements of ``wordsize`` bytes, stores write the
+        sums sign extended to ``wordsize`` bytes. Addresses
+        take as many bytes as lines of ``m_depth`` need, as
+        ``Compile.codegen`` assembles them.
+        """
+        self.config = config
+        self.max_packet_size = config['b_in_packet']
+        self.mem_width = config['b_in_line']
+        self.mem_depth = config['m_depth']
+        self.ports = config['ports']
+        self.no_mults = config['no.mults']
+        self.packets_in_mem = (self.mem_depth * self.mem_width)//self.max_packet_size
+        self.mem_size = self.mem_depth * self.mem_width
+        self.wordsize = wordsize
+        bits = max(1, int(np.ceil(np.log2(self.mem_depth))))
+        self.isa = ISA.for_tree(self.no_mults, self.ports,
+                        bytes_in_address=-(-bits//8),
+                        input_width=INPUT_WIDTH
+                        )
+
+        depth = int(np.log2(self.no_mults)) + 1
+        self.model = ReductionModel(depth, self.ports, INPUT_WIDTH)
+        self.mem = np.zeros(self.mem_size, dtype=np.uint8)
+        self.status = Opcodes.reset
+
+    def get_config(self):
+        return dumps(self.config)
+
+    def get_status(self):
+        return int(self.status)
+
+    def write(self, start_adress, data):
+        """
+        Writes ``data`` from line ``start_adress`` on.
+        """
+        if (len(data) % self.max_packet_size):
+            raise ValueError("DATA MUST BE MULTIPLE OF max_packet_size")
+        data = np.frombuffer(bytes(data), dtype=np.uint8)
+        start = start_adress*self.mem_width
+        self.mem[start:start + len(data)] = data
+
+    def read(self, start_adress, length):
+        """
+        Reads ``length`` packets from line ``start_adress`` on.
+        """
+        start = start_adress*self.mem_width
+        return self.mem[start:start + length*self.max_packet_size].tolist()
+
+    def payload(self, address, lead, length):
+        start = address*self.mem_width + lead
+        return self.mem[start:start + length]
+
+    def elements(self, start, count):
+        data = self.mem[start:start + count*self.wordsize].reshape(count, self.wordsize)
+        values = (data.astype(np.int64) << (8*np.arange(self.wordsize))).sum(axis=1)
+        return wrap(values, self.model.INPUT_WIDTH)
+
+    def start_compute(self):
+        """
+        Executes the program at address 0 up to its reset.
+        """
+        isa = self.isa
+        model = self.model
+        write_pointer = np.zeros(self.ports, dtype=int)
+        pc = 0
+        while self.mem[pc] != Opcodes.reset:
+            op_type = op_v_type.get(int(self.mem[pc]))
+            if op_type is None:
+                raise RuntimeError(f"Undefined opcode {self.mem[pc]} at {pc}.")
+            params = self.mem[pc + 1:pc + 1 + op_type.num_params(isa)].tolist()
+            address = int.from_bytes(bytes(params[:isa.bytes_in_address]), 'little')
+            pc += 1 + op_type.num_params(isa)
+
+            if op_type is ConfigureStates:
+                model.configure_states(self.payload(address, 0, isa.num_nodes))
+            elif op_type is ConfigureWeights:
+                lead = isa.num_adders % self.mem_width
+                weights = self.payload(address, lead, isa.num_mults)
+                model.configure_weights(wrap(weights, isa.INPUT_WIDTH))
+            elif op_type is ConfigureCollectors:
+                model.configure_collectors(self.payload(address, 0, isa.num_ports))
+            elif op_type is ConfigureRelus:
+                model.configure_relus(self.payload(address, 0, isa.num_ports))
+
+            elif op_type in {LoadFeatures, StoreFeatures}:
+                offset, port, count = params[isa.bytes_in_address:]
+                start = address*self.mem_width + offset
+                if op_type is LoadFeatures:
+                    # loads after a run refill the sram from
+                    # its first entry
+                    begin = write_pointer[port]
+                    if begin + count > model.sram_depth:
+                        raise RuntimeError(f"Loading {count} features into port {port} " +\
+                            f"overflows its {model.sram_depth} entries.")
+                    model.injection_srams[port, begin:begin + count] = self.elements(start, count)
+                    write_pointer[port] += count
+                else:
+                    values = model.collection_srams[port, :count]
+                    data = (values[:, np.newaxis] >> (8*np.arange(self.wordsize))) & 0xFF
+                    self.mem[start:start + count*self.wordsize] = data.reshape(-1)
+
+            elif op_type is Run:
+                model.run(params[0])
+                write_pointer[:] = 0
+
+        self.status = Opcodes.reset
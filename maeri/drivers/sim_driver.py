@@ -10,10 +10,11 @@ from maeri.gateware.platform.sim.serial_model import inject_packet, recieve_pack
 from maeri.common.domains import comm_domain, comm_period
 from maeri.common.domains import compute_domain, compute_period
 
+from maeri.drivers.driver import DriverBase
 from json import loads
 
 
-class SimDriver():
+class SimDriver(DriverBase):
     def __init__(self):
         top = Top(max_packet_size=max_packet_size)
         dut = Module()
@@ -30,6 +31,7 @@ class SimDriver():
 
         config = loads(self.get_config())
         print(f"device config = {config}")
+        self.config = config
         self.max_packet_size = config['b_in_packet']
         self.mem_width = config['b_in_line']
         self.mem_depth = config['m_depth']
@@ -37,6 +39,8 @@ class SimDriver():
         self.no_mults = config['no.mults']
         self.packets_in_mem = (self.mem_depth * self.mem_width)//self.max_packet_size
         self.mem_size = self.mem_depth * self.mem_width
+        # the simulated tree shares its ISA
+        self.isa = top.compute_unit.isa
     
     def start_compute(self):
         def send():
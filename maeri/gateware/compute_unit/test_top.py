@@ -1,6 +1,7 @@
-from maeri.gateware.compute_unit.top import Top
+from maeri.gateware.compute_unit.top import Top, State
 from maeri.gateware.platform.sim.mem import Mem
 from maeri.compiler.assembler.assemble import assemble
+from maeri.compiler.assembler.timing import TimingModel
 
 from nmigen import Signal, Array
 from nmigen import Elaboratable, Module
@@ -10,7 +11,11 @@ from maeri.compiler.assembler import opcodes
 from maeri.compiler.assembler.opcodes import LoadFeatures
 from maeri.compiler.assembler.states import InjectEn
 from random import randint, choice
+import numpy as np
 
+# relative error allowed between the timing model and
+# the simulated cycle count
+TOLERANCE = 0.05
 
 class Sim(Elaboratable):
     def __init__(self):
@@ -38,20 +43,22 @@ class Sim(Elaboratable):
 
         test_state_vec_1 = [choice(valid_adder_states) for node in range(controller.num_adders)]
         test_state_vec_1 += [choice(valid_mult_states) for node in range(controller.num_mults)]
-        ops += [opcodes.ConfigureStates(test_state_vec_1)]
+        ops += [opcodes.ConfigureStates(controller.isa, test_state_vec_1)]
 
         test_weight_vec_1 = [randint(-128, 127) for node in range(controller.num_mults)]
-        ops += [opcodes.ConfigureWeights(test_weight_vec_1)]
+        ops += [opcodes.ConfigureWeights(controller.isa, test_weight_vec_1)]
         ops += [opcodes.Debug()]
 
-        # assemble ops
-        init = assemble(ops)
-        init = init[:-3] + [0xFACEB00C, 0xDEADBEEF, 0xFEEDFACE]
-        print(f"len(init) = {len(init)}")
-
         # attach and initialize mem
         width = 32
         depth = 256
+
+        # assemble ops, the debug store reads the last lines
+        init = assemble(ops, controller.isa).tolist()
+        init = init + [0]*(depth - len(init))
+        init = init[:-3] + [0xFACEB00C, 0xDEADBEEF, 0xFEEDFACE]
+        print(f"len(init) = {len(init)}")
+        self.image = np.array(init, dtype='<u4').view(np.uint8)
         self.mem = Mem(width=width, depth=depth, init=init)
 
         # for testing later in sim
@@ -86,9 +93,18 @@ if __name__ == "__main__":
             yield dut.start.eq(0)
             yield Tick()
 
-            for tick in range(120):
+            # count the cycles until the program resets the FSM
+            cycles = 0
+            while (yield dut.controller.status) != State.reset:
+                assert(cycles < 1000)
+                cycles += 1
                 yield Tick()
 
+            # the timing model predicts the simulated cycles
+            timing = TimingModel(dut.controller.isa).predict(dut.image)
+            print(f"simulated cycles = {cycles}, predicted cycles = {timing.total}")
+            assert(abs(cycles - timing.total) <= TOLERANCE*cycles)
+
             # list of states
             all_nodes = dut.controller.rn.adders + dut.controller.rn.mults
             mult_nodes = dut.controller.rn.mults
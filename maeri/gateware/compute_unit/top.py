@@ -66,14 +66,13 @@ class Top(Elaboratable):
         # address length should be a multiple of 8
         q, r = divmod(addr_shape,8)
         assert(r == 0)
-        # we need this so that the increment_pc() function
-        # call of each opcode functions properly
-        opcodes.InitISA(_bytes_in_address=q,
-                        _num_nodes=self.num_nodes,
-                        _num_ports=self.num_ports,
-                        _num_adders=self.num_adders,
-                        _num_mults=self.num_mults,
-                        _input_width=INPUT_WIDTH
+        # instruction lengths follow from the ISA of this tree
+        self.isa = opcodes.ISA(bytes_in_address=q,
+                        num_nodes=self.num_nodes,
+                        num_ports=self.num_ports,
+                        num_adders=self.num_adders,
+                        num_mults=self.num_mults,
+                        input_width=INPUT_WIDTH
                         )
 
         # memory connections
@@ -133,15 +132,15 @@ class Top(Elaboratable):
                             m.d.sync += pc.eq(0)
                             m.next = 'RESET'
                         with m.Case(opcodes.ConfigureStates.op):
-                            m.d.sync += num_params.eq(opcodes.ConfigureStates.num_params())
+                            m.d.sync += num_params.eq(opcodes.ConfigureStates.num_params(self.isa))
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.ConfigureWeights.op):
-                            m.d.sync += num_params.eq(opcodes.ConfigureWeights.num_params())
+                            m.d.sync += num_params.eq(opcodes.ConfigureWeights.num_params(self.isa))
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.ConfigureCollectors.op):
-                            m.d.sync += num_params.eq(opcodes.ConfigureCollectors.num_params())
+                            m.d.sync += num_params.eq(opcodes.ConfigureCollectors.num_params(self.isa))
                             m.d.sync += pc.eq(pc + 1)
                             m.next = 'FETCH_PARAMS'
                         with m.Case(opcodes.LoadFeatures.op):
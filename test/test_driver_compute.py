@@ -21,14 +21,14 @@ ops = []
 
 test_state_vec_1 = [choice(valid_adder_states) for node in range(driver.no_mults - 1)]
 test_state_vec_1 += [choice(valid_mult_states) for node in range(driver.no_mults)]
-ops += [opcodes.ConfigureStates(test_state_vec_1)]
+ops += [opcodes.ConfigureStates(driver.isa, test_state_vec_1)]
 
 test_weight_vec_1 = [randint(-128, 127) for node in range(driver.no_mults)]
-ops += [opcodes.ConfigureWeights(test_weight_vec_1)]
+ops += [opcodes.ConfigureWeights(driver.isa, test_weight_vec_1)]
 ops += [opcodes.Debug()]
 
 # assemble ops
-binary = assemble(ops, as_bytes=True)
+binary = assemble(ops, driver.isa, as_bytes=True)
 
 driver.write(0, binary)
 driver.start_compute()